@@ -0,0 +1,119 @@
+"""
+Semantic cache of chat answers.
+Answers are keyed on the normalized question, the context mode and the corpus version,
+so any change to the specs invalidates them. Near-duplicate wordings of a cached question
+are matched through a local TF-IDF index over the cached questions, and reuse an answer
+only if they ask about exactly the same content words.
+"""
+import os
+import re
+import threading
+from typing import Optional
+from app.services.history_store import HistoryStore, get_history_store
+from app.services.retrieval import VectorIndex, tokenize
+
+CHAT_CACHE_ENABLED = os.environ.get("CHAT_CACHE_ENABLED", "1") != "0"
+# Cosine score a rephrased question needs to reuse a cached answer
+CHAT_CACHE_SIMILARITY = float(os.environ.get("CHAT_CACHE_SIMILARITY", "0.9"))
+# Questions with fewer content words than this ("why?", "and the rewards?") are never cached
+CHAT_CACHE_MIN_TOKENS = 3
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+# Words that point back into the conversation; the answer depends on history, not just the specs
+_REFERENTIAL_WORDS = {
+    'it', 'its', 'that', 'this', 'those', 'these', 'they', 'them', 'above', 'previous',
+    'earlier', 'again', 'same', 'elaborate', 'more', 'else', 'instead'
+}
+# Words that only phrase the request; any other word a near-duplicate adds, drops or swaps changes the question
+_PHRASING_WORDS = {
+    'list', 'show', 'give', 'tell', 'get', 'find', 'please', 'all', 'every', 'each', 'any',
+    'explain', 'describe', 'summarize', 'summarise', 'about', 'our', 'spec', 'specs'
+}
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase words only, so casing, punctuation and spacing do not change the key."""
+    return " ".join(_WORD_RE.findall(question.lower()))
+
+
+def is_cacheable_question(question: str) -> bool:
+    """Self-contained questions only: enough content words and no references to earlier turns."""
+    words = set(_WORD_RE.findall(question.lower()))
+    if words & _REFERENTIAL_WORDS:
+        return False
+    return len(tokenize(question)) >= CHAT_CACHE_MIN_TOKENS
+
+
+def content_tokens(question: str) -> frozenset:
+    """Content words of a question without request phrasing, plurals folded ("conditions" -> "condition")."""
+    return frozenset(
+        t[:-1] if len(t) > 3 and t.endswith('s') and not t.endswith('ss') else t
+        for t in tokenize(question) if t not in _PHRASING_WORDS
+    )
+
+
+class AnswerCache:
+    def __init__(self, store: Optional[HistoryStore] = None, similarity: float = CHAT_CACHE_SIMILARITY):
+        self.store = store or get_history_store()
+        self.similarity = similarity
+        self.version: Optional[str] = None
+        self._index = VectorIndex()
+        self._lock = threading.Lock()
+
+    def set_version(self, version: str):
+        """Switch to a corpus version: drop answers for other versions and index the remaining questions."""
+        with self._lock:
+            if version == self.version:
+                return
+            try:
+                dropped = self.store.prune_answer_cache(version)
+                if dropped:
+                    print(f"[CHAT] Specs changed, dropped {dropped} cached answers")
+                index = VectorIndex()
+                for row in self.store.list_cached_questions(version):
+                    index.add(row['question'], row)
+            except Exception as e:
+                print(f"[CHAT] Could not load answer cache: {e}")
+                index = VectorIndex()
+            self.version = version
+            self._index = index
+
+    def get(self, question: str, mode: str) -> Optional[str]:
+        """Cached answer for this question (or a near-duplicate of it), or None."""
+        if not CHAT_CACHE_ENABLED or self.version is None or not is_cacheable_question(question):
+            return None
+        version = self.version
+        normalized = normalize_question(question)
+        try:
+            answer = self.store.get_cached_answer(version, mode, normalized)
+            if answer is not None:
+                return answer
+            with self._lock:
+                matches = self._index.search(question, k=5, min_score=self.similarity)
+            wanted = content_tokens(question)
+            for score, row in matches:
+                # A high score alone lets "... except Clans" or a swapped feature name reuse the wrong answer
+                if row['mode'] == mode and content_tokens(row['question']) == wanted:
+                    answer = self.store.get_cached_answer(version, mode, row['norm_question'])
+                    if answer is not None:
+                        print(f"[CHAT] Answer cache near-duplicate hit (score {score:.2f})")
+                        return answer
+        except Exception as e:
+            print(f"[CHAT] Answer cache lookup failed: {e}")
+        return None
+
+    def put(self, question: str, mode: str, answer: str):
+        """Cache a complete answer for the current corpus version."""
+        if not CHAT_CACHE_ENABLED or self.version is None or not is_cacheable_question(question):
+            return
+        version = self.version
+        normalized = normalize_question(question)
+        try:
+            is_new = self.store.get_cached_answer(version, mode, normalized) is None
+            self.store.put_cached_answer(version, mode, normalized, question, answer)
+            if is_new:
+                with self._lock:
+                    if self.version == version:
+                        self._index.add(question, {"mode": mode, "norm_question": normalized, "question": question})
+        except Exception as e:
+            print(f"[CHAT] Could not cache answer: {e}")
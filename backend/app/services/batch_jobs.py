@@ -0,0 +1,52 @@
+"""
+Background jobs for /api/generate-batch with the Message Batches backend.
+A Message Batch can take up to 24 hours to end, so the request returns a job id straight
+away and the polling runs in a daemon thread; clients poll the job like a corpus audit.
+"""
+import time
+import secrets
+import threading
+from typing import Callable, Dict, Optional
+
+BATCH_MAX_JOBS = 20
+# Each running job holds one thread for as long as its Message Batch is processing
+BATCH_MAX_RUNNING_JOBS = 2
+
+
+class BatchJobService:
+    def __init__(self, max_running: int = BATCH_MAX_RUNNING_JOBS):
+        self.max_running = max_running
+        self._jobs: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def start(self, run: Callable[..., Dict], total: int) -> Optional[Dict]:
+        """Run run(progress=...) in the background; None if max_running jobs are already running."""
+        with self._lock:
+            if sum(1 for job in self._jobs.values() if job["status"] == "running") >= self.max_running:
+                return None
+            job_id = secrets.token_urlsafe(8)
+            job = {"job_id": job_id, "status": "running", "stage": "preparing", "done": 0, "total": total,
+                   "started_at": time.time(), "finished_at": None, "result": None, "error": None}
+            self._jobs[job_id] = job
+            # Keep only the most recent jobs
+            for old_id in list(self._jobs)[:-BATCH_MAX_JOBS]:
+                if self._jobs[old_id]["status"] != "running":
+                    self._jobs.pop(old_id)
+        threading.Thread(target=self._run_job, args=(job, run), daemon=True).start()
+        return dict(job)
+
+    def status(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def _run_job(self, job: Dict, run: Callable[..., Dict]):
+        try:
+            job["result"] = run(progress=lambda **kw: job.update(kw))
+            job["status"] = "done"
+        except Exception as e:
+            print(f"[BATCH] Failed: {e}")
+            job["status"] = "failed"
+            job["error"] = str(e)
+        finally:
+            job["finished_at"] = time.time()
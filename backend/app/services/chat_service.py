@@ -1,66 +1,45 @@
 import os
-import json
+import re
+import asyncio
+import concurrent.futures
 import time
 import random
-import anthropic
 from app.config import get_anthropic_api_key
 from app.services.parser import DocumentParser
-from typing import List, Dict
+from app.services.retrieval import VectorIndex, build_chunk_index, chunk_document
+from app.services.answer_cache import AnswerCache
+from app.services.spec_fields import SpecFieldStore
+from app.services.chat_sessions import (
+    ChatSession, ChatSessionStore, DEFAULT_SESSION_ID, CHAT_VERBATIM_TURNS, CHAT_HISTORY_BUDGET_CHARS
+)
+from typing import Any, AsyncIterator, List, Dict, Optional, Tuple
 
 # Model with large context for chat over specs
 CHAT_MODEL = "claude-sonnet-4-20250514"
-
-
-class SpecChatService:
-    def __init__(self):
-        self.context = ""
-        self.conversation_history: List[Dict[str, str]] = []
-        self.history_file = "../data/qa_history/chat_history.json"
-
-    def load_context(self, gdds_dir: str, slides_dir: str):
-        """Loads and concatenates all spec content."""
-        print("Loading spec context for chat...")
-        docs = []
-        docs.extend(DocumentParser.load_documents_from_dir(gdds_dir))
-        docs.extend(DocumentParser.load_documents_from_dir(slides_dir))
-
-        context_parts = []
-        for doc in docs:
-            context_parts.append(f"--- DOCUMENT: {doc['filename']} ---\n{doc['content']}")
-
-        self.context = "\n\n".join(context_parts)
-        print(f"Loaded {len(docs)} documents into context.")
-        self._load_history()
-
-    def _load_history(self):
-        """Load conversation history from file."""
-        if os.path.exists(self.history_file):
-            try:
-                with open(self.history_file, 'r') as f:
-                    self.conversation_history = json.load(f)
-            except Exception:
-                self.conversation_history = []
-
-    def _save_history(self):
-        """Save conversation history to file."""
-        os.makedirs(os.path.dirname(self.history_file), exist_ok=True)
-        history_to_save = self.conversation_history[-20:]
-        with open(self.history_file, 'w') as f:
-            json.dump(history_to_save, f, indent=2)
-
-    def _build_messages(self, question: str) -> List[Dict[str, str]]:
-        """Build messages list: system context + conversation history + new question."""
-        conversation_context = ""
-        if self.conversation_history:
-            for entry in self.conversation_history[-10:]:
-                conversation_context += f"User: {entry['question']}\nAssistant: {entry['answer']}\n\n"
-
-        safe_context = self.context[:600000]
-        if len(self.context) > 600000:
-            print(f"WARNING: Context truncated from {len(self.context)} to 600,000 chars.")
-
-        system_and_context = f"""
-# ROLE & EXPERTISE
+# Cheap model that folds older turns into the running conversation summary
+SUMMARY_MODEL = "claude-3-5-haiku-20241022"
+# Cheap model that extracts per-document partial answers in map-reduce mode
+MAP_MODEL = "claude-3-5-haiku-20241022"
+
+# Context mode: "retrieval" answers from the top-k section chunks, "full" pastes the whole corpus,
+# "mapreduce" extracts a partial answer from every document and combines them
+CHAT_MODES = ("retrieval", "full", "mapreduce")
+CHAT_CONTEXT_MODE = os.environ.get("CHAT_CONTEXT_MODE", "retrieval")
+CHAT_TOP_K = int(os.environ.get("CHAT_TOP_K", "8"))
+# Exhaustive questions ("list all ... for all features") need every document unless disabled
+CHAT_FULL_CONTEXT_FALLBACK = os.environ.get("CHAT_FULL_CONTEXT_FALLBACK", "1") != "0"
+# Mode used for them: "mapreduce" covers any corpus size, "full" is capped at FULL_CONTEXT_MAX_CHARS
+CHAT_EXHAUSTIVE_MODE = os.environ.get("CHAT_EXHAUSTIVE_MODE", "mapreduce")
+FULL_CONTEXT_MAX_CHARS = 600000
+# Map step: parallel extraction calls, and document text per call (large specs are split by section)
+CHAT_MAP_CONCURRENCY = int(os.environ.get("CHAT_MAP_CONCURRENCY", "8"))
+MAP_PIECE_MAX_CHARS = 120000
+MAP_NOTE_MAX_CHARS = 8000
+# Prompt caching ignores shorter prefixes (Sonnet); estimated at about 4 characters per token
+CACHE_MIN_PREFIX_TOKENS = 1024
+CHARS_PER_TOKEN = 4
+
+CHAT_SYSTEM_PROMPT = """# ROLE & EXPERTISE
 You are an expert game design analyst and consultant specializing in mobile casual games, economy systems, and retention mechanics. You have deep knowledge of:
 - Player psychology and behavioral patterns
 - Game economy balancing and progression systems
@@ -90,7 +69,7 @@ You have access to game design documents, feature specifications, and product do
 
 ### 🔍 **EVIDENCE** (Grounding in specs)
 - Quote or reference specific sections from uploaded docs
-- Format: "[Source: {{Document Name}}, Section: {{Section}}]"
+- Format: "[Source: {Document Name}, Section: {Section}]"
 - If information spans multiple docs, cite all relevant sources
 
 ### 💡 **DESIGN ANALYSIS** (OPTIONAL - ONLY IF PROMPTED)
@@ -137,20 +116,348 @@ When evaluating ideas:
 - If a question is vague, ask clarifying questions BEFORE answering
 - If information is missing from specs, explicitly state: "Not found in current documentation. Based on industry standards..."
 - If multiple interpretations exist, present options with pros/cons
+"""
 
-# CONTEXT (Loaded Documents):
-{safe_context}
+_EXHAUSTIVE_RE = re.compile(
+    r"\b(all|every|each)\s+(of\s+)?(the\s+)?(features?|specs?|documents?|docs|pop-?ups?|screens?|events?|modes?)\b"
+    r"|\bacross\s+(all\s+)?(the\s+)?(features|specs|documents|docs)\b"
+    r"|\b(complete|exhaustive|full)\s+list\b",
+    re.IGNORECASE
+)
 
-# CONVERSATION HISTORY:
-{conversation_context or "No previous conversation."}
-"""
 
-        # Single user message containing system context + question (Claude accepts long user content)
-        user_content = f"{system_and_context}\n\n# USER QUESTION:\n{question}"
-        return [{"role": "user", "content": user_content}]
+def is_exhaustive_question(question: str) -> bool:
+    """True for questions that need every document rather than the most relevant sections."""
+    return bool(_EXHAUSTIVE_RE.search(question))
+
 
-    def ask_question(self, question: str) -> str:
-        """Answers a question based on the loaded context with conversation memory."""
+class SpecChatService:
+    def __init__(self):
+        self.context = ""
+        self.documents: List[Dict] = []
+        self.index = VectorIndex()
+        self._system_retrieval: List[Dict] = []
+        self._system_full: List[Dict] = []
+        self._system_source = None
+        self.sessions = ChatSessionStore()
+        self.answer_cache = AnswerCache(self.sessions.store)
+        self.spec_fields = SpecFieldStore()
+        # Background history compaction, so summarizing never delays an answer
+        self._compaction_pool = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+
+    def load_context(self, gdds_dir: str, slides_dir: str):
+        """Loads and concatenates all spec content."""
+        print("Loading spec context for chat...")
+        docs = []
+        docs.extend(DocumentParser.load_documents_from_dir(gdds_dir))
+        docs.extend(DocumentParser.load_documents_from_dir(slides_dir))
+
+        context_parts = []
+        for doc in docs:
+            context_parts.append(f"--- DOCUMENT: {doc['filename']} ---\n{doc['content']}")
+
+        self.context = "\n\n".join(context_parts)
+        self.documents = docs
+        self.index = build_chunk_index(docs)
+        self.answer_cache.set_version(DocumentParser.corpus_fingerprint(docs))
+        self.spec_fields.build(docs)
+        print(f"Loaded {len(docs)} documents into context ({len(self.index)} section chunks indexed).")
+
+    def _resolve_mode(self, question: str, mode: Optional[str] = None) -> str:
+        """Pick "retrieval", "full" or "mapreduce" for this question."""
+        if mode in CHAT_MODES:
+            return mode
+        if CHAT_FULL_CONTEXT_FALLBACK and is_exhaustive_question(question):
+            return CHAT_EXHAUSTIVE_MODE if CHAT_EXHAUSTIVE_MODE in CHAT_MODES else "mapreduce"
+        return CHAT_CONTEXT_MODE if CHAT_CONTEXT_MODE in CHAT_MODES else "retrieval"
+
+    def _retrieve_context(self, question: str, history: List[Dict[str, str]], k: int = CHAT_TOP_K) -> str:
+        """Top-k section chunks for the question, each labelled with its source and section."""
+        # Include the previous question so short follow-ups still retrieve the right spec
+        query = question
+        if history:
+            query = f"{history[-1]['question']}\n{question}"
+
+        parts = []
+        for score, chunk in self.index.search(query, k=k):
+            parts.append(f"--- [Source: {chunk['source']}, Section: {chunk['section']}] ---\n{chunk['text']}")
+        return "\n\n".join(parts)
+
+    def _document_pieces(self) -> List[Dict[str, str]]:
+        """Each document as one or more map inputs, split on section boundaries."""
+        pieces = []
+        for doc in self.documents:
+            current = ""
+            for chunk in chunk_document(doc['filename'], doc['content']):
+                block = f"--- [Section: {chunk['section']}] ---\n{chunk['text']}"
+                if current and len(current) + len(block) > MAP_PIECE_MAX_CHARS:
+                    pieces.append({"source": doc['filename'], "text": current})
+                    current = ""
+                current = f"{current}\n\n{block}" if current else block
+            if current:
+                pieces.append({"source": doc['filename'], "text": current})
+        return pieces
+
+    def _map_piece(self, client, question: str, piece: Dict[str, str]) -> str:
+        """Extract what one document says about the question ("" if nothing)."""
+        prompt = f"""You are extracting facts from ONE game design document to help answer a question that spans many documents.
+
+QUESTION: {question}
+
+DOCUMENT: {piece['source']}
+{piece['text']}
+
+Instructions:
+- List every fact in this document that is relevant to the question, as concise bullet points.
+- Keep exact values (numbers, levels, names, event names, conditions).
+- End each bullet with its citation: [Source: {piece['source']}, Section: <section title>].
+- Do not use outside knowledge. If the document has nothing relevant, reply exactly: NONE"""
+        max_retries = 3
+        for attempt in range(max_retries):
+            try:
+                response = client.messages.create(
+                    model=MAP_MODEL,
+                    max_tokens=2048,
+                    messages=[{"role": "user", "content": prompt}],
+                )
+                text = response.content[0].text.strip()
+                return "" if text.upper().startswith("NONE") else text[:MAP_NOTE_MAX_CHARS]
+            except Exception as e:
+                error_str = str(e)
+                if attempt < max_retries - 1 and ("rate_limit" in error_str.lower() or "429" in error_str):
+                    time.sleep(2 * (2 ** attempt) + random.uniform(0, 1))
+                else:
+                    raise
+
+    def _map_documents(self, question: str, api_key: str) -> str:
+        """
+        Map step: extract partial answers from every document in parallel with the cheap model.
+        Returns the per-document notes that the reduce step combines into one answer.
+        """
+        pieces = self._document_pieces()
+        import anthropic
+        client = anthropic.Anthropic(api_key=api_key)
+        start = time.time()
+        notes: List[Optional[str]] = [None] * len(pieces)
+        failed = []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, CHAT_MAP_CONCURRENCY)) as pool:
+            futures = {pool.submit(self._map_piece, client, question, piece): i for i, piece in enumerate(pieces)}
+            for future in concurrent.futures.as_completed(futures):
+                i = futures[future]
+                try:
+                    notes[i] = future.result()
+                except Exception as e:
+                    print(f"[CHAT] Map step failed for {pieces[i]['source']}: {e}")
+                    failed.append(pieces[i]['source'])
+
+        parts = [f"--- {pieces[i]['source']} ---\n{note}" for i, note in enumerate(notes) if note]
+        print(f"[CHAT] Map step: {len(parts)}/{len(pieces)} document parts relevant "
+              f"({time.time() - start:.1f}s, {len(failed)} failed)")
+        if not parts:
+            parts.append("(No document contains information relevant to this question.)")
+        if failed:
+            parts.append("NOTE: These documents could not be read and are missing from the notes: "
+                         + ", ".join(sorted(set(failed))))
+        return "\n\n".join(parts)
+
+    def _build_system_blocks(self):
+        """Pre-build the stable, cacheable system prefix once per context load."""
+        self._system_source = self.context
+        corpus = self.context[:FULL_CONTEXT_MAX_CHARS]
+        if len(self.context) > FULL_CONTEXT_MAX_CHARS:
+            print(f"WARNING: Context truncated from {len(self.context)} to {FULL_CONTEXT_MAX_CHARS:,} chars.")
+        # Retrieval mode: the instructions and the spec catalog are stable; retrieved sections travel
+        # with the question. The instructions alone are below the caching minimum, so the breakpoint
+        # goes after the catalog, and only when the two together are long enough to be cached
+        catalog = f"# SPEC CATALOG (documents and their sections)\n{self._spec_catalog()}"
+        self._system_retrieval = [
+            {"type": "text", "text": CHAT_SYSTEM_PROMPT},
+            {"type": "text", "text": catalog},
+        ]
+        if (len(CHAT_SYSTEM_PROMPT) + len(catalog)) / CHARS_PER_TOKEN >= CACHE_MIN_PREFIX_TOKENS:
+            self._system_retrieval[-1]["cache_control"] = {"type": "ephemeral"}
+        # Full mode: instructions + whole corpus form one cached prefix reused by every follow-up
+        self._system_full = [
+            {"type": "text", "text": CHAT_SYSTEM_PROMPT},
+            {"type": "text", "text": f"# CONTEXT (Loaded Documents):\n{corpus}", "cache_control": {"type": "ephemeral"}},
+        ]
+
+    def _spec_catalog(self) -> str:
+        """One line per loaded document listing its section titles, so the model knows what exists."""
+        lines = []
+        for doc in self.documents:
+            sections = dict.fromkeys(chunk['section'] for chunk in chunk_document(doc['filename'], doc['content']))
+            lines.append(f"- {doc['filename']}: {'; '.join(sections)}")
+        return "\n".join(lines)
+
+    @staticmethod
+    def _history_within_budget(history: List[Dict]) -> List[Dict]:
+        """Newest turns that fit the history budget (at least the last one, trimmed if needed)."""
+        kept: List[Dict] = []
+        used = 0
+        for entry in reversed(history):
+            size = len(entry['question']) + len(entry['answer'])
+            if kept and used + size > CHAT_HISTORY_BUDGET_CHARS:
+                break
+            if not kept and size > CHAT_HISTORY_BUDGET_CHARS:
+                entry = {**entry, "answer": entry['answer'][:CHAT_HISTORY_BUDGET_CHARS] + "\n...(truncated)"}
+            kept.append(entry)
+            used += size
+        return list(reversed(kept))
+
+    def _build_messages(self, question: str, mode: str = "retrieval",
+                        history: Optional[List[Dict[str, str]]] = None,
+                        summary: str = "", notes: str = "") -> Tuple[List[Dict], List[Dict]]:
+        """
+        Build (system, messages): cached system prefix, running summary of older turns,
+        recent turns as alternating user/assistant messages, then the new question.
+        In mapreduce mode `notes` holds the per-document extracts from the map step.
+        """
+        if self._system_source is not self.context:
+            self._build_system_blocks()
+
+        messages: List[Dict] = []
+        history = history or []
+        for entry in self._history_within_budget(history):
+            messages.append({"role": "user", "content": entry['question']})
+            messages.append({"role": "assistant", "content": entry['answer']})
+        if messages:
+            # Cache breakpoint at the end of history: the next turn reads this whole prefix from cache
+            last = messages[-1]
+            last["content"] = [{"type": "text", "text": last["content"], "cache_control": {"type": "ephemeral"}}]
+
+        system = self._system_full
+        user_content = question
+        if mode == "retrieval":
+            retrieved = self._retrieve_context(question, history)
+            if retrieved:
+                system = self._system_retrieval
+                user_content = (
+                    "# RETRIEVED SECTIONS\n"
+                    "The following sections were retrieved as the most relevant to the question. "
+                    "Cite them using the [Source: ..., Section: ...] labels.\n\n"
+                    f"{retrieved}\n\n# USER QUESTION:\n{question}"
+                )
+            # Nothing relevant retrieved: fall back to the cached full-context prefix
+        elif mode == "mapreduce":
+            system = self._system_retrieval
+            user_content = (
+                "# NOTES EXTRACTED FROM EVERY DOCUMENT\n"
+                "Each document was read separately and the facts relevant to the question were extracted. "
+                "Combine them into one complete answer: cover every document that has relevant facts, "
+                "merge duplicates, and keep the [Source: ..., Section: ...] citations.\n\n"
+                f"{notes}\n\n# USER QUESTION:\n{question}"
+            )
+
+        if summary:
+            # After the cached block, so the instructions/corpus prefix stays reusable
+            system = system + [{"type": "text", "text": f"# EARLIER CONVERSATION (summary)\n{summary}"}]
+
+        messages.append({"role": "user", "content": user_content})
+        return system, messages
+
+    def _schedule_compaction(self, session: ChatSession):
+        """Fold older turns into the session summary in the background, one job per session."""
+        with session.lock:
+            if session.compacting or not session.needs_compaction():
+                return
+            session.compacting = True
+        self._compaction_pool.submit(self._compact_session, session)
+
+    def _compact_session(self, session: ChatSession):
+        try:
+            summary, history = session.snapshot()
+            # Keep the verbatim window, then fold more until what remains fits the budget
+            keep = min(CHAT_VERBATIM_TURNS, len(history) - 1)
+            while keep > 1 and sum(len(e['question']) + len(e['answer']) for e in history[-keep:]) > CHAT_HISTORY_BUDGET_CHARS:
+                keep -= 1
+            to_fold = history[:len(history) - keep]
+            if not to_fold or 'id' not in to_fold[-1]:
+                return
+
+            api_key = get_anthropic_api_key()
+            if not api_key:
+                return
+            turns_text = "\n\n".join(
+                f"User: {e['question']}\nAssistant: {e['answer'][:3000]}" for e in to_fold
+            )
+            prompt = f"""Update the running summary of a conversation about game design specs.
+Keep: questions asked, key facts and numbers from the answers, specs/features referenced, decisions and open questions.
+Drop: formatting, tables, repeated boilerplate. Maximum 250 words, plain bullet points.
+
+CURRENT SUMMARY:
+{summary or "(none)"}
+
+NEW TURNS TO FOLD IN:
+{turns_text}
+
+Return only the updated summary."""
+            import anthropic
+            client = anthropic.Anthropic(api_key=api_key)
+            response = client.messages.create(
+                model=SUMMARY_MODEL,
+                max_tokens=600,
+                messages=[{"role": "user", "content": prompt}],
+            )
+            self.sessions.fold_summary(session, response.content[0].text.strip(), to_fold[-1]['id'])
+            print(f"[CHAT] Compacted {len(to_fold)} turns into summary (session {session.session_id})")
+        except Exception as e:
+            # Summary stays as is; the history budget still bounds the prompt
+            print(f"[CHAT] History compaction failed: {e}")
+        finally:
+            with session.lock:
+                session.compacting = False
+
+    def _record_local_answer(self, question: str, answer: str, session_id: str, source: str):
+        session = self.sessions.get(session_id)
+        print(f"[CHAT] Answered from {source} (session {session.session_id})")
+        self.sessions.append(session, {"question": question, "answer": answer})
+        self._schedule_compaction(session)
+
+    def structured_answer(self, question: str, mode: Optional[str] = None,
+                          session_id: str = DEFAULT_SESSION_ID) -> Optional[str]:
+        """
+        Answer plain field lookups ("what are the CTAs in X?") straight from the extracted
+        spec tables, without an LLM call. Only used when no context mode is forced.
+        """
+        if not self.context or mode is not None:
+            return None
+        answer = self.spec_fields.answer(question)
+        if answer is not None:
+            self._record_local_answer(question, answer, session_id, "spec field tables")
+        return answer
+
+    def cached_answer(self, question: str, mode: Optional[str] = None,
+                      session_id: str = DEFAULT_SESSION_ID) -> Optional[str]:
+        """
+        Answer from the cache if this question (or a near-duplicate) was already answered
+        against the current specs; the turn is recorded in the session like any other.
+        """
+        if not self.context:
+            return None
+        answer = self.answer_cache.get(question, self._resolve_mode(question, mode))
+        if answer is not None:
+            self._record_local_answer(question, answer, session_id, "cache")
+        return answer
+
+    def answer_question(self, question: str, mode: Optional[str] = None,
+                        session_id: str = DEFAULT_SESSION_ID) -> Dict[str, Any]:
+        """Like ask_question, but returns {"answer": ..., "cached": bool, "structured": bool}."""
+        answer = self.structured_answer(question, mode, session_id)
+        if answer is not None:
+            return {"answer": answer, "cached": False, "structured": True}
+        answer = self.cached_answer(question, mode, session_id)
+        if answer is not None:
+            return {"answer": answer, "cached": True, "structured": False}
+        return {"answer": self.ask_question(question, mode, session_id, use_cache=False),
+                "cached": False, "structured": False}
+
+    def ask_question(self, question: str, mode: Optional[str] = None,
+                     session_id: str = DEFAULT_SESSION_ID, use_cache: bool = True) -> str:
+        """
+        Answers a question based on the loaded context with the session's conversation memory.
+        mode: "retrieval", "full", "mapreduce", or None to choose automatically.
+        """
         api_key = get_anthropic_api_key()
         if not api_key:
             return "Error: API key is not set. Enter your Anthropic API key in the box at the top and click Save key."
@@ -158,25 +465,44 @@ When evaluating ideas:
         if not self.context:
             return "Error: No specs loaded. Please check files first."
 
-        messages = self._build_messages(question)
+        if use_cache:
+            answer = self.structured_answer(question, mode, session_id) or self.cached_answer(question, mode, session_id)
+            if answer is not None:
+                return answer
+
+        session = self.sessions.get(session_id)
+        mode = self._resolve_mode(question, mode)
+        print(f"[CHAT] Answering in {mode} mode (session {session.session_id})")
+        summary, history = session.snapshot()
+        notes = ""
+        if mode == "mapreduce":
+            notes = self._map_documents(question, api_key)
+        system, messages = self._build_messages(question, mode, history, summary, notes)
         max_retries = 3
         base_delay = 5
 
+        import anthropic
         client = anthropic.Anthropic(api_key=api_key)
         for attempt in range(max_retries):
             try:
                 response = client.messages.create(
                     model=CHAT_MODEL,
                     max_tokens=4096,
+                    system=system,
                     messages=messages,
                 )
                 answer = response.content[0].text
+                usage = response.usage
+                print(f"[CHAT] Input tokens: {usage.input_tokens} new, "
+                      f"{getattr(usage, 'cache_read_input_tokens', 0) or 0} cached, "
+                      f"{getattr(usage, 'cache_creation_input_tokens', 0) or 0} written to cache")
 
-                self.conversation_history.append({
+                self.sessions.append(session, {
                     "question": question,
                     "answer": answer
                 })
-                self._save_history()
+                self._schedule_compaction(session)
+                self.answer_cache.put(question, mode, answer)
 
                 return answer
             except Exception as e:
@@ -190,8 +516,85 @@ When evaluating ideas:
 
         return "Error: Rate limit exceeded after multiple retries. Please wait a minute and try again."
 
-    def clear_history(self):
-        """Clear conversation history."""
-        self.conversation_history = []
-        if os.path.exists(self.history_file):
-            os.remove(self.history_file)
+    async def stream_answer(self, question: str, mode: Optional[str] = None,
+                            session_id: str = DEFAULT_SESSION_ID) -> AsyncIterator[str]:
+        """
+        Stream the answer text as it arrives.
+        If the consumer stops iterating (client disconnect / stop button), leaving the
+        stream context closes the upstream connection so no further tokens are generated.
+        Whatever was produced, even partially, is saved to the conversation history.
+        """
+        api_key = get_anthropic_api_key()
+        if not api_key:
+            yield "Error: API key is not set. Enter your Anthropic API key in the box at the top and click Save key."
+            return
+
+        if not self.context:
+            yield "Error: No specs loaded. Please check files first."
+            return
+
+        # Session load (SQLite) and context assembly (TF-IDF retrieval) run off the event loop
+        session = await asyncio.to_thread(self.sessions.get, session_id)
+        mode = self._resolve_mode(question, mode)
+        print(f"[CHAT] Streaming answer in {mode} mode (session {session.session_id})")
+        summary, history = session.snapshot()
+        notes = ""
+        if mode == "mapreduce":
+            notes = await asyncio.to_thread(self._map_documents, question, api_key)
+        system, messages = await asyncio.to_thread(self._build_messages, question, mode, history, summary, notes)
+        max_retries = 3
+        base_delay = 5
+
+        import anthropic
+        client = anthropic.AsyncAnthropic(api_key=api_key)
+        parts: List[str] = []
+        completed = False
+        try:
+            for attempt in range(max_retries):
+                try:
+                    async with client.messages.stream(
+                        model=CHAT_MODEL,
+                        max_tokens=4096,
+                        system=system,
+                        messages=messages,
+                    ) as stream:
+                        async for text in stream.text_stream:
+                            parts.append(text)
+                            yield text
+                    completed = True
+                    return
+                except Exception as e:
+                    error_str = str(e)
+                    # Retry only if nothing has been sent yet; otherwise the client already has partial text
+                    if not parts and ("rate_limit" in error_str.lower() or "429" in error_str):
+                        delay = base_delay * (2 ** attempt) + random.uniform(0, 1)
+                        print(f"Rate limit hit. Retrying in {delay:.2f}s... (Attempt {attempt + 1}/{max_retries})")
+                        await asyncio.sleep(delay)
+                    else:
+                        yield f"Error answering question: {error_str}"
+                        return
+
+            yield "Error: Rate limit exceeded after multiple retries. Please wait a minute and try again."
+        finally:
+            # Runs on normal completion, errors and cancellation; keep it free of awaits.
+            # The history and cache writes are handed to a worker thread without waiting for them
+            if parts:
+                entry = {"question": question, "answer": "".join(parts)}
+                if not completed:
+                    entry["stopped"] = True
+                    print(f"[CHAT] Stream stopped by client after {len(entry['answer'])} chars")
+                asyncio.get_running_loop().run_in_executor(None, self._save_streamed_answer, session, mode, entry)
+
+    def _save_streamed_answer(self, session: ChatSession, mode: str, entry: Dict):
+        """Record a streamed turn; complete answers are also cached."""
+        try:
+            if not entry.get("stopped"):
+                self.answer_cache.put(entry["question"], mode, entry["answer"])
+            self.sessions.append(session, entry)
+            self._schedule_compaction(session)
+        except Exception as e:
+            print(f"[CHAT] Could not save streamed answer: {e}")
+
+    def clear_history(self, session_id: str = DEFAULT_SESSION_ID):
+        """Clear the session's conversation history."""
+        self.sessions.clear(session_id)
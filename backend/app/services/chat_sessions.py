@@ -0,0 +1,190 @@
+"""
+Per-session chat state.
+Sessions live in an in-memory LRU capped by session count and total history size,
+each with its own lock, and are loaded lazily from the history store on first use.
+"""
+import os
+import re
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from app.services.history_store import HistoryStore, get_history_store
+
+DEFAULT_SESSION_ID = "default"
+CHAT_MAX_SESSIONS = int(os.environ.get("CHAT_MAX_SESSIONS", "500"))
+CHAT_SESSIONS_MAX_CHARS = int(os.environ.get("CHAT_SESSIONS_MAX_CHARS", "20000000"))
+# Turns kept in memory per session (the store keeps everything)
+CHAT_SESSION_MAX_TURNS = 20
+# History budget per prompt: newest turns verbatim, older ones folded into a running summary
+CHAT_VERBATIM_TURNS = int(os.environ.get("CHAT_VERBATIM_TURNS", "4"))
+CHAT_HISTORY_BUDGET_CHARS = int(os.environ.get("CHAT_HISTORY_BUDGET_CHARS", "16000"))
+# Cap on the summary text kept when turns are trimmed before compaction could fold them
+CHAT_TRIMMED_SUMMARY_MAX_CHARS = 4000
+
+_SESSION_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def normalize_session_id(session_id: Optional[str]) -> str:
+    """Return a safe session id; anything unusable maps to the default session."""
+    if session_id and _SESSION_ID_RE.match(session_id):
+        return session_id
+    return DEFAULT_SESSION_ID
+
+
+class ChatSession:
+    """
+    Conversation state for one user; mutate only while holding `lock`.
+    `summary` covers every stored turn up to `covered_id`; `history` holds the newer turns verbatim.
+    Call `resized()` after changing either, so `size_chars` stays current.
+    """
+
+    def __init__(self, session_id: str, history: List[Dict], summary: str = "", covered_id: int = 0):
+        self.session_id = session_id
+        self.history = history
+        self.summary = summary
+        self.covered_id = covered_id
+        self.compacting = False
+        self.lock = threading.Lock()
+        self.size_chars = 0
+        # Part of ChatSessionStore's running total for this session (guarded by the store's lock)
+        self.counted_chars = 0
+        self.resized()
+
+    def resized(self):
+        """Recompute size_chars (caller holds `lock`, or owns the session exclusively)."""
+        self.size_chars = len(self.summary) + sum(len(e.get('question', '')) + len(e.get('answer', '')) for e in self.history)
+
+    def snapshot(self) -> Tuple[str, List[Dict]]:
+        """(summary, copy of verbatim history), safe to read without holding the lock."""
+        with self.lock:
+            return self.summary, list(self.history)
+
+    def needs_compaction(self) -> bool:
+        """
+        Fold once a full extra window of turns has built up (batched to keep summary calls rare),
+        or as soon as the verbatim history is over budget.
+        """
+        if len(self.history) <= 1:
+            return False
+        history_chars = sum(len(e['question']) + len(e['answer']) for e in self.history)
+        return len(self.history) >= 2 * CHAT_VERBATIM_TURNS or history_chars > CHAT_HISTORY_BUDGET_CHARS
+
+
+class ChatSessionStore:
+    def __init__(self, store: Optional[HistoryStore] = None,
+                 max_sessions: int = CHAT_MAX_SESSIONS, max_chars: int = CHAT_SESSIONS_MAX_CHARS):
+        self.store = store or get_history_store()
+        self.max_sessions = max_sessions
+        self.max_chars = max_chars
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        # Sum of counted_chars over _sessions, so eviction never walks other sessions' histories
+        self._total_chars = 0
+        # Evicted sessions still referenced by an in-flight request; reviving them keeps
+        # exactly one ChatSession (and one lock) per id, so in-memory history never forks
+        self._in_use: "weakref.WeakValueDictionary[str, ChatSession]" = weakref.WeakValueDictionary()
+        # Guards the LRU map only; never held while loading from the store or talking to the API
+        self._lock = threading.Lock()
+
+    def _load(self, session_id: str) -> ChatSession:
+        try:
+            summary, covered_id = self.store.get_chat_summary(session_id)
+            history = self.store.recent_chat_turns(session_id, CHAT_SESSION_MAX_TURNS, after_id=covered_id)
+            return ChatSession(session_id, history, summary, covered_id)
+        except Exception as e:
+            print(f"[CHAT] Could not load history for session {session_id}: {e}")
+            return ChatSession(session_id, [])
+
+    def get(self, session_id: Optional[str]) -> ChatSession:
+        """Return the session, loading it from the store on first access."""
+        session_id = normalize_session_id(session_id)
+        with self._lock:
+            session = self._sessions.get(session_id) or self._in_use.get(session_id)
+            if session is not None:
+                self._sessions[session_id] = session
+                self._sessions.move_to_end(session_id)
+                self._account(session)
+                self._evict()
+                return session
+
+        loaded = self._load(session_id)
+        with self._lock:
+            # Another worker may have loaded it meanwhile; keep the first one
+            session = self._sessions.get(session_id) or self._in_use.get(session_id) or loaded
+            self._sessions[session_id] = session
+            self._in_use[session_id] = session
+            self._sessions.move_to_end(session_id)
+            self._account(session)
+            self._evict()
+        return session
+
+    def append(self, session: ChatSession, entry: Dict[str, str]):
+        """Add a turn to the session and append it to the store."""
+        with session.lock:
+            entry = {**entry, "id": self.store.append_chat_turn(session.session_id, entry)}
+            session.history.append(entry)
+            overflow = session.history[:-CHAT_SESSION_MAX_TURNS]
+            if overflow:
+                # Compaction has fallen behind (no API key, failing calls): fold the oldest turns
+                # into the summary as plain notes rather than dropping them from the conversation
+                self._fold_trimmed(session, overflow)
+                del session.history[:-CHAT_SESSION_MAX_TURNS]
+            session.resized()
+        self._resize(session)
+
+    def _fold_trimmed(self, session: ChatSession, turns: List[Dict]):
+        """Append short notes on turns to the summary and mark them covered (caller holds session.lock)."""
+        notes = [f"- User asked: {' '.join(e['question'].split())[:200]} (answer began: {' '.join(e['answer'].split())[:300]})"
+                 for e in turns]
+        lines = (session.summary.split("\n") if session.summary else []) + notes
+        # Oldest lines go first once the summary is over its cap
+        while len(lines) > 1 and sum(len(line) + 1 for line in lines) > CHAT_TRIMMED_SUMMARY_MAX_CHARS:
+            lines.pop(0)
+        session.summary = "\n".join(lines)
+        session.covered_id = turns[-1].get('id', session.covered_id)
+        self.store.save_chat_summary(session.session_id, session.summary, session.covered_id)
+
+    def clear(self, session_id: Optional[str]):
+        session = self.get(session_id)
+        with session.lock:
+            session.history = []
+            session.summary = ""
+            session.covered_id = 0
+            session.resized()
+            self.store.clear_chat(session.session_id)
+        self._resize(session)
+
+    def fold_summary(self, session: ChatSession, summary: str, covered_id: int):
+        """Replace turns up to covered_id with the new running summary."""
+        with session.lock:
+            # Skip if the session was cleared or already folded further while summarizing
+            if covered_id <= session.covered_id or not any(e.get('id') == covered_id for e in session.history):
+                return
+            session.summary = summary
+            session.covered_id = covered_id
+            session.history = [e for e in session.history if e.get('id', covered_id + 1) > covered_id]
+            session.resized()
+            self.store.save_chat_summary(session.session_id, summary, covered_id)
+        self._resize(session)
+
+    def _resize(self, session: ChatSession):
+        """Bring the running total up to date after the session changed, then enforce the caps."""
+        with self._lock:
+            self._account(session)
+            self._evict()
+
+    def _account(self, session: ChatSession):
+        """Move the session's share of the running total to its current size (caller holds _lock)."""
+        if self._sessions.get(session.session_id) is session:
+            self._total_chars += session.size_chars - session.counted_chars
+            session.counted_chars = session.size_chars
+
+    def _evict(self):
+        """Drop least recently used sessions over the count or size cap (caller holds _lock)."""
+        while self._sessions and (len(self._sessions) > self.max_sessions or self._total_chars > self.max_chars):
+            if len(self._sessions) == 1:
+                break
+            # Every turn is already in the store, so eviction only frees memory
+            _, evicted = self._sessions.popitem(last=False)
+            self._total_chars -= evicted.counted_chars
+            evicted.counted_chars = 0
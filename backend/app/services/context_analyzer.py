@@ -1,6 +1,6 @@
 import os
 import json
-from typing import List, Dict, Set
+from typing import List, Dict, Optional, Set
 from app.services.parser import DocumentParser
 
 class ContextAnalyzer:
@@ -60,6 +60,14 @@ class ContextAnalyzer:
         print(f"[CONTEXT] Analysis complete: {len(analysis['features'])} features, {len(analysis['terminology'])} terms")
         return analysis
     
+    def cache_version(self) -> Optional[str]:
+        """Identifies the cached analysis on disk; changes whenever it is rewritten."""
+        try:
+            stat = os.stat(self.cache_file)
+        except OSError:
+            return None
+        return f"{stat.st_mtime_ns}-{stat.st_size}"
+    
     def _extract_features(self, docs: List[dict]) -> List[Dict]:
         """Extract all mentioned features and systems."""
         features = []
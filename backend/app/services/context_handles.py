@@ -0,0 +1,51 @@
+"""
+Short-lived handles for context prepared by /api/analyze.
+Analyze stores the analysis (with its version), conflicts and selected relevant context;
+generate passes the handle back and skips recomputing them.
+"""
+import os
+import time
+import secrets
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+CONTEXT_HANDLE_TTL = int(os.environ.get("CONTEXT_HANDLE_TTL", "900"))
+CONTEXT_HANDLE_MAX_ENTRIES = 256
+
+
+class ContextHandleCache:
+    def __init__(self, ttl: int = CONTEXT_HANDLE_TTL, max_entries: int = CONTEXT_HANDLE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _sweep(self, now: float):
+        """Drop expired bundles, then the oldest ones over the size cap (caller holds _lock)."""
+        while self._entries:
+            handle, bundle = next(iter(self._entries.items()))
+            if now - bundle["created_at"] < self.ttl and len(self._entries) <= self.max_entries:
+                break
+            self._entries.pop(handle)
+
+    def put(self, bundle: Dict) -> str:
+        """Store a bundle and return its handle."""
+        handle = secrets.token_urlsafe(12)
+        now = time.time()
+        with self._lock:
+            self._entries[handle] = {**bundle, "created_at": now}
+            self._sweep(now)
+        return handle
+
+    def get(self, handle: Optional[str]) -> Optional[Dict]:
+        """The bundle for a live handle, or None if unknown or expired."""
+        if not handle:
+            return None
+        now = time.time()
+        with self._lock:
+            self._sweep(now)
+            bundle = self._entries.get(handle)
+            if bundle is None or now - bundle["created_at"] >= self.ttl:
+                return None
+            return bundle
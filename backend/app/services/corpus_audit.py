@@ -0,0 +1,306 @@
+"""
+Bulk verification of the whole spec corpus against itself.
+Every spec is split into sections and a TF-IDF matrix over all sections is built with NumPy.
+One matrix product gives section-to-section similarity; sections that cover the same topic
+but quote different numbers add a conflict signal. Both are reduced to spec-by-spec
+matrices, and only the top-scoring pairs are sent to the verifier model for confirmation.
+Parsed specs and confirmed pairs are cached by content hash, so after one spec changes a
+new audit only re-parses that spec and re-confirms the pairs it is part of.
+"""
+import os
+import re
+import json
+import math
+import time
+import hashlib
+import secrets
+import threading
+from collections import Counter
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from app.services.parser import DocumentParser
+from app.services.retrieval import chunk_document, tokenize
+
+if TYPE_CHECKING:
+    import numpy as np
+
+AUDIT_TOP_PAIRS = int(os.environ.get("AUDIT_TOP_PAIRS", "15"))
+# Pairs scoring below this are never worth a model call
+AUDIT_MIN_PAIR_SCORE = 0.15
+# Terms in more than this share of sections carry no signal about which specs overlap
+AUDIT_MAX_DF = 0.5
+AUDIT_MAX_JOBS = 20
+# Section pairs below this similarity are different topics, whatever numbers they quote
+CONFLICT_MIN_SIMILARITY = 0.3
+
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\s*(?:%|x|s|sec|min|h|hrs?|days?|coins?|gems?)?\b", re.IGNORECASE)
+
+
+def _content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()[:16]
+
+
+def _numbers(text: str) -> set:
+    return {re.sub(r"\s+", "", match.lower()) for match in _NUMBER_RE.findall(text)}
+
+
+def _block_max(matrix: "np.ndarray", starts: "np.ndarray") -> "np.ndarray":
+    """Max over contiguous column blocks then row blocks: sections x sections -> specs x specs."""
+    import numpy as np
+    return np.maximum.reduceat(np.maximum.reduceat(matrix, starts, axis=1), starts, axis=0)
+
+
+def pair_matrices(spec_sections: List[List[str]]) -> Tuple["np.ndarray", "np.ndarray"]:
+    """
+    (similarity, conflict) spec-by-spec matrices in [0, 1] for sectioned specs.
+    similarity[a, b]: how much of a is covered by b and vice versa (mean best section match).
+    conflict[a, b]: best section pair on the same topic whose quoted numbers disagree.
+    """
+    import numpy as np
+
+    n_specs = len(spec_sections)
+    counts = np.array([len(sections) for sections in spec_sections])
+    if n_specs < 2 or (counts == 0).any():
+        raise ValueError("every spec needs at least one section")
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    sections = [text for group in spec_sections for text in group]
+    n_sections = len(sections)
+
+    # TF-IDF over terms shared by at least two sections (others cannot raise any pair's score)
+    term_counts = [Counter(tokenize(text)) for text in sections]
+    df = Counter(term for tf in term_counts for term in tf)
+    vocab = {term: i for i, term in enumerate(t for t, n in df.items() if 2 <= n <= AUDIT_MAX_DF * n_sections)}
+    tfidf = np.zeros((n_sections, max(len(vocab), 1)), dtype=np.float32)
+    for row, tf in enumerate(term_counts):
+        for term, count in tf.items():
+            col = vocab.get(term)
+            if col is not None:
+                tfidf[row, col] = (1 + math.log(count)) * (math.log((1 + n_sections) / (1 + df[term])) + 1.0)
+    norms = np.linalg.norm(tfidf, axis=1, keepdims=True)
+    tfidf /= np.where(norms == 0, 1.0, norms)
+    section_sim = tfidf @ tfidf.T
+
+    # Directional coverage: for each section of a, its best match in b, averaged over a's sections
+    best = np.maximum.reduceat(section_sim, starts, axis=1)
+    coverage = np.add.reduceat(best, starts, axis=0) / counts[:, None]
+    similarity = (coverage + coverage.T) / 2
+
+    # Numeric disagreement between section pairs: 1 - Jaccard of the numbers they quote
+    section_numbers = [_numbers(text) for text in sections]
+    number_df = Counter(n for numbers in section_numbers for n in numbers)
+    number_vocab = {n: i for i, n in enumerate(n for n, c in number_df.items() if c >= 2)}
+    shared_matrix = np.zeros((n_sections, max(len(number_vocab), 1)), dtype=np.float32)
+    for row, numbers in enumerate(section_numbers):
+        for number in numbers:
+            col = number_vocab.get(number)
+            if col is not None:
+                shared_matrix[row, col] = 1.0
+    sizes = np.array([len(numbers) for numbers in section_numbers], dtype=np.float32)
+    shared = shared_matrix @ shared_matrix.T
+    union = sizes[:, None] + sizes[None, :] - shared
+    both_quote = (sizes[:, None] > 0) & (sizes[None, :] > 0)
+    disagreement = np.where(both_quote & (union > 0), 1 - shared / np.where(union > 0, union, 1), 0.0)
+    section_conflict = np.where(section_sim >= CONFLICT_MIN_SIMILARITY, section_sim * disagreement, 0.0)
+    conflict = _block_max(section_conflict.astype(np.float32), starts)
+
+    np.fill_diagonal(similarity, 0.0)
+    np.fill_diagonal(conflict, 0.0)
+    return similarity, np.maximum(conflict, conflict.T)
+
+
+def rank_pairs(names: List[str], similarity: "np.ndarray", conflict: "np.ndarray",
+               top_k: int = AUDIT_TOP_PAIRS) -> List[Dict]:
+    """Upper-triangle pairs by combined score (conflict weighted over plain overlap), best first."""
+    import numpy as np
+    score = 0.6 * conflict + 0.4 * similarity
+    rows, cols = np.triu_indices(len(names), k=1)
+    order = np.argsort(-score[rows, cols])
+    pairs = []
+    for i in order[:top_k]:
+        a, b = rows[i], cols[i]
+        if score[a, b] < AUDIT_MIN_PAIR_SCORE:
+            break
+        pairs.append({
+            "a": names[a], "b": names[b],
+            "similarity": round(float(similarity[a, b]), 3),
+            "conflict_score": round(float(conflict[a, b]), 3),
+            "score": round(float(score[a, b]), 3),
+        })
+    return pairs
+
+
+class CorpusAuditService:
+    """
+    Runs audits as background jobs (one at a time) and keeps the parse and
+    confirmation caches between them.
+    """
+
+    def __init__(self, verifier, cache_dir: str = "../data/context_cache"):
+        self.verifier = verifier
+        self.cache_file = os.path.join(cache_dir, "corpus_audit.json")
+        self._parsed: Dict[str, Tuple[Tuple[int, int], Dict]] = {}
+        self._confirmed: Optional[Dict[str, Dict]] = None
+        self._jobs: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._running: Optional[str] = None
+
+    # --- Jobs ---
+
+    def start(self, directories: List[str], top_k: int = AUDIT_TOP_PAIRS) -> Dict:
+        """Start an audit, or return the one already running."""
+        with self._lock:
+            if self._running:
+                return dict(self._jobs[self._running])
+            job_id = secrets.token_urlsafe(8)
+            job = {"job_id": job_id, "status": "running", "stage": "parsing", "done": 0, "total": 0,
+                   "started_at": time.time(), "finished_at": None, "result": None, "error": None}
+            self._jobs[job_id] = job
+            self._running = job_id
+            # Keep only the most recent jobs
+            for old_id in list(self._jobs)[:-AUDIT_MAX_JOBS]:
+                self._jobs.pop(old_id)
+        threading.Thread(target=self._run_job, args=(job, directories, top_k), daemon=True).start()
+        return dict(job)
+
+    def status(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def _run_job(self, job: Dict, directories: List[str], top_k: int):
+        try:
+            job["result"] = self.audit(directories, top_k, progress=lambda **kw: job.update(kw))
+            job["status"] = "done"
+        except Exception as e:
+            print(f"[AUDIT] Failed: {e}")
+            job["status"] = "failed"
+            job["error"] = str(e)
+        finally:
+            job["finished_at"] = time.time()
+            with self._lock:
+                self._running = None
+
+    # --- Audit ---
+
+    def audit(self, directories: List[str], top_k: int = AUDIT_TOP_PAIRS, progress=lambda **kw: None) -> Dict:
+        start = time.perf_counter()
+        docs, reparsed = self._load(directories)
+        if len(docs) < 2:
+            raise ValueError("need at least two parseable specs to audit")
+        names = [doc['filename'] for doc in docs]
+
+        parse_seconds = time.perf_counter() - start
+
+        progress(stage="matrix", done=0, total=0)
+        spec_sections = [[f"{c['section']}\n{c['text']}" for c in chunk_document(doc['filename'], doc['content'])]
+                         for doc in docs]
+        similarity, conflict = pair_matrices(spec_sections)
+        pairs = rank_pairs(names, similarity, conflict, top_k)
+        matrix_seconds = time.perf_counter() - start - parse_seconds
+        print(f"[AUDIT] {len(docs)} specs ({reparsed} parsed in {parse_seconds:.2f}s), matrix in "
+              f"{matrix_seconds:.2f}s, {len(pairs)} pairs to confirm")
+
+        errors = self._confirm(docs, pairs, progress)
+        return {
+            "specs": names,
+            "similarity": similarity.round(3).tolist(),
+            "conflict": conflict.round(3).tolist(),
+            "pairs": pairs,
+            "reparsed": reparsed,
+            "model_calls": sum(1 for pair in pairs if pair.get("confirmed") is not None and not pair.get("cached")),
+            "parse_seconds": round(parse_seconds, 3),
+            "matrix_seconds": round(matrix_seconds, 3),
+            "elapsed_seconds": round(time.perf_counter() - start, 3),
+            "errors": errors,
+        }
+
+    def _load(self, directories: List[str]) -> Tuple[List[Dict], int]:
+        """Parse the corpus, reusing parsed text for files whose size and mtime are unchanged."""
+        docs, reparsed, seen = [], 0, set()
+        for directory in directories:
+            if not os.path.exists(directory):
+                continue
+            for filename in sorted(os.listdir(directory)):
+                path = os.path.join(directory, filename)
+                if not os.path.isfile(path) or filename.startswith('.'):
+                    continue
+                stat = os.stat(path)
+                key = (stat.st_size, stat.st_mtime_ns)
+                cached = self._parsed.get(path)
+                if cached is None or cached[0] != key:
+                    content = DocumentParser.parse_file(path)
+                    cached = (key, {"filename": filename, "content": content, "hash": _content_hash(content)})
+                    self._parsed[path] = cached
+                    reparsed += 1
+                seen.add(path)
+                doc = cached[1]
+                if doc['content'].strip() and not doc['content'].startswith("Unsupported file format"):
+                    docs.append(doc)
+        for path in set(self._parsed) - seen:
+            self._parsed.pop(path)
+        return docs, reparsed
+
+    def _confirm(self, docs: List[Dict], pairs: List[Dict], progress) -> List[str]:
+        """Ask the verifier about each candidate pair not already confirmed for the same two texts."""
+        by_name = {doc['filename']: doc for doc in docs}
+        confirmed = self._load_confirmed()
+        version = self.verifier.result_version(False)
+
+        def pair_key(pair):
+            a, b = by_name[pair['a']], by_name[pair['b']]
+            return f"{version}:{a['hash']}:{b['hash']}"
+
+        tasks = {}
+        for pair in pairs:
+            previous = confirmed.get(pair_key(pair))
+            if previous is not None:
+                pair.update(previous, cached=True)
+            elif self.verifier.model is not None:
+                tasks[f"{pair['a']} vs {pair['b']}"] = (
+                    lambda pair=pair: (pair, self.verifier.confirm_conflicts(by_name[pair['a']], by_name[pair['b']]))
+                )
+            else:
+                pair.update(confirmed=None, conflicts=[], cached=False)
+
+        progress(stage="confirming", done=len(pairs) - len(tasks), total=len(pairs))
+        results, errors = self.verifier._run_tasks(tasks) if tasks else ([], [])
+        for pair, found in results:
+            conflicts = [c for c in found.get("conflicts", []) if isinstance(c, dict)]
+            outcome = {"confirmed": bool(conflicts), "conflicts": conflicts}
+            pair.update(outcome, cached=False)
+            confirmed[pair_key(pair)] = outcome
+        for pair in pairs:
+            pair.setdefault("confirmed", None)
+            pair.setdefault("conflicts", [])
+            pair.setdefault("cached", False)
+        if self.verifier.model is None and pairs:
+            errors.append("GEMINI_API_KEY is not set; pairs were ranked locally but not confirmed.")
+        progress(stage="done", done=len(pairs), total=len(pairs))
+        self._save_confirmed(confirmed, {doc['hash'] for doc in docs})
+        return errors
+
+    def _load_confirmed(self) -> Dict[str, Dict]:
+        if self._confirmed is None:
+            self._confirmed = {}
+            if os.path.exists(self.cache_file):
+                try:
+                    with open(self.cache_file, 'r') as f:
+                        self._confirmed = json.load(f).get("pairs", {})
+                except Exception as e:
+                    print(f"[AUDIT] Ignoring unreadable cache {self.cache_file}: {e}")
+        return self._confirmed
+
+    def _save_confirmed(self, confirmed: Dict[str, Dict], current_hashes: set):
+        """Persist confirmations whose two spec texts are still in the corpus."""
+        self._confirmed = {
+            key: value for key, value in confirmed.items()
+            if set(key.rsplit(":", 2)[1:]) <= current_hashes
+        }
+        try:
+            os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+            tmp_path = self.cache_file + ".tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({"pairs": self._confirmed}, f, indent=2)
+            os.replace(tmp_path, self.cache_file)
+        except Exception as e:
+            print(f"[AUDIT] Could not write cache: {e}")
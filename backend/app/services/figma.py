@@ -1,21 +1,319 @@
+import os
+import re
+import json
+import time
+import random
+import threading
+import email.utils
+import urllib.parse
 import requests
-from typing import Dict, Any, List
+from requests.adapters import HTTPAdapter
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+FIGMA_API_BASE_URL = os.environ.get("FIGMA_API_BASE_URL", "https://api.figma.com/v1")
+FIGMA_CACHE_DIR = os.environ.get("FIGMA_CACHE_DIR", "../data/figma_cache")
+# Cached flow tables kept across all files (one version per file key)
+FIGMA_CACHE_MAX_FILES = int(os.environ.get("FIGMA_CACHE_MAX_FILES", "20"))
+# Connections kept open per host; matches the image fetch worker count with some headroom
+FIGMA_POOL_SIZE = int(os.environ.get("FIGMA_POOL_SIZE", "10"))
+FIGMA_MAX_RETRIES = int(os.environ.get("FIGMA_MAX_RETRIES", "4"))
+# Waits longer than this (e.g. a plan-level rate limit) fail fast instead of stalling generation
+FIGMA_MAX_RETRY_WAIT = float(os.environ.get("FIGMA_MAX_RETRY_WAIT", "60"))
+FIGMA_BACKOFF_BASE = 1.0
+# Rate limited, or a transient gateway error: retried on the same request, never by splitting a batch
+_RETRY_STATUSES = (429, 502, 503, 504)
+# A bad node id or an oversized request: smaller batches can succeed, so these (only) split a batch
+_SPLIT_STATUSES = (400, 413, 414)
+
+# Frame subtrees requested per /nodes call
+FIGMA_NODES_BATCH = int(os.environ.get("FIGMA_NODES_BATCH", "50"))
+# Node properties the flow extraction needs; everything else in the stream is skipped
+_FLOW_PROPS = ("id", "name", "type", "characters", "transitionNodeID")
+
+
+def _safe_name(value: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_-]", "_", value)
+
+
+class _HostBackoff:
+    """
+    Per-host pause shared by every request and thread: after a 429 (or a transient error)
+    nothing is sent to that host until the Retry-After time, so parallel batches back off
+    together instead of each hammering the API.
+    """
+
+    def __init__(self):
+        self._resume_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def wait(self, host: str):
+        with self._lock:
+            delay = self._resume_at.get(host, 0.0) - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def pause(self, host: str, seconds: float):
+        with self._lock:
+            self._resume_at[host] = max(self._resume_at.get(host, 0.0), time.monotonic() + seconds)
+
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+_backoff = _HostBackoff()
+
+
+def _get_session() -> requests.Session:
+    """Process-wide session, so requests to Figma reuse pooled keep-alive connections."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=FIGMA_POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def _retry_after_seconds(response: requests.Response) -> Optional[float]:
+    """Retry-After as seconds (delta-seconds or HTTP-date), or None if absent or unparseable."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _iter_json_events(value: Any) -> Iterator[Tuple[str, Any]]:
+    """(event, value) pairs for an already parsed JSON value, in ijson.basic_parse order, without recursion."""
+    stack: List[Tuple[bool, Any]] = [(False, value)]
+    while stack:
+        is_event, item = stack.pop()
+        if is_event:
+            yield item
+        elif isinstance(item, dict):
+            yield ("start_map", None)
+            stack.append((True, ("end_map", None)))
+            for key, child in reversed(list(item.items())):
+                stack.append((False, child))
+                stack.append((True, ("map_key", key)))
+        elif isinstance(item, list):
+            yield ("start_array", None)
+            stack.append((True, ("end_array", None)))
+            for child in reversed(item):
+                stack.append((False, child))
+        else:
+            yield ("scalar", item)
+
+
+def _new_entry() -> Dict[str, Any]:
+    return {"props": {}, "key": None, "texts": [], "frames": [], "pages": []}
+
+
+def _close_node(node: Dict[str, Any], parent: Dict[str, Any]):
+    """Fold a finished map into its parent: text goes up to the enclosing frame, frames to their page."""
+    props = node["props"]
+    node_type = props.get("type")
+    if node_type == "TEXT":
+        parent["texts"].append(props.get("characters", ""))
+        return
+    if node_type == "CANVAS":
+        parent["pages"].append({"name": props.get("name"), "id": props.get("id"), "frames": node["frames"]})
+        return
+    parent["texts"].extend(node["texts"])
+    parent["pages"].extend(node["pages"])
+    if node_type == "FRAME":
+        frame = {"id": props.get("id"), "name": props.get("name"), "text_content": node["texts"], "transitions": []}
+        if "transitionNodeID" in props:
+            frame["transitions"].append(props["transitionNodeID"])
+        parent["frames"].append(frame)
+    elif node_type is None:
+        # Plain maps (the response root, /nodes entries) pass top-level frames through;
+        # frames nested in other nodes are part of their parent frame, not flows of their own
+        parent["frames"].extend(node["frames"])
+
+
+def collect_frames(events: Iterable[Tuple[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Walk a Figma JSON event stream iteratively, keeping only the open path and collected text.
+    Returns { "pages": [{ name, id, frames }], "frames": [...] }: pages with their top-level
+    frames (file responses), and top-level frames outside any page (/nodes responses).
+    A frame is { id, name, text_content, transitions }.
+    """
+    root = _new_entry()
+    # Open containers, innermost last: map entries, or None for arrays
+    stack: List[Optional[Dict[str, Any]]] = [root]
+    for event, value in events:
+        if event == "map_key":
+            stack[-1]["key"] = value
+        elif event == "start_map":
+            stack.append(_new_entry())
+        elif event == "start_array":
+            stack.append(None)
+        elif event == "end_array":
+            stack.pop()
+        elif event == "end_map":
+            node = stack.pop()
+            parent = next(entry for entry in reversed(stack) if entry is not None)
+            _close_node(node, parent)
+        else:
+            top = stack[-1]
+            if top is not None and top["key"] in _FLOW_PROPS:
+                top["props"][top["key"]] = value
+    return {"pages": root["pages"], "frames": root["frames"]}
+
 
 class FigmaService:
-    BASE_URL = "https://api.figma.com/v1"
+    BASE_URL = FIGMA_API_BASE_URL
 
-    def __init__(self, token: str):
+    def __init__(self, token: str, cache_dir: Optional[str] = FIGMA_CACHE_DIR, base_url: Optional[str] = None):
         self.token = token
         self.headers = {"X-Figma-Token": token}
+        # None disables the on-disk flow cache
+        self.cache_dir = cache_dir
+        if base_url:
+            self.BASE_URL = base_url.rstrip("/")
 
-    def get_file(self, file_key: str) -> Dict[str, Any]:
-        """Fetch the entire Figma file."""
-        url = f"{self.BASE_URL}/files/{file_key}"
-        response = requests.get(url, headers=self.headers)
+    def get_flows(self, file_key: str, page_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Frame hierarchy, text, images and deep links of the file, fetching only what it needs:
+        a depth=2 request lists pages and their top-level nodes, then only the FRAME subtrees
+        (of the selected pages) are requested by id and streamed through collect_frames.
+        Frame text is cached per file version, so unchanged files need just the version check.
+        """
+        version = self.get_file_version(file_key) if self.cache_dir else ""
+        cached = (self._read_cache(file_key, version) if self.cache_dir else None) or {}
+        structure = cached.get("pages")
+        if structure is None:
+            shallow = self._get_json(f"{self.BASE_URL}/files/{file_key}", params={"depth": 2})
+            structure = collect_frames(_iter_json_events(shallow))["pages"]
+        texts: Dict[str, List[str]] = cached.get("texts", {})
+
+        # A node-id from the URL that names a page narrows the fetch to it; anything else means all pages
+        pages = [page for page in structure if page_ids and page["id"] in page_ids] or structure
+        missing = [frame["id"] for page in pages for frame in page["frames"] if frame["id"] not in texts]
+        for start in range(0, len(missing), FIGMA_NODES_BATCH):
+            batch = missing[start:start + FIGMA_NODES_BATCH]
+            found = collect_frames(self._stream_events(f"{self.BASE_URL}/files/{file_key}/nodes",
+                                                       params={"ids": ",".join(batch)}))
+            for frame in found["frames"]:
+                texts[frame["id"]] = frame["text_content"]
+        if self.cache_dir and (missing or not cached):
+            self._write_cache(file_key, version, {"pages": structure, "texts": texts})
+
+        selected = [
+            {**page, "frames": [{**frame, "text_content": texts.get(frame["id"], [])} for frame in page["frames"]]}
+            for page in pages
+        ]
+        return self._flows_result(file_key, selected)
+
+    def get_file_version(self, file_key: str) -> str:
+        """Current version of the file, from a depth=1 request (pages only, no node tree)."""
+        meta = self._get_json(f"{self.BASE_URL}/files/{file_key}", params={"depth": 1})
+        return str(meta.get("version") or meta.get("lastModified") or "")
+
+    def _request(self, url: str, params: Optional[Dict[str, Any]] = None, stream: bool = False) -> requests.Response:
+        """
+        GET through the pooled session. Rate limits (429, honoring Retry-After) and transient
+        gateway errors are retried with per-host backoff; any other response is returned as is.
+        """
+        host = urllib.parse.urlparse(url).netloc
+        for attempt in range(FIGMA_MAX_RETRIES + 1):
+            _backoff.wait(host)
+            try:
+                response = _get_session().get(url, headers=self.headers, params=params, stream=stream, timeout=60)
+            except requests.RequestException as e:
+                if attempt == FIGMA_MAX_RETRIES:
+                    raise
+                delay = FIGMA_BACKOFF_BASE * (2 ** attempt) + random.uniform(0, FIGMA_BACKOFF_BASE)
+                print(f"[FIGMA] {e.__class__.__name__} from {host}, retrying in {delay:.1f}s")
+                _backoff.pause(host, delay)
+                continue
+            if response.status_code not in _RETRY_STATUSES or attempt == FIGMA_MAX_RETRIES:
+                return response
+            delay = _retry_after_seconds(response)
+            if delay is None:
+                delay = FIGMA_BACKOFF_BASE * (2 ** attempt) + random.uniform(0, FIGMA_BACKOFF_BASE)
+            if delay > FIGMA_MAX_RETRY_WAIT:
+                print(f"[FIGMA] {host} asked to wait {delay:.0f}s, giving up")
+                return response
+            print(f"[FIGMA] {response.status_code} from {host}, retrying in {delay:.1f}s")
+            response.close()
+            _backoff.pause(host, delay)
+        return response
+
+    def _get_json(self, url: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        response = self._request(url, params=params)
         if response.status_code != 200:
             raise Exception(f"Figma API Error: {response.status_code} - {response.text}")
         return response.json()
 
+    def _stream_events(self, url: str, params: Optional[Dict[str, Any]] = None) -> Iterator[Tuple[str, Any]]:
+        """JSON events for a response, parsed as it arrives with ijson (falls back to response.json() without it)."""
+        response = self._request(url, params=params, stream=True)
+        try:
+            if response.status_code != 200:
+                raise Exception(f"Figma API Error: {response.status_code} - {response.text}")
+            try:
+                import ijson
+            except ImportError:
+                yield from _iter_json_events(response.json())
+                return
+            response.raw.decode_content = True
+            yield from ijson.basic_parse(response.raw)
+        finally:
+            response.close()
+
+    def _cache_path(self, file_key: str, version: str) -> str:
+        return os.path.join(self.cache_dir, f"{_safe_name(file_key)}--{_safe_name(version)}.flows.json")
+
+    def _read_cache(self, file_key: str, version: str) -> Optional[Dict[str, Any]]:
+        cache_path = self._cache_path(file_key, version)
+        if not os.path.exists(cache_path):
+            return None
+        try:
+            with open(cache_path, 'r') as f:
+                data = json.load(f)
+            print(f"[FIGMA] Using cached flows for {file_key} (version {version})")
+            return data
+        except Exception as e:
+            print(f"[FIGMA] Ignoring unreadable cache {cache_path}: {e}")
+            return None
+
+    def _write_cache(self, file_key: str, version: str, data: Dict[str, Any]):
+        """Store the flow tables for this version, replacing older versions of the same file."""
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            cache_path = self._cache_path(file_key, version)
+            tmp_path = cache_path + ".tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, cache_path)
+
+            prefix = f"{_safe_name(file_key)}--"
+            current = f"{prefix}{_safe_name(version)}."
+            cached = []
+            for name in os.listdir(self.cache_dir):
+                path = os.path.join(self.cache_dir, name)
+                if not name.endswith(".json"):
+                    continue
+                if name.startswith(prefix) and not name.startswith(current):
+                    os.remove(path)
+                else:
+                    cached.append(path)
+            # Oldest files beyond the cap go first
+            cached.sort(key=os.path.getmtime, reverse=True)
+            for path in cached[FIGMA_CACHE_MAX_FILES:]:
+                os.remove(path)
+        except Exception as e:
+            print(f"[FIGMA] Could not write cache: {e}")
+
     def get_images(self, file_key: str, node_ids: List[str]) -> Dict[str, str]:
         """Fetch image URLs for specific node IDs with parallel batching."""
         if not node_ids:
@@ -28,10 +326,13 @@ class FigmaService:
         batches = [node_ids[i:i + batch_size] for i in range(0, len(node_ids), batch_size)]
         
         import concurrent.futures
-        import time
 
         def fetch_batch_with_retry(batch_ids, depth=0):
-            """Recursively try to fetch images, splitting batch on failure."""
+            """
+            Fetch image URLs for a batch. Rate limits and gateway errors are retried by _request
+            with backoff and then skip the batch; request errors (bad id, too large) split it so
+            one bad node does not lose the rest.
+            """
             if not batch_ids:
                 return {}
             
@@ -39,42 +340,34 @@ class FigmaService:
             params = {"ids": ",".join(batch_ids), "format": "png", "scale": 2}
             
             try:
-                response = requests.get(url, headers=self.headers, params=params)
+                response = self._request(url, params=params)
                 if response.status_code == 200:
                     images = response.json().get("images", {})
                     print(f"DEBUG: Fetched batch of {len(batch_ids)} (Depth {depth})")
                     return images
-                else:
-                    print(f"Error fetching batch of {len(batch_ids)}: {response.status_code}")
-                    # If batch failed and we have more than 1 item, split and retry
-                    if len(batch_ids) > 1:
-                        mid = len(batch_ids) // 2
-                        left = batch_ids[:mid]
-                        right = batch_ids[mid:]
-                        print(f"DEBUG: Splitting batch into {len(left)} and {len(right)} and retrying...")
-                        
-                        results = {}
-                        results.update(fetch_batch_with_retry(left, depth+1))
-                        # Small sleep between splits to be nice
-                        time.sleep(0.5)
-                        results.update(fetch_batch_with_retry(right, depth+1))
-                        return results
-                    else:
-                        print(f"Failed to fetch single image {batch_ids[0]} after retries.")
-                        return {}
+                print(f"Error fetching batch of {len(batch_ids)}: {response.status_code}")
+                if response.status_code not in _SPLIT_STATUSES:
+                    # Rate limits and outages: splitting would only multiply requests to a failing host
+                    print(f"Skipping batch of {len(batch_ids)} after retries.")
+                    return {}
             except Exception as e:
-                print(f"Exception fetching batch: {str(e)}")
-                if len(batch_ids) > 1:
-                    mid = len(batch_ids) // 2
-                    left = batch_ids[:mid]
-                    right = batch_ids[mid:]
-                    results = {}
-                    results.update(fetch_batch_with_retry(left, depth+1))
-                    time.sleep(0.5)
-                    results.update(fetch_batch_with_retry(right, depth+1))
-                    return results
+                # Connection errors were already retried; same reasoning as above
+                print(f"Exception fetching batch of {len(batch_ids)}, skipping: {str(e)}")
                 return {}
 
+            # Request error with more than 1 item: split and retry
+            if len(batch_ids) > 1:
+                mid = len(batch_ids) // 2
+                left = batch_ids[:mid]
+                right = batch_ids[mid:]
+                print(f"DEBUG: Splitting batch into {len(left)} and {len(right)} and retrying...")
+                results = {}
+                results.update(fetch_batch_with_retry(left, depth+1))
+                results.update(fetch_batch_with_retry(right, depth+1))
+                return results
+            print(f"Failed to fetch single image {batch_ids[0]} after retries.")
+            return {}
+
         # Use ThreadPoolExecutor for parallel fetching
         # Limit workers to avoid hitting rate limits too hard
         with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
@@ -86,49 +379,15 @@ class FigmaService:
                 
         return all_images
 
-    def extract_flows(self, file_key: str, file_data: Dict[str, Any]) -> Dict[str, Any]:
-        """
-        Extract prototype flows and frame hierarchy.
-        Returns a dict with structured JSON data and image mapping.
-        """
-        document = file_data.get("document", {})
-        pages = document.get("children", [])
-        
-        structured_data = {"pages": []}
+    def _flows_result(self, file_key: str, pages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """{ json_data, images, links, frame_map } for the frames of the given pages."""
+        structured_data = {"pages": pages}
         frame_ids = []
         frame_map = {} # ID -> Name
-        
         for page in pages:
-            page_data = {
-                "name": page.get("name"),
-                "id": page.get("id"),
-                "frames": []
-            }
-            
-            frames = [node for node in page.get("children", []) if node.get("type") == "FRAME"]
-            
-            for frame in frames:
-                f_id = frame.get('id')
-                f_name = frame.get('name')
-                frame_ids.append(f_id)
-                frame_map[f_id] = f_name
-                
-                frame_data = {
-                    "id": f_id,
-                    "name": f_name,
-                    "text_content": self._extract_text_from_node(frame),
-                    "transitions": []
-                }
-                
-                if "transitionNodeID" in frame:
-                     frame_data["transitions"].append(frame.get("transitionNodeID"))
-                
-                # Also check children for interactions/transitions if needed
-                # (Simplified for now)
-                
-                page_data["frames"].append(frame_data)
-            
-            structured_data["pages"].append(page_data)
+            for frame in page["frames"]:
+                frame_ids.append(frame["id"])
+                frame_map[frame["id"]] = frame["name"]
 
         # Fetch images for all frames
         images = self.get_images(file_key, frame_ids)
@@ -140,7 +399,6 @@ class FigmaService:
             # Figma node IDs often have ':' which needs to be URL encoded to '-' or '%3A'
             # Usually for the URL param, it's safe to pass as is or use standard encoding
             # But Figma often uses '123:456' -> '123-456' in some contexts, but ?node-id=123:456 works.
-            import urllib.parse
             encoded_id = urllib.parse.quote(f_id)
             links[f_id] = f"https://www.figma.com/design/{file_key}?node-id={encoded_id}"
 
@@ -151,18 +409,6 @@ class FigmaService:
             "frame_map": frame_map
         }
 
-    def _extract_text_from_node(self, node: Dict[str, Any]) -> List[str]:
-        """Recursively extract text characters from a node."""
-        texts = []
-        if node.get("type") == "TEXT":
-            texts.append(node.get("characters", ""))
-        
-        if "children" in node:
-            for child in node["children"]:
-                texts.extend(self._extract_text_from_node(child))
-        
-        return texts
-
     @staticmethod
     def parse_file_key(url: str) -> str:
         """Extract file key from Figma URL."""
@@ -175,3 +421,9 @@ class FigmaService:
             return url # Assume it's the key if not a URL
         except:
             return url
+
+    @staticmethod
+    def parse_node_id(url: str) -> Optional[str]:
+        """node-id query parameter of a Figma URL as an API node ID ("12-34" -> "12:34"), if any."""
+        values = urllib.parse.parse_qs(urllib.parse.urlparse(url).query).get("node-id")
+        return values[0].replace("-", ":") if values else None
@@ -1,7 +1,6 @@
 import os
 import time
-import anthropic
-from typing import List, Optional
+from typing import Dict, List, Optional
 from app.config import get_anthropic_api_key
 from app.services.parser import DocumentParser
 from app.services.analyzer import EdgeCaseAnalyzer
@@ -12,34 +11,110 @@ from app.services.context_analyzer import ContextAnalyzer
 DEFAULT_MODEL = "claude-sonnet-4-20250514"
 FALLBACK_MODEL = "claude-3-5-haiku-20241022"
 
+# Batch generation: parallel Messages calls, or Message Batches poll interval (seconds)
+BATCH_MAX_CONCURRENCY = 4
+# Upper bound on max_concurrency from the request, whatever the client asks for
+BATCH_CONCURRENCY_LIMIT = 8
+BATCH_POLL_INTERVAL = 10
+# Prompts per request: the concurrent backend answers synchronously, Message Batches run as a background job
+BATCH_MAX_PROMPTS = 20
+MESSAGE_BATCH_MAX_PROMPTS = 100
+
 
 class GeneratorService:
     def __init__(self):
         self.context_analyzer = ContextAnalyzer()
 
     def generate_gdd(self, prompt: str, figma_token: Optional[str], figma_url: Optional[str],
-                     gdds_dir: str, slides_dir: str, edge_cases_dir: str, context_uploads_dir: str = None) -> str:
-
+                     gdds_dir: str, slides_dir: str, edge_cases_dir: str, context_uploads_dir: str = None,
+                     context_bundle: Optional[Dict] = None) -> str:
+        """
+        context_bundle: context prepared by /api/analyze (see prepare_context_bundle). Its analysis
+        is reused while still current, and its conflicts/relevant context when the prompt is the
+        analyzed one, possibly followed by clarification answers; only the answers are then checked
+        for further conflicts.
+        """
         api_key = get_anthropic_api_key()
         if not api_key:
             return "Error: API key is not set. Enter your Anthropic API key in the box above and click Save."
+        import anthropic
         client = anthropic.Anthropic(api_key=api_key)
 
-        # 1. Analyze ALL specs to build comprehensive knowledge base
-        print("Analyzing all existing specs for full context...")
-        analysis = self.context_analyzer.analyze_all_specs(gdds_dir, slides_dir)
+        analysis = None
+        prepared = None
+        version = self.context_analyzer.cache_version()
+        # No analysis cache on disk means nothing ties the bundle to the current specs
+        if context_bundle and version is not None and context_bundle.get("analysis_version") == version:
+            analysis = context_bundle["analysis"]
+            analyzed_prompt = context_bundle.get("prompt") or ""
+            if analyzed_prompt and prompt.startswith(analyzed_prompt):
+                # The UI appends "ADDITIONAL CONTEXT:" answers to the analyzed prompt
+                conflicts = list(context_bundle["conflicts"])
+                answers = prompt[len(analyzed_prompt):]
+                if answers.strip():
+                    conflicts += [c for c in self.context_analyzer.find_potential_conflicts(answers, analysis)
+                                  if c not in conflicts]
+                prepared = {"conflicts": conflicts, "relevant_context": context_bundle["relevant_context"]}
+            print(f"[CONTEXT] Reusing analysis{' and prompt context' if prepared else ''} from context handle")
+
+        shared = self.load_shared_context(gdds_dir, slides_dir, edge_cases_dir, context_uploads_dir,
+                                          figma_token, figma_url, analysis=analysis)
+        prepared = prepared or self.prepare_prompt_context(prompt, shared["analysis"])
+        full_prompt = self.build_prompt(prompt, shared, prepared)
+
+        generated_text = self._generate_with_fallback(client, full_prompt, shared)
+        if not generated_text.startswith("Error:"):
+            with open("last_generated_gdd.md", "w") as f:
+                f.write(generated_text)
+        return generated_text
+
+    def generate_batch(self, prompts: List[str], figma_token: Optional[str], figma_url: Optional[str],
+                       gdds_dir: str, slides_dir: str, edge_cases_dir: str, context_uploads_dir: str = None,
+                       max_concurrency: int = BATCH_MAX_CONCURRENCY, backend: str = "concurrent",
+                       progress=lambda **kw: None) -> List[str]:
+        """
+        Generate several specs from one context-assembly pass.
+        backend="concurrent" runs up to max_concurrency (at most BATCH_CONCURRENCY_LIMIT) Messages
+        calls at once; backend="batches" submits everything as one Message Batch and polls for
+        results, reporting its processing status through progress(stage=...).
+        Returns one markdown string (or "Error: ..." string) per prompt, in input order.
+        """
+        if not prompts:
+            return []
 
-        # 2. Check for potential conflicts
-        conflicts = self.context_analyzer.find_potential_conflicts(prompt, analysis)
-        if conflicts:
-            print(f"[WARNING] Found {len(conflicts)} potential conflicts:")
-            for conflict in conflicts:
-                print(f"  {conflict}")
-
-        # 3. Get relevant context based on the prompt
-        relevant_context = self.context_analyzer.get_relevant_context(prompt, analysis, max_features=15)
+        api_key = get_anthropic_api_key()
+        if not api_key:
+            return ["Error: API key is not set. Enter your Anthropic API key in the box above and click Save."] * len(prompts)
+        import anthropic
+        client = anthropic.Anthropic(api_key=api_key)
 
-        # 4. Load full documents for examples
+        # Analysis, examples, edge cases, uploads and Figma data are identical for every item
+        shared = self.load_shared_context(gdds_dir, slides_dir, edge_cases_dir, context_uploads_dir,
+                                          figma_token, figma_url)
+        full_prompts = [
+            self.build_prompt(p, shared, self.prepare_prompt_context(p, shared["analysis"]))
+            for p in prompts
+        ]
+
+        print(f"Generating {len(full_prompts)} specs via {backend} backend...")
+        if backend == "batches":
+            return self._generate_via_message_batches(client, full_prompts, shared, progress)
+
+        import concurrent.futures
+        workers = max(1, min(max_concurrency, BATCH_CONCURRENCY_LIMIT, len(full_prompts)))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(lambda fp: self._generate_with_fallback(client, fp, shared), full_prompts))
+
+    def load_shared_context(self, gdds_dir: str, slides_dir: str, edge_cases_dir: str,
+                            context_uploads_dir: str = None, figma_token: Optional[str] = None,
+                            figma_url: Optional[str] = None, analysis: Optional[Dict] = None) -> Dict:
+        """Load everything that does not depend on the user prompt (one pass per request or batch)."""
+        # 1. Analyze ALL specs to build comprehensive knowledge base (unless already done by the caller)
+        if analysis is None:
+            print("Analyzing all existing specs for full context...")
+            analysis = self.context_analyzer.analyze_all_specs(gdds_dir, slides_dir)
+
+        # 2. Load full documents for examples
         print("Loading document examples...")
         gdd_examples = DocumentParser.load_documents_from_dir(gdds_dir)
         slides = DocumentParser.load_documents_from_dir(slides_dir)
@@ -73,7 +148,7 @@ class GeneratorService:
                 custom_context += f"User Description: {description}\n"
                 custom_context += f"File Content:\n{optimized_content}\n"
 
-        # 2. Fetch Figma Data
+        # 3. Fetch Figma Data
         figma_content = ""
         figma_images = {}
         flow_data = {}
@@ -82,8 +157,8 @@ class GeneratorService:
             try:
                 figma_service = FigmaService(figma_token)
                 file_key = FigmaService.parse_file_key(figma_url)
-                file_data = figma_service.get_file(file_key)
-                flow_data = figma_service.extract_flows(file_key, file_data)
+                node_id = FigmaService.parse_node_id(figma_url)
+                flow_data = figma_service.get_flows(file_key, page_ids=[node_id] if node_id else None)
 
                 import json
                 figma_json = flow_data["json_data"]
@@ -99,8 +174,53 @@ class GeneratorService:
                 figma_content = f"Error fetching Figma data: {str(e)}"
                 print(figma_content)
 
-        # 5. Construct Prompt with Full Context
+        return {
+            "analysis": analysis,
+            "gdd_examples": gdd_examples,
+            "slides": slides,
+            "edge_cases_content": edge_cases_content,
+            "custom_context": custom_context,
+            "figma_content": figma_content,
+            "figma_images": figma_images,
+            "flow_data": flow_data,
+        }
+
+    def prepare_context_bundle(self, prompt: str, gdds_dir: str, slides_dir: str) -> Dict:
+        """
+        Analysis plus per-prompt context, as handed from /api/analyze to /api/generate.
+        analysis_version ties the bundle to the analysis cache it was computed from.
+        """
+        analysis = self.context_analyzer.analyze_all_specs(gdds_dir, slides_dir)
+        prepared = self.prepare_prompt_context(prompt, analysis)
+        return {
+            "prompt": prompt,
+            "analysis": analysis,
+            "analysis_version": self.context_analyzer.cache_version(),
+            **prepared,
+        }
+
+    def prepare_prompt_context(self, prompt: str, analysis: Dict) -> Dict:
+        """Per-prompt stages: conflict detection and relevant-feature selection."""
+        conflicts = self.context_analyzer.find_potential_conflicts(prompt, analysis)
+        if conflicts:
+            print(f"[WARNING] Found {len(conflicts)} potential conflicts:")
+            for conflict in conflicts:
+                print(f"  {conflict}")
+
+        relevant_context = self.context_analyzer.get_relevant_context(prompt, analysis, max_features=15)
+        return {"conflicts": conflicts, "relevant_context": relevant_context}
+
+    def build_prompt(self, prompt: str, shared: Dict, prepared: Dict) -> str:
+        """Construct the generation prompt from shared and per-prompt context."""
         print("Constructing prompt with comprehensive context...")
+        analysis = shared["analysis"]
+        conflicts = prepared["conflicts"]
+        relevant_context = prepared["relevant_context"]
+        slides = shared["slides"]
+        gdd_examples = shared["gdd_examples"]
+        edge_cases_content = shared["edge_cases_content"]
+        custom_context = shared["custom_context"]
+        figma_content = shared["figma_content"]
 
         # Build conflict warnings if any (optimized - more concise)
         conflict_warning = ""
@@ -176,8 +296,10 @@ FIGMA: Each Top-Level Frame = UI Screen. Use frame name as <Screen Name>. Use `t
 - Examples (Match depth and detail):
 {self._format_docs_optimized(gdd_examples, prompt, max_total_chars=60000, max_docs=5)}
 """
+        return full_prompt
 
-        # 4. Generate with Claude
+    def _generate_with_fallback(self, client, full_prompt: str, shared: Dict) -> str:
+        """Call Claude with retries and model fallback, then resolve Figma image placeholders."""
         print("Generating...")
         models_to_try = [DEFAULT_MODEL, FALLBACK_MODEL]
         last_error = "Unknown error"
@@ -194,29 +316,7 @@ FIGMA: Each Top-Level Frame = UI Screen. Use frame name as <Screen Name>. Use `t
                         max_tokens=16384,
                         messages=[{"role": "user", "content": full_prompt}],
                     )
-                    generated_text = response.content[0].text
-
-                    # Replace Figma Image Placeholders with URLs AND Deep Links
-                    figma_links = flow_data.get("links", {})
-                    print(f"DEBUG: Found {len(figma_images)} images and {len(figma_links)} links.")
-                    all_frame_ids = set(figma_links.keys()) | set(figma_images.keys())
-
-                    for f_id in all_frame_ids:
-                        deep_link = figma_links.get(f_id, "#")
-                        url = figma_images.get(f_id)
-                        if url:
-                            replacement = f"[![Mockup]({url})]({deep_link})"
-                        else:
-                            replacement = f"[View Mockup in Figma]({deep_link})"
-                        if f_id in generated_text:
-                            print(f"DEBUG: Replacing {f_id} with {'Image' if url else 'Fallback Link'}")
-                        generated_text = generated_text.replace(f"{{{{FIGMA_IMAGE:{f_id}}}}}", replacement)
-                        generated_text = generated_text.replace(f"{{FIGMA_IMAGE:{f_id}}}", replacement)
-
-                    with open("last_generated_gdd.md", "w") as f:
-                        f.write(generated_text)
-
-                    return generated_text
+                    return self._replace_figma_placeholders(response.content[0].text, shared)
                 except Exception as e:
                     error_str = str(e)
                     last_error = error_str
@@ -236,6 +336,61 @@ FIGMA: Each Top-Level Frame = UI Screen. Use frame name as <Screen Name>. Use `t
             return f"Error: API quota exceeded. Details: {last_error[:200]}"
         return f"Error: Failed to generate content. Last error: {last_error[:200]}"
 
+    def _generate_via_message_batches(self, client, full_prompts: List[str], shared: Dict,
+                                      progress=lambda **kw: None) -> List[str]:
+        """Submit all prompts as one Message Batch and collect results by custom_id."""
+        try:
+            batch = client.messages.batches.create(requests=[
+                {
+                    "custom_id": f"spec-{i}",
+                    "params": {
+                        "model": DEFAULT_MODEL,
+                        "max_tokens": 16384,
+                        "messages": [{"role": "user", "content": fp}],
+                    },
+                }
+                for i, fp in enumerate(full_prompts)
+            ])
+            while batch.processing_status != "ended":
+                progress(stage=batch.processing_status)
+                print(f"Batch {batch.id} is {batch.processing_status}, polling again in {BATCH_POLL_INTERVAL}s...")
+                time.sleep(BATCH_POLL_INTERVAL)
+                batch = client.messages.batches.retrieve(batch.id)
+
+            results = ["Error: No result returned for this item."] * len(full_prompts)
+            for item in client.messages.batches.results(batch.id):
+                index = int(item.custom_id.split("-", 1)[1])
+                if item.result.type == "succeeded":
+                    results[index] = self._replace_figma_placeholders(item.result.message.content[0].text, shared)
+                elif item.result.type == "errored":
+                    results[index] = f"Error: Failed to generate content. Last error: {str(item.result.error)[:200]}"
+                else:
+                    results[index] = f"Error: Batch request {item.result.type}."
+            return results
+        except Exception as e:
+            print(f"Message batch failed: {e}")
+            return [f"Error: Failed to generate content. Last error: {str(e)[:200]}"] * len(full_prompts)
+
+    def _replace_figma_placeholders(self, generated_text: str, shared: Dict) -> str:
+        """Replace Figma Image Placeholders with URLs AND Deep Links."""
+        figma_images = shared.get("figma_images", {})
+        figma_links = shared.get("flow_data", {}).get("links", {})
+        print(f"DEBUG: Found {len(figma_images)} images and {len(figma_links)} links.")
+        all_frame_ids = set(figma_links.keys()) | set(figma_images.keys())
+
+        for f_id in all_frame_ids:
+            deep_link = figma_links.get(f_id, "#")
+            url = figma_images.get(f_id)
+            if url:
+                replacement = f"[![Mockup]({url})]({deep_link})"
+            else:
+                replacement = f"[View Mockup in Figma]({deep_link})"
+            if f_id in generated_text:
+                print(f"DEBUG: Replacing {f_id} with {'Image' if url else 'Fallback Link'}")
+            generated_text = generated_text.replace(f"{{{{FIGMA_IMAGE:{f_id}}}}}", replacement)
+            generated_text = generated_text.replace(f"{{FIGMA_IMAGE:{f_id}}}", replacement)
+        return generated_text
+
     def _format_docs(self, docs: List[dict]) -> str:
         """Legacy method - use _format_docs_optimized instead."""
         return self._format_docs_optimized(docs, "", max_total_chars=100000, max_docs=5)
@@ -0,0 +1,315 @@
+"""
+Append-only history store for chat turns and clarifying Q&A, backed by SQLite in WAL mode.
+Appends are single-row inserts, reads go through indexes, and concurrent threads or
+worker processes can write without rewriting (or losing) each other's entries.
+Existing JSON history files are imported once on first open.
+"""
+import os
+import json
+import time
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+
+HISTORY_DIR = "../data/qa_history"
+HISTORY_DB_PATH = os.path.join(HISTORY_DIR, "history.db")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chat_turns (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    stopped INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_chat_turns_session ON chat_turns (session_id, id);
+CREATE TABLE IF NOT EXISTS chat_summaries (
+    session_id TEXT PRIMARY KEY,
+    summary TEXT NOT NULL,
+    covered_id INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS qa_entries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    q TEXT NOT NULL,
+    a TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS answer_cache (
+    corpus_version TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    norm_question TEXT NOT NULL,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (corpus_version, mode, norm_question)
+);
+CREATE TABLE IF NOT EXISTS verification_cache (
+    file_hash TEXT NOT NULL,
+    corpus_version TEXT NOT NULL,
+    verifier_version TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    result TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    used_at REAL NOT NULL,
+    PRIMARY KEY (file_hash, corpus_version, verifier_version)
+);
+CREATE TABLE IF NOT EXISTS verification_baselines (
+    filename TEXT NOT NULL,
+    corpus_version TEXT NOT NULL,
+    verifier_version TEXT NOT NULL,
+    baseline TEXT NOT NULL,
+    used_at REAL NOT NULL,
+    PRIMARY KEY (filename, corpus_version, verifier_version)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class HistoryStore:
+    def __init__(self, db_path: str = HISTORY_DB_PATH, legacy_dir: Optional[str] = HISTORY_DIR):
+        self.db_path = db_path
+        # Directory holding chat_history.json / history.json to import; None skips the import
+        self.legacy_dir = legacy_dir
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _conn(self) -> sqlite3.Connection:
+        """One connection per thread; schema and legacy import run once per store."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            # WAL + NORMAL: commits are atomic and crash-safe, fsync is batched at checkpoints
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    conn.executescript(_SCHEMA)
+                    if self.legacy_dir:
+                        self._import_legacy(conn)
+                    self._initialized = True
+        return conn
+
+    # --- Chat turns ---
+
+    def append_chat_turn(self, session_id: str, entry: Dict) -> int:
+        """Append a turn and return its id."""
+        conn = self._conn()
+        with conn:
+            cursor = conn.execute(
+                "INSERT INTO chat_turns (session_id, question, answer, stopped, created_at) VALUES (?, ?, ?, ?, ?)",
+                (session_id, entry['question'], entry['answer'], int(bool(entry.get('stopped'))), time.time())
+            )
+        return cursor.lastrowid
+
+    def recent_chat_turns(self, session_id: str, limit: int = 20, after_id: int = 0) -> List[Dict]:
+        """Last `limit` turns of a session newer than after_id, oldest first."""
+        rows = self._conn().execute(
+            "SELECT id, question, answer, stopped FROM chat_turns WHERE session_id = ? AND id > ? "
+            "ORDER BY id DESC LIMIT ?",
+            (session_id, after_id, limit)
+        ).fetchall()
+        turns = []
+        for row in reversed(rows):
+            entry = {"id": row["id"], "question": row["question"], "answer": row["answer"]}
+            if row["stopped"]:
+                entry["stopped"] = True
+            turns.append(entry)
+        return turns
+
+    def clear_chat(self, session_id: str) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM chat_turns WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM chat_summaries WHERE session_id = ?", (session_id,))
+
+    def get_chat_summary(self, session_id: str) -> Tuple[str, int]:
+        """Running summary of a session and the id of the last turn it covers."""
+        row = self._conn().execute(
+            "SELECT summary, covered_id FROM chat_summaries WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return (row["summary"], row["covered_id"]) if row else ("", 0)
+
+    def save_chat_summary(self, session_id: str, summary: str, covered_id: int) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO chat_summaries (session_id, summary, covered_id, updated_at) VALUES (?, ?, ?, ?)",
+                (session_id, summary, covered_id, time.time())
+            )
+
+    # --- Clarifying Q&A ---
+
+    def append_qa(self, question: str, answer: str) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute("INSERT INTO qa_entries (q, a, created_at) VALUES (?, ?, ?)", (question, answer, time.time()))
+
+    def list_qa(self, after_id: int = 0) -> List[Dict]:
+        """Q&A entries in insertion order; pass after_id to read only newer ones."""
+        rows = self._conn().execute(
+            "SELECT id, q, a FROM qa_entries WHERE id > ? ORDER BY id", (after_id,)
+        ).fetchall()
+        return [{"id": row["id"], "q": row["q"], "a": row["a"]} for row in rows]
+
+    # --- Chat answer cache ---
+
+    def get_cached_answer(self, corpus_version: str, mode: str, norm_question: str) -> Optional[str]:
+        row = self._conn().execute(
+            "SELECT answer FROM answer_cache WHERE corpus_version = ? AND mode = ? AND norm_question = ?",
+            (corpus_version, mode, norm_question)
+        ).fetchone()
+        return row["answer"] if row else None
+
+    def list_cached_questions(self, corpus_version: str) -> List[Dict]:
+        rows = self._conn().execute(
+            "SELECT mode, norm_question, question FROM answer_cache WHERE corpus_version = ?", (corpus_version,)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def put_cached_answer(self, corpus_version: str, mode: str, norm_question: str, question: str, answer: str) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO answer_cache (corpus_version, mode, norm_question, question, answer, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (corpus_version, mode, norm_question, question, answer, time.time())
+            )
+
+    def prune_answer_cache(self, keep_version: str) -> int:
+        """Drop cached answers computed against any other corpus version."""
+        conn = self._conn()
+        with conn:
+            cursor = conn.execute("DELETE FROM answer_cache WHERE corpus_version != ?", (keep_version,))
+        return cursor.rowcount
+
+    # --- Verification result cache ---
+
+    def get_verification(self, file_hash: str, corpus_version: str, verifier_version: str) -> Optional[Dict]:
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT result FROM verification_cache WHERE file_hash = ? AND corpus_version = ? AND verifier_version = ?",
+            (file_hash, corpus_version, verifier_version)
+        ).fetchone()
+        if row is None:
+            return None
+        with conn:
+            conn.execute(
+                "UPDATE verification_cache SET used_at = ? WHERE file_hash = ? AND corpus_version = ? AND verifier_version = ?",
+                (time.time(), file_hash, corpus_version, verifier_version)
+            )
+        return json.loads(row["result"])
+
+    def put_verification(self, file_hash: str, corpus_version: str, verifier_version: str,
+                         filename: str, result: Dict) -> None:
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO verification_cache "
+                "(file_hash, corpus_version, verifier_version, filename, result, created_at, used_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (file_hash, corpus_version, verifier_version, filename, json.dumps(result), now, now)
+            )
+
+    def prune_verifications(self, keep_version: str, max_entries: int) -> int:
+        """Drop results for other corpus versions, then the least recently used beyond max_entries."""
+        conn = self._conn()
+        with conn:
+            stale = conn.execute("DELETE FROM verification_cache WHERE corpus_version != ?", (keep_version,)).rowcount
+            evicted = conn.execute(
+                "DELETE FROM verification_cache WHERE rowid NOT IN "
+                "(SELECT rowid FROM verification_cache ORDER BY used_at DESC LIMIT ?)", (max_entries,)
+            ).rowcount
+        return stale + evicted
+
+    def list_baselines(self, corpus_version: str, verifier_version: str) -> List[Dict]:
+        rows = self._conn().execute(
+            "SELECT filename, baseline FROM verification_baselines WHERE corpus_version = ? AND verifier_version = ? "
+            "ORDER BY used_at DESC", (corpus_version, verifier_version)
+        ).fetchall()
+        return [{"filename": row["filename"], **json.loads(row["baseline"])} for row in rows]
+
+    def put_baseline(self, filename: str, corpus_version: str, verifier_version: str, baseline: Dict) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO verification_baselines (filename, corpus_version, verifier_version, baseline, used_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (filename, corpus_version, verifier_version, json.dumps(baseline), time.time())
+            )
+
+    def prune_baselines(self, keep_version: str, max_entries: int) -> int:
+        """Same policy as prune_verifications, for the section baselines of verified uploads."""
+        conn = self._conn()
+        with conn:
+            stale = conn.execute("DELETE FROM verification_baselines WHERE corpus_version != ?", (keep_version,)).rowcount
+            evicted = conn.execute(
+                "DELETE FROM verification_baselines WHERE rowid NOT IN "
+                "(SELECT rowid FROM verification_baselines ORDER BY used_at DESC LIMIT ?)", (max_entries,)
+            ).rowcount
+        return stale + evicted
+
+    # --- Legacy JSON import ---
+
+    def _import_legacy(self, conn: sqlite3.Connection):
+        """Import the JSON files the services used before this store (once per file)."""
+        sources = [
+            ("chat:default", os.path.join(self.legacy_dir, "chat_history.json"), "default"),
+            ("qa", os.path.join(self.legacy_dir, "history.json"), None),
+        ]
+
+        for key, path, session_id in sources:
+            if not os.path.exists(path) or self._meta(conn, f"imported:{key}"):
+                continue
+            try:
+                with open(path, 'r') as f:
+                    items = json.load(f)
+            except Exception as e:
+                print(f"[HISTORY] Skipping legacy import of {path}: {e}")
+                continue
+            now = time.time()
+            with conn:
+                # Write lock first, then re-check, so parallel workers import each file only once
+                conn.execute("BEGIN IMMEDIATE")
+                if self._meta(conn, f"imported:{key}"):
+                    continue
+                if session_id is None:
+                    conn.executemany(
+                        "INSERT INTO qa_entries (q, a, created_at) VALUES (?, ?, ?)",
+                        [(item['q'], item['a'], now) for item in items]
+                    )
+                else:
+                    conn.executemany(
+                        "INSERT INTO chat_turns (session_id, question, answer, stopped, created_at) VALUES (?, ?, ?, ?, ?)",
+                        [(session_id, item['question'], item['answer'], int(bool(item.get('stopped'))), now) for item in items]
+                    )
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (f"imported:{key}", str(now)))
+            print(f"[HISTORY] Imported {len(items)} entries from {path}")
+
+    @staticmethod
+    def _meta(conn: sqlite3.Connection, key: str) -> Optional[str]:
+        row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else None
+
+
+_default_store: Optional[HistoryStore] = None
+_default_store_lock = threading.Lock()
+
+
+def get_history_store() -> HistoryStore:
+    """Process-wide store shared by the chat and Q&A services."""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = HistoryStore()
+        return _default_store
@@ -1,8 +1,6 @@
 import os
+import hashlib
 from typing import List, Dict, Any
-from pypdf import PdfReader
-from docx import Document
-import pandas as pd
 
 class DocumentParser:
     @staticmethod
@@ -10,6 +8,7 @@ class DocumentParser:
         """Extract text from a PDF file."""
         text = ""
         try:
+            from pypdf import PdfReader
             with open(file_path, 'rb') as file:
                 reader = PdfReader(file)
                 for page in reader.pages:
@@ -23,6 +22,7 @@ class DocumentParser:
         """Extract text from a DOCX file."""
         text = ""
         try:
+            from docx import Document
             doc = Document(file_path)
             for paragraph in doc.paragraphs:
                 text += paragraph.text + "\n"
@@ -35,6 +35,8 @@ class DocumentParser:
         """Extract text from an Excel file (for edge cases)."""
         text = ""
         try:
+            # pandas is only needed for spreadsheets and is slow to import, so it is loaded here
+            import pandas as pd
             df = pd.read_excel(file_path)
             # Convert the dataframe to a string representation
             text = df.to_string(index=False)
@@ -89,3 +91,31 @@ class DocumentParser:
                     "path": file_path
                 })
         return documents
+
+    @staticmethod
+    def corpus_fingerprint(documents: List[Dict[str, Any]]) -> str:
+        """Stable hash of parsed documents (name + content); changes whenever any spec changes."""
+        digest = hashlib.sha256()
+        for doc in sorted(documents, key=lambda d: d['filename']):
+            digest.update(doc['filename'].encode('utf-8'))
+            digest.update(b'\0')
+            digest.update(doc['content'].encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()[:16]
+
+    @staticmethod
+    def directory_fingerprint(directories: List[str]) -> str:
+        """
+        Cheap corpus version from file names, sizes and modification times, without parsing.
+        Changes whenever a spec is added, removed or rewritten.
+        """
+        digest = hashlib.sha256()
+        for directory in directories:
+            if not os.path.exists(directory):
+                continue
+            for filename in sorted(os.listdir(directory)):
+                file_path = os.path.join(directory, filename)
+                if os.path.isfile(file_path) and not filename.startswith('.'):
+                    stat = os.stat(file_path)
+                    digest.update(f"{directory}/{filename}\0{stat.st_size}\0{stat.st_mtime_ns}\0".encode('utf-8'))
+        return digest.hexdigest()[:16]
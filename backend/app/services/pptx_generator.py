@@ -1,7 +1,5 @@
 import requests
 from io import BytesIO
-from pptx import Presentation
-from pptx.util import Inches
 import re
 import os
 from typing import List
@@ -15,6 +13,7 @@ class PPTXGenerator:
         Converts structured Markdown into a PPTX file.
         If template_path is provided, it fills existing slides based on title matching.
         """
+        from pptx import Presentation
         print(f"DEBUG: create_presentation called with template_path={template_path}")
         if template_path and os.path.exists(template_path):
             print("DEBUG: Template found, loading...")
@@ -529,6 +528,7 @@ class PPTXGenerator:
                     # print("DEBUG: Image added successfully (Aspect Ratio Preserved)")
                 else:
                     # Default placement
+                    from pptx.util import Inches
                     slide.shapes.add_picture(image_stream, Inches(1), Inches(2), height=Inches(4))
         except Exception as e:
             print(f"Error adding image: {e}")
@@ -1,52 +1,99 @@
 import os
 import json
-import anthropic
-from typing import List, Optional
+import threading
+from typing import Any, Dict, List, Optional
 from app.config import get_anthropic_api_key
+from app.services.history_store import HistoryStore, get_history_store
+from app.services.retrieval import VectorIndex, tokenize
+from app.services.sufficiency import assess_prompt
 
 QA_MODEL = "claude-3-5-haiku-20241022"
+# Past Q&A injected into the clarifying-question prompt: the most similar pairs, within a fixed budget
+QA_HISTORY_TOP_K = int(os.environ.get("QA_HISTORY_TOP_K", "8"))
+QA_HISTORY_BUDGET_CHARS = int(os.environ.get("QA_HISTORY_BUDGET_CHARS", "4000"))
 
 
 class QAService:
-    def __init__(self):
-        self.history_file = "../data/qa_history/history.json"
+    def __init__(self, store: Optional[HistoryStore] = None):
+        self.store = store or get_history_store()
+        # Deduplicated index over past Q&A, extended incrementally with entries newer than _last_id
+        self._index = VectorIndex()
+        self._seen: Dict[str, Dict] = {}
+        self._last_id = 0
+        self._index_lock = threading.Lock()
+
+    def _refresh_index(self):
+        """Index Q&A entries saved since the last call; identical pairs are indexed once."""
+        with self._index_lock:
+            for item in self.store.list_qa(after_id=self._last_id):
+                self._last_id = item['id']
+                if not item['a'].strip():
+                    continue
+                key = " ".join(tokenize(f"{item['q']} {item['a']}"))
+                if not key or key in self._seen:
+                    continue
+                entry = {"q": item['q'], "a": item['a']}
+                self._seen[key] = entry
+                self._index.add(f"{item['q']}\n{item['a']}", entry)
+
+    def relevant_entries(self, prompt: str, k: int = QA_HISTORY_TOP_K,
+                         budget_chars: int = QA_HISTORY_BUDGET_CHARS) -> List[Dict[str, str]]:
+        """The k past Q&A pairs most similar to the prompt that fit within budget_chars."""
+        try:
+            self._refresh_index()
+            with self._index_lock:
+                matches = self._index.search(prompt, k=k)
+        except Exception as e:
+            print(f"[QA] Could not search Q&A history: {e}")
+            return []
 
-    def load_history(self) -> str:
-        """Loads past Q&A context."""
-        if os.path.exists(self.history_file):
-            try:
-                with open(self.history_file, 'r') as f:
-                    data = json.load(f)
-                    return "\n".join([f"Q: {item['q']}\nA: {item['a']}" for item in data])
-            except Exception:
-                return ""
-        return ""
+        entries = []
+        used = 0
+        for score, entry in matches:
+            size = len(entry['q']) + len(entry['a']) + 8
+            if used + size > budget_chars:
+                continue
+            entries.append(entry)
+            used += size
+        return entries
+
+    def relevant_history(self, prompt: str, k: int = QA_HISTORY_TOP_K,
+                         budget_chars: int = QA_HISTORY_BUDGET_CHARS) -> str:
+        """relevant_entries formatted for the prompt."""
+        return "\n".join(f"Q: {e['q']}\nA: {e['a']}" for e in self.relevant_entries(prompt, k, budget_chars))
+
+    def clarify(self, prompt: str, gdd_context: str = "") -> Dict[str, Any]:
+        """
+        Clarifying questions plus how they were decided:
+        { "questions": [...], "path": "local" | "llm", "sufficiency": assess_prompt(...) }.
+        Prompts the local check finds clearly sufficient skip the LLM call.
+        """
+        entries = self.relevant_entries(prompt)
+        sufficiency = assess_prompt(prompt, [e['a'] for e in entries])
+        if sufficiency["sufficient"]:
+            print(f"[QA] Prompt sufficient by local check (score {sufficiency['score']}), skipping LLM")
+            return {"questions": [], "path": "local", "sufficiency": sufficiency}
+        history = "\n".join(f"Q: {e['q']}\nA: {e['a']}" for e in entries)
+        questions = self._ask_llm(prompt, history, gdd_context)
+        return {"questions": questions, "path": "llm", "sufficiency": sufficiency}
 
     def save_entry(self, question: str, answer: str):
-        """Saves a new Q&A entry."""
-        data = []
-        if os.path.exists(self.history_file):
-            try:
-                with open(self.history_file, 'r') as f:
-                    data = json.load(f)
-            except Exception:
-                pass
-
-        data.append({"q": question, "a": answer})
-        os.makedirs(os.path.dirname(self.history_file), exist_ok=True)
-        with open(self.history_file, 'w') as f:
-            json.dump(data, f, indent=2)
+        """Appends a new Q&A entry."""
+        self.store.append_qa(question, answer)
 
     def analyze_prompt(self, prompt: str, gdd_context: str = "") -> List[str]:
         """
         Analyzes the prompt and returns a list of clarifying questions if information is missing.
         Returns empty list if the prompt is sufficient.
         """
+        return self.clarify(prompt, gdd_context)["questions"]
+
+    def _ask_llm(self, prompt: str, history: str, gdd_context: str = "") -> List[str]:
         api_key = get_anthropic_api_key()
         if not api_key:
             return []
 
-        history = self.load_history()
+        import anthropic
         client = anthropic.Anthropic(api_key=api_key)
 
         analysis_prompt = f"""
@@ -56,8 +103,8 @@ Your goal is to determine if you have enough information to write a detailed Gam
 USER IDEA:
 {prompt}
 
-PAST Q&A HISTORY (Do not ask these again):
-{history}
+PAST Q&A HISTORY (most relevant past answers; do not ask these again):
+{history or "(none)"}
 
 CONTEXT (Existing GDDs/Slides style):
 {gdd_context[:2000]}... (truncated)
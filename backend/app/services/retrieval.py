@@ -0,0 +1,167 @@
+"""
+Local retrieval over spec content.
+Chunks documents by section (## headers, or page breaks for PDF/PPTX text) and
+ranks chunks with a TF-IDF cosine index. Pure Python, no external services.
+"""
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_HEADER_RE = re.compile(r"\n(?=#{1,3}\s+)")
+_PAGE_BREAK_RE = re.compile(r"\n\s*\n")
+
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'can', 'do', 'does', 'for', 'from',
+    'how', 'i', 'if', 'in', 'is', 'it', 'its', 'me', 'of', 'on', 'or', 'so', 'that', 'the',
+    'their', 'them', 'there', 'these', 'they', 'this', 'to', 'was', 'we', 'what', 'when',
+    'where', 'which', 'who', 'will', 'with', 'you', 'your'
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens with stopwords removed."""
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in STOPWORDS and len(t) > 1]
+
+
+def chunk_document(filename: str, content: str, max_chars: int = 1500, min_chars: int = 200) -> List[Dict[str, str]]:
+    """
+    Split a document into section chunks.
+    Each chunk is { "source": filename, "section": title, "text": chunk text }.
+    """
+    if not content or not content.strip():
+        return []
+
+    if re.search(r"^#{1,3}\s+", content, re.MULTILINE):
+        blocks = _HEADER_RE.split(content)
+    else:
+        # Extracted PDF/PPTX text has no headers; blank lines mark page/slide boundaries
+        blocks = _PAGE_BREAK_RE.split(content)
+
+    # Merge tiny blocks into the following one so titles are not orphaned
+    merged = []
+    pending = ""
+    for block in blocks:
+        block = block.strip()
+        if not block:
+            continue
+        pending = f"{pending}\n{block}" if pending else block
+        if len(pending) >= min_chars:
+            merged.append(pending)
+            pending = ""
+    if pending:
+        if merged and len(merged[-1]) + len(pending) <= max_chars:
+            merged[-1] = f"{merged[-1]}\n{pending}"
+        else:
+            merged.append(pending)
+
+    chunks = []
+    for block in merged:
+        title = _section_title(block)
+        for piece in _split_long_block(block, max_chars):
+            chunks.append({"source": filename, "section": title, "text": piece})
+    return chunks
+
+
+def _section_title(block: str) -> str:
+    first_line = next((line for line in block.split('\n') if line.strip()), "")
+    return first_line.replace('#', '').strip()[:80] or "(untitled)"
+
+
+def _split_long_block(block: str, max_chars: int) -> List[str]:
+    if len(block) <= max_chars:
+        return [block]
+    pieces = []
+    current = ""
+    for line in block.split('\n'):
+        if current and len(current) + len(line) + 1 > max_chars:
+            pieces.append(current)
+            current = ""
+        # A single line longer than a chunk (a PDF page without line breaks) continues
+        # across consecutive pieces instead of being cut off
+        while len(line) > max_chars:
+            pieces.append(line[:max_chars])
+            line = line[max_chars:]
+        current = f"{current}\n{line}" if current else line
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+class VectorIndex:
+    """
+    Small in-memory TF-IDF index with cosine scoring.
+    Items can be added incrementally; IDF weights and norms are refreshed lazily on search.
+    """
+
+    def __init__(self):
+        self.items: List[Dict[str, Any]] = []
+        self._term_freqs: List[Counter] = []
+        self._postings: Dict[str, List[int]] = defaultdict(list)
+        self._norms: List[float] = []
+        self._dirty = False
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def add(self, text: str, item: Optional[Dict[str, Any]] = None) -> int:
+        """Index text and return the item position."""
+        tf = Counter(tokenize(text))
+        position = len(self.items)
+        self.items.append(item if item is not None else {"text": text})
+        self._term_freqs.append(tf)
+        for term in tf:
+            self._postings[term].append(position)
+        self._dirty = True
+        return position
+
+    def idf(self, term: str) -> float:
+        return math.log((1 + len(self.items)) / (1 + len(self._postings.get(term, ())))) + 1.0
+
+    def _refresh(self):
+        if not self._dirty:
+            return
+        self._norms = [
+            math.sqrt(sum(((1 + math.log(count)) * self.idf(term)) ** 2 for term, count in tf.items())) or 1.0
+            for tf in self._term_freqs
+        ]
+        self._dirty = False
+
+    def search(self, query: str, k: int = 5, min_score: float = 0.0) -> List[Tuple[float, Dict[str, Any]]]:
+        """Return up to k (score, item) pairs with cosine score above min_score, best first."""
+        if not self.items:
+            return []
+        self._refresh()
+
+        query_tf = Counter(tokenize(query))
+        # Terms the index has never seen still count towards the query norm: a query that adds
+        # words to an indexed text must score below 1.0 against it
+        query_weights = {t: (1 + math.log(c)) * self.idf(t) for t, c in query_tf.items()}
+        if not any(t in self._postings for t in query_weights):
+            return []
+        query_norm = math.sqrt(sum(w * w for w in query_weights.values()))
+
+        scores: Dict[int, float] = defaultdict(float)
+        for term, q_weight in query_weights.items():
+            if term not in self._postings:
+                continue
+            idf = self.idf(term)
+            for position in self._postings[term]:
+                scores[position] += q_weight * (1 + math.log(self._term_freqs[position][term])) * idf
+
+        ranked = sorted(
+            ((score / (query_norm * self._norms[pos]), pos) for pos, score in scores.items()),
+            reverse=True
+        )
+        return [(score, self.items[pos]) for score, pos in ranked[:k] if score > min_score]
+
+
+def build_chunk_index(docs: List[Dict[str, Any]], max_chars: int = 1500) -> VectorIndex:
+    """Chunk every document by section and index the chunks."""
+    index = VectorIndex()
+    for doc in docs:
+        for chunk in chunk_document(doc['filename'], doc['content'], max_chars=max_chars):
+            # Section title is indexed with the text so heading words count towards relevance
+            index.add(f"{chunk['section']}\n{chunk['text']}", chunk)
+    return index
@@ -0,0 +1,348 @@
+"""
+Structured field tables extracted from specs at ingestion time.
+Specs describe unlock/surfacing conditions, popup priorities, CTAs and tracking events
+as `Key: Value` lines or short headed lists. These are pulled into per-spec records
+so factual lookups can be answered locally, without an LLM call, when the records cover
+every place the spec mentions the field.
+"""
+import os
+import re
+import json
+from typing import Dict, List, Optional, Tuple
+from app.services.parser import DocumentParser
+from app.services.retrieval import tokenize
+
+FIELD_LABELS = {
+    "unlock_conditions": "Unlock conditions",
+    "surfacing_conditions": "Surfacing conditions",
+    "popup_priority": "Popup priority",
+    "cta_functionality": "CTA functionality",
+    "cta": "CTAs",
+    "tracking_events": "Tracking events",
+}
+
+# Spec-side key patterns (matched against the whole key); CTA functionality is tried before plain CTA
+_FIELD_KEY_PATTERNS = [
+    ("unlock_conditions", r"unlock(?:ing)?(?: conditions?| criteria| requirements?| levels?| logic)?"),
+    ("surfacing_conditions", r"(?:re)?surfacing(?: logic| conditions?| points?| rules?)?|triggers?(?: conditions?)?|entry points?"),
+    ("popup_priority", r"pop ?-?up priority|priority"),
+    ("cta_functionality", r"(?:primary |secondary )?cta (?:functionality|actions?|behaviou?r|flow)"
+                          r"|on (?:clicking|tapping|click|tap)(?: the)?(?: \w+)? cta"),
+    ("cta", r"(?:primary |secondary |main )?ctas?(?: text| label)?"),
+    ("tracking_events", r"trackings?(?: events?| requirements?| links?)?|analytics(?: events?)?|events? tracked"),
+]
+_FIELD_KEY_RES = [(field, re.compile(pattern)) for field, pattern in _FIELD_KEY_PATTERNS]
+
+# Question-side cues for the chat fast path
+_FIELD_QUERY_RES = [
+    ("unlock_conditions", re.compile(r"\bunlock")),
+    ("surfacing_conditions", re.compile(r"\b(re)?surfac|\btrigger")),
+    ("popup_priority", re.compile(r"\bpriorit")),
+    ("cta_functionality", re.compile(r"\bctas?\b.*\b(do|does|functionality|action|happens?|behaviou?r)\b|\b(click|tap)\w*\b.*\bctas?\b")),
+    ("cta", re.compile(r"\bctas?\b|\bcall to action")),
+    ("tracking_events", re.compile(r"\btracking|\banalytics\b|\btracked\b")),
+]
+# Shape a bare heading's value must have to count as its field: a popup name under "Pop up priority"
+# is not a priority. CTAs are only taken from inline "CTA: Label" lines, since the line under a lone
+# "CTA" heading is as likely a popup or section name as a button label.
+_BARE_VALUE_SHAPES = {
+    "popup_priority": re.compile(r"^(?:p?\d+|high(?:est)?|medium|low(?:est)?|top|critical)\b", re.IGNORECASE),
+}
+_INLINE_ONLY_FIELDS = {"cta", "cta_functionality"}
+_LOOKUP_RE = re.compile(r"^\s*(list|show|what|which|where|give|get|find)\b|\ball\b")
+_ANALYSIS_RE = re.compile(r"\b(why|improve|should|recommend\w*|compare|critique|suggest\w*|better|analy[sz]\w*|opinion|risks?)\b")
+
+_BULLET_RE = re.compile(r"^\s*(?:[●•○▪■◦\-\*]+|\(?\d{1,2}[.)]|\(?[a-z][.)])\s+")
+_KEY_VALUE_RE = re.compile(r"^([A-Za-z][A-Za-z0-9 /&'\-]{0,60}?)\s*:\s*(.*)$")
+_HEADER_RE = re.compile(r"^#{1,4}\s+(.*)")
+_SLIDE_RE = re.compile(r"^slide\s+\d+\b", re.IGNORECASE)
+_MOCK_LINK_RE = re.compile(r"^(mock link\s*)+(\[[^\]]*\])?$", re.IGNORECASE)
+_GENERIC_NAME_TOKENS = {'pdf', 'pptx', 'docx', 'md', 'xlsx', 'spec', 'specs', 'final'}
+# Words that only phrase the lookup; whatever else the question says narrows it to a topic
+_QUERY_FILLER_TOKENS = {
+    'list', 'show', 'give', 'get', 'find', 'all', 'any', 'are', 'conditions', 'condition', 'logic',
+    'spec', 'specs', 'feature', 'features', 'document', 'documents', 'unlock', 'unlocks', 'unlocked',
+    'surfacing', 'surfaced', 'surface', 'resurfacing', 'trigger', 'triggers', 'triggered', 'priority',
+    'priorities', 'popup', 'popups', 'pop', 'up', 'ups', 'cta', 'ctas', 'tracking', 'trackings', 'tracked',
+    'events', 'event', 'analytics', 'call', 'action', 'functionality', 'happens', 'happen', 'click',
+    'clicking', 'tap', 'tapping', 'each', 'every', 'defined', 'used', 'there', 'our', 'have', 'has',
+    'tell', 'mentioned', 'listed', 'specified', 'current', 'currently'
+}
+
+BLOCK_MAX_LINES = 8
+BLOCK_MAX_CHARS = 1200
+# Bumped whenever extraction changes, so tables cached by older code are rebuilt
+FIELDS_FORMAT = 2
+
+
+def _match_field(key: str) -> Optional[str]:
+    """Field name for a key like "Primary CTA" or "Bulk add flow - Surfacing logic", else None."""
+    key = re.sub(r"\s+", " ", key.lower().replace("ﬂ", "fl")).strip(" -:")
+    candidates = [key]
+    if "-" in key:
+        # "<subject> - <field>" headings
+        candidates.append(key.rsplit("-", 1)[1].strip())
+    for candidate in candidates:
+        for field, pattern in _FIELD_KEY_RES:
+            if pattern.fullmatch(candidate):
+                return field
+    return None
+
+
+def _field_line(line: str) -> Optional[Tuple[str, str, str]]:
+    """(field, key, inline value) if the line starts a field, else None."""
+    bulleted = bool(_BULLET_RE.match(line))
+    stripped = _BULLET_RE.sub("", line).strip()
+    if not stripped or len(stripped) > 300:
+        return None
+    kv = _KEY_VALUE_RE.match(stripped)
+    if kv:
+        field = _match_field(kv.group(1))
+        if field:
+            return field, kv.group(1).strip(), kv.group(2).strip()
+    # Bare heading such as "Pop up priority" or "Tracking requirement" followed by a list
+    # (bulleted one-word lines are table-of-contents entries, not headings)
+    if not bulleted and len(stripped) <= 60:
+        field = _match_field(stripped)
+        if field:
+            return field, stripped.rstrip(":").strip(), ""
+    return None
+
+
+def _bare_value_ok(field: str, value: str) -> bool:
+    """Whether the block under a bare field heading is a value of that field."""
+    if field in _INLINE_ONLY_FIELDS:
+        return False
+    shape = _BARE_VALUE_SHAPES.get(field)
+    # Condition and tracking headings head a list or prose of any shape
+    return shape is None or all(shape.match(line) for line in value.split("\n"))
+
+
+def extract_fields(filename: str, content: str) -> List[Dict]:
+    """
+    Extract field records from one document.
+    Each record is { source, section, field, key, value, line, end } (1-based, end inclusive).
+    """
+    records = []
+    lines = content.split('\n')
+    section = ""
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        header = _HEADER_RE.match(line)
+        if header:
+            section = header.group(1).strip()[:80]
+        elif _SLIDE_RE.match(line.strip()):
+            section = line.strip()[:80]
+
+        match = _field_line(line) if not header else None
+        if not match:
+            i += 1
+            continue
+
+        field, key, value = match
+        start = i
+        i += 1
+        if not value:
+            # Value is the block that follows: stop at a blank line, a heading or the next field
+            block = []
+            while i < len(lines) and len(block) < BLOCK_MAX_LINES:
+                nxt = lines[i].strip()
+                if not nxt or _HEADER_RE.match(nxt) or _field_line(nxt) or (block and nxt.endswith(":")):
+                    break
+                i += 1
+                if not _MOCK_LINK_RE.match(nxt):
+                    block.append(nxt)
+            value = "\n".join(block)[:BLOCK_MAX_CHARS]
+            if value and not _bare_value_ok(field, value):
+                i = start + 1
+                continue
+        if value:
+            records.append({
+                "source": filename,
+                "section": section,
+                "field": field,
+                "key": key,
+                "value": value,
+                "line": start + 1,
+                "end": i,
+            })
+    return records
+
+
+def uncovered_mentions(content: str, records: List[Dict]) -> Dict[str, List[int]]:
+    """
+    Lines (1-based) per field that mention the field outside every extracted record, e.g.
+    "This will have remove friend CTA". A field with any is only partly in the tables.
+    """
+    covered = {(r['field'], n) for r in records for n in range(r['line'], r['end'] + 1)}
+    uncovered: Dict[str, List[int]] = {}
+    for n, line in enumerate(content.split('\n'), 1):
+        text = line.strip().lower()
+        if not text or _MOCK_LINK_RE.match(text):
+            continue
+        if _BULLET_RE.match(text) and _match_field(_BULLET_RE.sub("", text)):
+            # Table-of-contents entry such as "● Tracking Requirements"
+            continue
+        for field, pattern in _FIELD_QUERY_RES:
+            if pattern.search(text) and (field, n) not in covered:
+                uncovered.setdefault(field, []).append(n)
+    return uncovered
+
+
+class SpecFieldStore:
+    """
+    Field records for the whole corpus, cached on disk next to the context analysis
+    and rebuilt only when the corpus fingerprint changes.
+    """
+
+    def __init__(self, cache_dir: str = "../data/context_cache"):
+        self.cache_dir = cache_dir
+        self.cache_file = os.path.join(cache_dir, "spec_fields.json")
+        self.version: Optional[str] = None
+        self.records: List[Dict] = []
+        self.sources: List[str] = []
+        # source -> field -> lines mentioning the field that no record covers
+        self.uncovered: Dict[str, Dict[str, List[int]]] = {}
+
+    def build(self, docs: List[Dict]) -> None:
+        """Extract fields from the documents, reusing the on-disk tables if the specs are unchanged."""
+        version = DocumentParser.corpus_fingerprint(docs)
+        if version == self.version:
+            return
+        records = uncovered = None
+        if os.path.exists(self.cache_file):
+            try:
+                with open(self.cache_file, 'r') as f:
+                    cached = json.load(f)
+                if cached.get("version") == version and cached.get("format") == FIELDS_FORMAT:
+                    records, uncovered = cached["records"], cached["uncovered"]
+            except Exception as e:
+                print(f"[FIELDS] Ignoring unreadable cache {self.cache_file}: {e}")
+
+        if records is None:
+            records, uncovered = [], {}
+            for doc in docs:
+                doc_records = extract_fields(doc['filename'], doc['content'])
+                records.extend(doc_records)
+                missed = uncovered_mentions(doc['content'], doc_records)
+                if missed:
+                    uncovered[doc['filename']] = missed
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                tmp_path = self.cache_file + ".tmp"
+                with open(tmp_path, 'w') as f:
+                    json.dump({"format": FIELDS_FORMAT, "version": version, "records": records,
+                               "uncovered": uncovered}, f, indent=2)
+                os.replace(tmp_path, self.cache_file)
+            except Exception as e:
+                print(f"[FIELDS] Could not write cache: {e}")
+
+        self.records = records
+        self.uncovered = uncovered
+        self.sources = sorted({doc['filename'] for doc in docs})
+        self.version = version
+        print(f"[FIELDS] {len(records)} structured fields from {len(docs)} specs")
+
+    def counts(self) -> Dict[str, int]:
+        counts = {field: 0 for field in FIELD_LABELS}
+        for record in self.records:
+            counts[record['field']] += 1
+        return counts
+
+    def query(self, field: Optional[str] = None, source: Optional[str] = None,
+              contains: Optional[str] = None, sources: Optional[List[str]] = None) -> List[Dict]:
+        """Records filtered by field, source (substring of the filename) and value text."""
+        results = []
+        source_lower = source.lower() if source else None
+        contains_lower = contains.lower() if contains else None
+        for record in self.records:
+            if field and record['field'] != field:
+                continue
+            if source_lower and source_lower not in record['source'].lower():
+                continue
+            if sources is not None and record['source'] not in sources:
+                continue
+            if contains_lower and contains_lower not in f"{record['key']} {record['value']}".lower():
+                continue
+            results.append(record)
+        return results
+
+    def _mentioned_sources(self, question: str) -> List[str]:
+        """
+        Specs best matching the question by the distinctive words of their filenames: those naming
+        the largest share of their words (at least half). More than one means the name is ambiguous.
+        """
+        question_tokens = set(tokenize(question))
+        best: List[str] = []
+        best_score = (0.5, 0)
+        for source in self.sources:
+            stem = os.path.splitext(source)[0]
+            name_tokens = {t for t in tokenize(stem) if t.isalpha() and len(t) >= 3 and t not in _GENERIC_NAME_TOKENS}
+            if not name_tokens:
+                continue
+            shared = len(name_tokens & question_tokens)
+            score = (shared / len(name_tokens), shared)
+            if shared and score > best_score:
+                best, best_score = [source], score
+            elif shared and score == best_score:
+                best.append(source)
+        return best
+
+    def match_query(self, question: str) -> Optional[Tuple[str, Optional[List[str]]]]:
+        """
+        (field, [source] or None) when the question is a plain lookup of exactly one field,
+        e.g. "What are the CTAs in Friends V2.1?"; None for anything needing reasoning or
+        naming a spec ambiguously.
+        """
+        text = question.lower()
+        if len(text.split()) > 25 or not _LOOKUP_RE.search(text) or _ANALYSIS_RE.search(text):
+            return None
+        fields = [field for field, pattern in _FIELD_QUERY_RES if pattern.search(text)]
+        if "cta_functionality" in fields:
+            fields.remove("cta")
+        if len(fields) != 1:
+            return None
+        mentioned = self._mentioned_sources(question)
+        if len(mentioned) > 1:
+            return None
+        return fields[0], mentioned or None
+
+    def answer(self, question: str, max_records: int = 60) -> Optional[str]:
+        """
+        Markdown answer built straight from the tables, or None if the question is not a field
+        lookup or the tables cannot answer it completely (the named spec or topic has no records,
+        or a spec in scope mentions the field outside them); the question then goes to the LLM
+        instead of getting a partial list or another spec's answer.
+        """
+        match = self.match_query(question)
+        if not match:
+            return None
+        field, sources = match
+        if any(field in self.uncovered.get(source, {}) for source in (sources or self.sources)):
+            return None
+        records = self.query(field=field, sources=sources)
+        if not records:
+            return None
+        # Narrow to the topic the question names ("surfacing conditions for bulk add")
+        name_tokens = {t for source in (sources or []) for t in tokenize(os.path.splitext(source)[0])}
+        topic = set(tokenize(question)) - _QUERY_FILLER_TOKENS - name_tokens
+        if topic:
+            records = [r for r in records if topic & set(tokenize(f"{r['section']} {r['key']} {r['value']}"))]
+            if not records:
+                return None
+
+        by_source: Dict[str, List[Dict]] = {}
+        for record in records[:max_records]:
+            by_source.setdefault(record['source'], []).append(record)
+
+        parts = [f"### 📋 **{FIELD_LABELS[field]}** (from the extracted spec tables)"]
+        for source, items in by_source.items():
+            parts.append(f"\n**{source}**")
+            for record in items:
+                value = record['value'].replace("\n", "; ")
+                where = f"Section: {record['section']}" if record['section'] else f"Line: {record['line']}"
+                parts.append(f"- *{record['key']}*: {value} [Source: {source}, {where}]")
+        if len(records) > max_records:
+            parts.append(f"\n_...and {len(records) - max_records} more. Use /api/spec-fields for the full table._")
+        return "\n".join(parts)
@@ -0,0 +1,194 @@
+"""
+Deterministic lint rules for specs.
+The spec is parsed once into a section model (title, start line, lowercased text) and every
+registered rule runs over it in a single pass. Patterns are compiled at import time, so a
+full check takes milliseconds and most format feedback needs no LLM call.
+Each alert is { "type", "section", "description", "line" } (line is 1-based, or None).
+"""
+import re
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional
+
+_SECTION_SPLIT_RE = re.compile(r'\n(?=##\s+)')
+_MOCKUP_LABEL_RE = re.compile(r'mock ?up:', re.IGNORECASE)
+_MOCKUP_VALUE_RE = re.compile(r'mockup\s*:\s*(.+?)(?=\n|$)', re.IGNORECASE | re.DOTALL)
+_FIGMA_IMAGE_RE = re.compile(r'figma_image\s*:\s*\d', re.IGNORECASE)
+_POPUP_PRIORITY_RE = re.compile(r'popup\s*priority\s*:')
+_CTA_LINE_RE = re.compile(r'^\W*(?:primary |secondary )?cta\s*:', re.IGNORECASE)
+_CTA_FUNCTIONALITY_RE = re.compile(r'cta\s+(?:functionality|action|behaviou?r)\s*:')
+_PLACEHOLDER_RE = re.compile(r'^\W*(?:tbd|todo|tbc|n/?a|none|-|\[.*\]|<.*>|\.\.\.)\W*$', re.IGNORECASE)
+
+# Sections every spec needs (GeneratorService STRUCTURE); screens and flows need at least one each
+REQUIRED_SECTIONS = [
+    ("Problem statements", re.compile(r'problem', re.IGNORECASE)),
+    ("Vision/Anti-vision", re.compile(r'vision', re.IGNORECASE)),
+    ("Business/Design Goals", re.compile(r'goals?\b', re.IGNORECASE)),
+    ("Opportunities", re.compile(r'opportunit', re.IGNORECASE)),
+    ("Expected Upsides", re.compile(r'upside', re.IGNORECASE)),
+    ("Overview", re.compile(r'overview', re.IGNORECASE)),
+    ("<Screen Name> UI", re.compile(r'\bui\b', re.IGNORECASE)),
+    ("<Flow name> Flow", re.compile(r'\bflow\b', re.IGNORECASE)),
+    ("Edge Cases", re.compile(r'edge\s*cases?', re.IGNORECASE)),
+    ("UI dev requirement", re.compile(r'ui\s*dev', re.IGNORECASE)),
+    ("Sound requirement", re.compile(r'sound', re.IGNORECASE)),
+    ("Experimentation Plan", re.compile(r'experiment', re.IGNORECASE)),
+    ("Tracking requirement", re.compile(r'tracking', re.IGNORECASE)),
+    ("Analysis Plan", re.compile(r'analysis', re.IGNORECASE)),
+    ("Changelog", re.compile(r'change\s*log', re.IGNORECASE)),
+]
+# Lines this short can be a heading in extracted PDF/PPTX text, which has no ## markers
+_HEADING_MAX_CHARS = 60
+
+
+@dataclass
+class Section:
+    title: str
+    start_line: int
+    text: str
+    lower: str = ""
+    lines: List[str] = field(default_factory=list)
+    title_lower: str = ""
+
+    def __post_init__(self):
+        self.lower = self.text.lower()
+        self.lines = self.text.split('\n')
+        self.title_lower = self.title.lower()
+
+    @property
+    def label(self) -> str:
+        return self.title or "(unnamed section)"
+
+    def line_of(self, pattern: "re.Pattern") -> int:
+        """Absolute line of the first line matching pattern (the section start if none does)."""
+        for offset, line in enumerate(self.lines):
+            if pattern.search(line):
+                return self.start_line + offset
+        return self.start_line
+
+    @property
+    def is_ui_section(self) -> bool:
+        return (' ui' in self.title_lower or 'ui ' in self.title_lower
+                or ('header:' in self.lower and ('cta:' in self.lower or 'sub text:' in self.lower)))
+
+
+def parse_sections(spec_content: str) -> List[Section]:
+    """Split a spec into ## sections with their starting line numbers."""
+    sections = []
+    line = 1
+    for block in _SECTION_SPLIT_RE.split(spec_content):
+        first_line = block.split('\n', 1)[0].strip()
+        title = first_line.replace('#', '').strip() if first_line.startswith('#') else ''
+        sections.append(Section(title=title, start_line=line, text=block))
+        line += block.count('\n') + 1
+    return sections
+
+
+SectionRule = Callable[[Section], Iterable[Dict]]
+DocumentRule = Callable[[str, List[Section]], Iterable[Dict]]
+SECTION_RULES: Dict[str, SectionRule] = {}
+DOCUMENT_RULES: Dict[str, DocumentRule] = {}
+
+
+def section_rule(name: str):
+    """Register a rule that runs on every section."""
+    def register(fn: SectionRule) -> SectionRule:
+        SECTION_RULES[name] = fn
+        return fn
+    return register
+
+
+def document_rule(name: str):
+    """Register a rule that runs once per spec over all sections."""
+    def register(fn: DocumentRule) -> DocumentRule:
+        DOCUMENT_RULES[name] = fn
+        return fn
+    return register
+
+
+def _alert(alert_type: str, section: str, description: str, line: Optional[int]) -> Dict:
+    return {"type": alert_type, "section": section, "description": description, "line": line}
+
+
+@section_rule("missing_mock_link")
+def _check_mockup(section: Section) -> Iterable[Dict]:
+    if not _MOCKUP_LABEL_RE.search(section.lower):
+        return
+    # Valid mock link: FIGMA_IMAGE:..., http, or markdown image/link [...](...)
+    mockup_match = _MOCKUP_VALUE_RE.search(section.lower)
+    mockup_value = mockup_match.group(1).strip() if mockup_match else ''
+    has_valid_link = (
+        'figma_image:' in mockup_value or 'http' in mockup_value or '[' in mockup_value
+        or bool(_FIGMA_IMAGE_RE.search(mockup_value))
+    )
+    if not mockup_value or not has_valid_link:
+        yield _alert("missing_mock_link", section.label,
+                     "Mockup is empty or does not contain a valid link (e.g. FIGMA_IMAGE:ID or image URL).",
+                     section.line_of(_MOCKUP_LABEL_RE))
+
+
+@section_rule("missing_popup_priority")
+def _check_popup_priority(section: Section) -> Iterable[Dict]:
+    has_popup_in_title = 'popup' in section.title_lower or 'modal' in section.title_lower
+    has_popup_in_content = 'popup' in section.lower or 'modal' in section.lower
+    if has_popup_in_title or (has_popup_in_content and section.is_ui_section):
+        if not _POPUP_PRIORITY_RE.search(section.lower):
+            yield _alert("missing_popup_priority", section.label,
+                         "Popup/Modal section does not specify Popup Priority (e.g. High/Medium/Low).",
+                         section.start_line)
+
+
+@section_rule("cta_without_functionality")
+def _check_cta_functionality(section: Section) -> Iterable[Dict]:
+    if 'cta' not in section.lower or _CTA_FUNCTIONALITY_RE.search(section.lower):
+        return
+    for offset, line in enumerate(section.lines):
+        if _CTA_LINE_RE.search(line):
+            yield _alert("cta_without_functionality", section.label,
+                         "CTA is defined but the section has no 'CTA functionality:' describing what it does.",
+                         section.start_line + offset)
+            return
+
+
+def _heading_lines(spec_content: str, sections: List[Section]) -> List[tuple]:
+    """(line number, text) of ## titles, or of short lines when the spec has no ## headers."""
+    titled = [(s.start_line, s.title) for s in sections if s.title]
+    if titled:
+        return titled
+    return [(i + 1, line.strip()) for i, line in enumerate(spec_content.split('\n'))
+            if line.strip() and len(line.strip()) <= _HEADING_MAX_CHARS]
+
+
+@document_rule("missing_required_section")
+def _check_required_sections(spec_content: str, sections: List[Section]) -> Iterable[Dict]:
+    headings = _heading_lines(spec_content, sections)
+    for name, pattern in REQUIRED_SECTIONS:
+        if not any(pattern.search(text) for _, text in headings):
+            yield _alert("missing_required_section", name, f"Required section '{name}' was not found.", None)
+
+
+@document_rule("missing_tracking_events")
+def _check_tracking_events(spec_content: str, sections: List[Section]) -> Iterable[Dict]:
+    tracking = [s for s in sections if 'tracking' in s.title_lower]
+    for section in tracking:
+        body = [line for line in section.lines[1:] if line.strip() and not _PLACEHOLDER_RE.match(line.strip())]
+        if not body:
+            yield _alert("missing_tracking_events", section.label,
+                         "Tracking section lists no events (only a heading or placeholders).", section.start_line)
+
+
+def lint_spec(spec_content: str, rules: Optional[Iterable[str]] = None) -> List[Dict]:
+    """Run the registered rules (or only those named) over the spec; alerts in document order."""
+    if not spec_content or not spec_content.strip():
+        return []
+    selected = set(rules) if rules is not None else None
+    section_rules = [fn for name, fn in SECTION_RULES.items() if selected is None or name in selected]
+    document_rules = [fn for name, fn in DOCUMENT_RULES.items() if selected is None or name in selected]
+
+    sections = parse_sections(spec_content)
+    alerts: List[Dict] = []
+    for section in sections:
+        for rule in section_rules:
+            alerts.extend(rule(section))
+    for rule in document_rules:
+        alerts.extend(rule(spec_content, sections))
+    return alerts
@@ -0,0 +1,108 @@
+"""
+Local pre-check of whether a spec prompt is detailed enough to draft from.
+Scores the prompt against the 16 required spec sections (see the STRUCTURE list in
+GeneratorService) using keyword coverage, length and specificity features, plus any
+relevant past Q&A answers. Only clearly sufficient prompts skip the clarifying-question call.
+"""
+import os
+import re
+from typing import Dict, List, Optional
+
+SUFFICIENCY_THRESHOLD = float(os.environ.get("QA_SUFFICIENCY_THRESHOLD", "0.7"))
+# Below this many words a prompt always goes to the LLM, whatever it mentions
+SUFFICIENCY_MIN_WORDS = 120
+# Without any numbers or list structure, every core section needs this many cues (one
+# passing mention each is what a vague "details to be decided" prompt looks like)
+CORE_MIN_CUES = 3
+
+# (section, weight, cue pattern); weight 0 = written by the generator itself, never asked about
+REQUIRED_SECTIONS = [
+    ("Spec Name", 0, None),
+    ("Problem statements", 2, r"problem|pain ?points?|issues?|churn|drop[- ]?offs?|struggl\w*|frustrat\w*|currently|today players"),
+    ("Vision/Anti-vision", 1, r"vision|should feel|want players to|aim is|the goal is|philosophy"),
+    ("Business/Design Goals", 2, r"goals?|kpis?|metrics?|retention|engagement|monetiz\w*|revenue|d1|d7|d30|dau|conversion|arpdau|sessions?"),
+    ("Opportunities", 1, r"opportunit\w*|market|competitors?|benchmarks?|similar to|inspired by|audience|segments?"),
+    ("Expected Upsides", 1, r"upsides?|increase|improve|lift|uplift|boost|expected|impact"),
+    ("Overview", 2, r"core loop|mechanics?|how it works|overview|players? (?:can|will|get|earn|collect|complete|unlock)|progress\w*|rewards?|tiers?"),
+    ("Screen UI", 2, r"screens?|pop-?ups?|buttons?|ctas?|\bui\b|banners?|cards?|icons?|hud|tabs?|modals?|mockups?|figma"),
+    ("Flows", 2, r"flows?|steps?|journey|onboarding|->|→|after (?:the )?player|once (?:the )?player|when (?:the )?player"),
+    ("Edge Cases", 1, r"edge cases?|offline|disconnect\w*|errors?|timeouts?|fallback|what happens if|expire\w*|fails?"),
+    ("UI dev requirement", 1, r"animations?|assets?|vfx|transitions?|layout|art|fonts?|colou?rs?"),
+    ("Sound requirement", 1, r"sounds?|sfx|audio|music|haptics?"),
+    ("Experimentation Plan", 1, r"a/?b|experiments?|variants?|cohorts?|control group|test group|rollout"),
+    ("Tracking requirement", 1, r"tracking|track\w*|events?|analytics|telemetry"),
+    ("Analysis Plan", 1, r"analy[sz]\w*|measure\w*|dashboards?|success criteria|hypothes\w*"),
+    ("Changelog", 0, None),
+]
+_SECTION_RES = [(name, weight, re.compile(rf"\b(?:{pattern})\b", re.IGNORECASE) if pattern else None)
+                for name, weight, pattern in REQUIRED_SECTIONS]
+CORE_SECTIONS = [name for name, weight, _ in REQUIRED_SECTIONS if weight >= 2]
+
+_STRUCTURE_LINE_RE = re.compile(r"^\s*(?:[-*•●]|\d{1,2}[.)]|#{1,4})\s+", re.MULTILINE)
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?%?|\b\d+x\b")
+# Past answers that defer the detail carry no information about the feature
+_DEFERRING_RE = re.compile(r"\b(i will|i'll|leave (?:a )?(?:blank )?space|fill (?:this|that|it|these)|add (?:it|that) manually)\b", re.IGNORECASE)
+
+
+def _is_substantive(answer: str) -> bool:
+    words = answer.split()
+    if len(words) < 8:
+        return False
+    deferring_lines = sum(1 for line in answer.splitlines() if _DEFERRING_RE.search(line))
+    return deferring_lines * 2 < max(1, len([line for line in answer.splitlines() if line.strip()]))
+
+
+def covered_sections(text: str) -> List[str]:
+    """Required sections the text says something about (generator-written sections excluded)."""
+    return [name for name, weight, pattern in _SECTION_RES if pattern is not None and pattern.search(text)]
+
+
+def cue_counts(text: str) -> Dict[str, int]:
+    """Number of cue matches per required section (generator-written sections excluded)."""
+    return {name: len(pattern.findall(text)) for name, weight, pattern in _SECTION_RES if pattern is not None}
+
+
+def assess_prompt(prompt: str, past_answers: Optional[List[str]] = None) -> Dict:
+    """
+    Score prompt completeness in [0, 1].
+    Returns { score, sufficient, covered, missing, covered_by_history, features }.
+    """
+    past_answers = [a for a in (past_answers or []) if _is_substantive(a)]
+    from_prompt = set(covered_sections(prompt))
+    from_history = set(covered_sections("\n".join(past_answers))) - from_prompt if past_answers else set()
+    covered = from_prompt | from_history
+
+    total_weight = sum(weight for _, weight, _ in REQUIRED_SECTIONS)
+    covered_weight = sum(weight for name, weight, _ in REQUIRED_SECTIONS if name in covered)
+    coverage = covered_weight / total_weight
+
+    words = len(prompt.split())
+    structure_lines = len(_STRUCTURE_LINE_RE.findall(prompt))
+    numbers = len(_NUMBER_RE.findall(prompt))
+    length_score = min(words / 300, 1.0)
+    structure_score = min(structure_lines / 8, 1.0)
+    specificity_score = min(numbers / 5, 1.0)
+
+    score = 0.6 * coverage + 0.2 * length_score + 0.1 * structure_score + 0.1 * specificity_score
+    core_missing = [name for name in CORE_SECTIONS if name not in covered]
+    counts = cue_counts("\n".join([prompt] + past_answers))
+    core_cues = min(counts[name] for name in CORE_SECTIONS)
+    # Keyword coverage alone is easy to reach in prose that commits to nothing
+    concrete = numbers > 0 or structure_lines > 0 or core_cues >= CORE_MIN_CUES
+    sufficient = (score >= SUFFICIENCY_THRESHOLD and words >= SUFFICIENCY_MIN_WORDS
+                  and not core_missing and concrete)
+
+    return {
+        "score": round(score, 3),
+        "sufficient": sufficient,
+        "covered": [name for name, weight, _ in REQUIRED_SECTIONS if name in covered],
+        "missing": [name for name, weight, _ in REQUIRED_SECTIONS if weight and name not in covered],
+        "covered_by_history": sorted(from_history),
+        "features": {
+            "words": words,
+            "coverage": round(coverage, 3),
+            "structure_lines": structure_lines,
+            "numbers": numbers,
+            "core_cues": core_cues,
+        },
+    }
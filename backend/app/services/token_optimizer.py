@@ -4,7 +4,6 @@ Uses intelligent summarization, semantic selection, and compression techniques.
 """
 import os
 from typing import List, Dict, Optional
-import google.generativeai as genai
 
 class TokenOptimizer:
     """
@@ -13,11 +12,16 @@ class TokenOptimizer:
     
     def __init__(self, api_key: str = None):
         self.api_key = api_key or os.environ.get("GEMINI_API_KEY")
-        if self.api_key:
+        self._flash_model = None
+
+    @property
+    def flash_model(self):
+        """Gemini Flash model (None without an API key), created on first use like SpecVerifier.model."""
+        if self._flash_model is None and self.api_key:
+            import google.generativeai as genai
             genai.configure(api_key=self.api_key)
-            self.flash_model = genai.GenerativeModel('gemini-2.5-flash')
-        else:
-            self.flash_model = None
+            self._flash_model = genai.GenerativeModel('gemini-2.5-flash')
+        return self._flash_model
     
     def select_relevant_docs(self, prompt: str, docs: List[dict], max_docs: int = 5, max_chars_per_doc: int = 8000) -> List[dict]:
         """
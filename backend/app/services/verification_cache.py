@@ -0,0 +1,49 @@
+"""
+Cache of /api/verify-spec results.
+A result is keyed on the SHA-256 of the uploaded file, the corpus version of the existing specs
+and the verifier version, so re-uploading an unchanged file returns instantly and any change to
+the specs (or to the verifier) invalidates it. Results for older corpus versions are dropped and
+the least recently used entries are evicted beyond VERIFY_CACHE_MAX_ENTRIES.
+"""
+import os
+import hashlib
+from typing import Dict, Optional
+from app.services.history_store import HistoryStore, get_history_store
+
+VERIFY_CACHE_ENABLED = os.environ.get("VERIFY_CACHE_ENABLED", "1") != "0"
+VERIFY_CACHE_MAX_ENTRIES = int(os.environ.get("VERIFY_CACHE_MAX_ENTRIES", "200"))
+
+
+def file_hash(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def is_cacheable_result(result: Dict) -> bool:
+    """Only complete reports: no top-level error and no failed comparisons or passes."""
+    return not result.get("error") and not result.get("errors")
+
+
+class VerificationCache:
+    def __init__(self, store: Optional[HistoryStore] = None, max_entries: int = VERIFY_CACHE_MAX_ENTRIES):
+        self.store = store or get_history_store()
+        self.max_entries = max_entries
+
+    def get(self, content_hash: str, corpus_version: str, verifier_version: str) -> Optional[Dict]:
+        if not VERIFY_CACHE_ENABLED:
+            return None
+        try:
+            return self.store.get_verification(content_hash, corpus_version, verifier_version)
+        except Exception as e:
+            print(f"[VERIFY] Cache lookup failed: {e}")
+            return None
+
+    def put(self, content_hash: str, corpus_version: str, verifier_version: str, filename: str, result: Dict):
+        if not VERIFY_CACHE_ENABLED or not is_cacheable_result(result):
+            return
+        try:
+            self.store.put_verification(content_hash, corpus_version, verifier_version, filename, result)
+            dropped = self.store.prune_verifications(corpus_version, self.max_entries)
+            if dropped:
+                print(f"[VERIFY] Dropped {dropped} stale or least recently used cached results")
+        except Exception as e:
+            print(f"[VERIFY] Could not cache result: {e}")
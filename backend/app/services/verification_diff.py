@@ -0,0 +1,175 @@
+"""
+Section baselines for diff-aware re-verification.
+After a full verification the spec's sections are fingerprinted and every finding is
+attributed to the section it is about. When an edited version is uploaded again (same
+filename, or sharing most of its sections), only the added or changed sections are sent to
+the model; findings attributed to unchanged sections are carried over as they were.
+Baselines are tied to the corpus and verifier version, like the verification result cache.
+"""
+import os
+import re
+import difflib
+import hashlib
+from typing import Dict, List, Optional
+from app.services.history_store import HistoryStore, get_history_store
+from app.services.retrieval import VectorIndex, chunk_document
+
+VERIFY_DIFF_ENABLED = os.environ.get("VERIFY_DIFF_ENABLED", "1") != "0"
+# Above this share of changed text a full verification is cheaper to reason about than a delta
+VERIFY_DIFF_MAX_CHANGED = float(os.environ.get("VERIFY_DIFF_MAX_CHANGED", "0.6"))
+# Share of sections a differently named upload must keep to count as a new version of a baseline
+VERIFY_DIFF_MIN_SHARED = 0.5
+VERIFY_BASELINE_MAX_ENTRIES = int(os.environ.get("VERIFY_BASELINE_MAX_ENTRIES", "100"))
+# Minimum similarity for a finding to be attributed to a section; below it the finding is spec-wide
+ATTRIBUTION_MIN_SCORE = 0.12
+
+ATTRIBUTED_KEYS = ("conflicts", "gaps", "threats", "format_issues", "questions")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def section_fingerprints(spec_content: str) -> List[Dict]:
+    """
+    [{ section, hash, chars, text }] in document order, one per header block (or page of
+    PDF/PPTX text); the hash ignores whitespace-only edits. Unlike retrieval chunks, blocks are
+    never merged or split by size, so an edit cannot shift boundaries into neighbouring sections.
+    """
+    sections = []
+    for chunk in chunk_document("spec", spec_content, max_chars=len(spec_content), min_chars=0):
+        normalized = _WHITESPACE_RE.sub(" ", chunk['text']).strip().lower()
+        sections.append({
+            "section": chunk['section'],
+            "hash": hashlib.sha256(normalized.encode('utf-8')).hexdigest()[:16],
+            "chars": len(chunk['text']),
+            "text": chunk['text'],
+        })
+    return sections
+
+
+def _finding_text(item) -> str:
+    if isinstance(item, dict):
+        return " ".join(str(value) for value in item.values() if isinstance(value, (str, int, float)))
+    return str(item)
+
+
+def attribute_findings(report: Dict, sections: List[Dict]) -> Dict[str, List[Optional[str]]]:
+    """
+    Section hash for every finding in the report (aligned with each list), or None for
+    spec-wide findings. Gaps naming a section title are attributed by name first.
+    """
+    index = VectorIndex()
+    for section in sections:
+        index.add(f"{section['section']}\n{section['text']}", section)
+    by_title = {section['section'].lower(): section['hash'] for section in sections}
+
+    attribution = {}
+    for key in ATTRIBUTED_KEYS:
+        hashes = []
+        for item in report.get(key) or []:
+            named = item.get("section", "").strip().lower() if isinstance(item, dict) and isinstance(item.get("section"), str) else ""
+            if named and named in by_title:
+                hashes.append(by_title[named])
+                continue
+            matches = index.search(_finding_text(item), k=1, min_score=ATTRIBUTION_MIN_SCORE)
+            hashes.append(matches[0][1]['hash'] if matches else None)
+        attribution[key] = hashes
+    return attribution
+
+
+def diff_sections(baseline_sections: List[Dict], sections: List[Dict]) -> Dict:
+    """
+    Changed (added or edited) sections of the new version and the baseline sections removed
+    outright. An edited section is paired with its old version by position, so it is not
+    also reported as removed.
+    """
+    old_hashes = {section['hash'] for section in baseline_sections}
+    new_hashes = {section['hash'] for section in sections}
+    changed = [section for section in sections if section['hash'] not in old_hashes]
+    removed = []
+    matcher = difflib.SequenceMatcher(None, [s['hash'] for s in baseline_sections],
+                                      [s['hash'] for s in sections], autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "delete":
+            removed.extend(baseline_sections[i1:i2])
+        elif tag == "replace":
+            # Old sections beyond the ones replaced by new versions were dropped
+            removed.extend(baseline_sections[i1 + (j2 - j1):i2])
+    total_chars = sum(section['chars'] for section in sections) or 1
+    return {
+        "changed": changed,
+        # A section that only moved keeps its hash and is not removed
+        "removed": [section for section in removed if section['hash'] not in new_hashes],
+        "unchanged_hashes": old_hashes & new_hashes,
+        "changed_fraction": sum(section['chars'] for section in changed) / total_chars,
+    }
+
+
+def carry_over(baseline: Dict, unchanged_hashes: set) -> Dict:
+    """Baseline findings still valid for the new version: spec-wide ones and those on unchanged sections."""
+    report = baseline["report"]
+    carried = {}
+    for key in ATTRIBUTED_KEYS:
+        items = report.get(key) or []
+        hashes = baseline["attribution"].get(key) or [None] * len(items)
+        carried[key] = [item for item, section_hash in zip(items, hashes)
+                        if section_hash is None or section_hash in unchanged_hashes]
+    carried["summary"] = report.get("summary", "")
+    return carried
+
+
+def delta_content(sections: List[Dict], changed: List[Dict]) -> str:
+    """What the model sees on re-verification: the outline of the spec plus the changed sections in full."""
+    changed_hashes = {section['hash'] for section in changed}
+    outline = "\n".join(
+        f"- {section['section']}{' (CHANGED)' if section['hash'] in changed_hashes else ''}" for section in sections
+    )
+    body = "\n\n".join(section['text'] for section in changed)
+    return (
+        "NOTE: This is a re-verification. The rest of the spec was already reviewed; only the sections "
+        "marked CHANGED are included below. Report findings about these sections only.\n\n"
+        f"OUTLINE OF THE FULL SPEC:\n{outline}\n\nCHANGED SECTIONS:\n{body}"
+    )
+
+
+class VerificationBaselines:
+    def __init__(self, store: Optional[HistoryStore] = None, max_entries: int = VERIFY_BASELINE_MAX_ENTRIES):
+        self.store = store or get_history_store()
+        self.max_entries = max_entries
+
+    def find(self, filename: str, sections: List[Dict], corpus_version: str, verifier_version: str) -> Optional[Dict]:
+        """Baseline of an earlier version of this spec: same filename, else the one sharing most sections."""
+        if not VERIFY_DIFF_ENABLED:
+            return None
+        try:
+            baselines = self.store.list_baselines(corpus_version, verifier_version)
+        except Exception as e:
+            print(f"[VERIFY] Could not load baselines: {e}")
+            return None
+        for baseline in baselines:
+            if baseline["filename"] == filename:
+                return baseline
+        hashes = {section['hash'] for section in sections}
+        best, best_shared = None, 0.0
+        for baseline in baselines:
+            old_hashes = {section['hash'] for section in baseline["sections"]}
+            shared = len(hashes & old_hashes) / max(len(hashes | old_hashes), 1)
+            if shared > best_shared:
+                best, best_shared = baseline, shared
+        return best if best_shared >= VERIFY_DIFF_MIN_SHARED else None
+
+    def save(self, filename: str, sections: List[Dict], corpus_version: str, verifier_version: str, report: Dict):
+        """Remember the sections (without their text) and the attributed findings of a complete report."""
+        if not VERIFY_DIFF_ENABLED or report.get("error") or report.get("errors"):
+            return
+        stored_report = {key: report.get(key) or [] for key in ATTRIBUTED_KEYS}
+        stored_report["summary"] = report.get("summary", "")
+        stored_report["related_specs"] = report.get("related_specs") or []
+        baseline = {
+            "sections": [{key: section[key] for key in ("section", "hash", "chars")} for section in sections],
+            "report": stored_report,
+            "attribution": attribute_findings(report, sections),
+        }
+        try:
+            self.store.put_baseline(filename, corpus_version, verifier_version, baseline)
+            self.store.prune_baselines(corpus_version, self.max_entries)
+        except Exception as e:
+            print(f"[VERIFY] Could not save baseline: {e}")
@@ -1,74 +1,133 @@
 import os
 import re
-import google.generativeai as genai
-from app.services.parser import DocumentParser
-from typing import Dict, List, Optional
+import json
+import concurrent.futures
+from collections import defaultdict
+from app.services.retrieval import VectorIndex, chunk_document
+from app.services.spec_lint import lint_spec
+from app.services.verification_diff import (
+    VERIFY_DIFF_MAX_CHANGED, carry_over, delta_content, diff_sections, section_fingerprints
+)
+from typing import Dict, List, Optional, Tuple
 
-def _check_mock_links_and_popup_priority(spec_content: str) -> List[Dict]:
+VERIFY_MODEL = 'gemini-2.5-flash'
+# Bump when prompts, lint rules or the report shape change; cached verification results are keyed on it
+VERIFIER_VERSION = "3"
+# "mapreduce": compare against each relevant spec separately; "single": one prompt with every spec truncated
+VERIFY_MODE = os.environ.get("VERIFY_MODE", "mapreduce")
+VERIFY_MAX_RELATED_SPECS = int(os.environ.get("VERIFY_MAX_RELATED_SPECS", "6"))
+VERIFY_MAX_CONCURRENCY = int(os.environ.get("VERIFY_MAX_CONCURRENCY", "4"))
+# Minimum summed section similarity for an existing spec to count as related
+VERIFY_MIN_RELEVANCE = 0.15
+SPEC_MAX_CHARS = 50000
+RELATED_SPEC_MAX_CHARS = 60000
+# Single-prompt mode: per-spec and total caps on the concatenated corpus
+SINGLE_MODE_SPEC_CHARS = 5000
+SINGLE_MODE_CONTEXT_CHARS = 200000
+
+# "combined": one spec review call; "per_dimension": one focused call per report section, run concurrently
+VERIFY_PASSES = os.environ.get("VERIFY_PASSES", "combined")
+
+REPORT_LIST_KEYS = ("conflicts", "gaps", "threats", "format_issues", "questions")
+
+# Per-dimension passes over the spec alone: (instructions, item shape). Conflicts need other specs
+# and come from the pairwise comparisons (or a conflicts pass over the corpus in single mode).
+DIMENSION_PASSES = {
+    "gaps": (
+        "Identify missing information or incomplete sections: missing required sections, incomplete feature "
+        "descriptions, missing edge cases, unclear requirements, missing technical specifications.",
+        '{"section": "Section name", "description": "What\'s missing", "impact": "High/Medium/Low"}',
+    ),
+    "threats": (
+        "Identify risks and potential issues: technical, user experience and business risks, "
+        "implementation challenges, scalability concerns.",
+        '{"type": "Technical Risk", "description": "...", "severity": "High/Medium/Low", "recommendation": "How to mitigate"}',
+    ),
+    "format_issues": (
+        "Evaluate adherence to spec format standards: missing required sections (Problem statements, Vision, "
+        "Goals, etc.), incorrect formatting, inconsistent structure, missing UI/Flow documentation.",
+        '{"issue": "Missing section", "description": "...", "recommendation": "How to fix"}',
+    ),
+    "questions": (
+        "Generate clarifying questions about ambiguous requirements and missing details, and give a short "
+        "overall assessment of the spec as \"summary\".",
+        '"Question?"',
+    ),
+}
+
+
+def _empty_report(**extra) -> Dict:
+    report = {key: [] for key in REPORT_LIST_KEYS}
+    report.update(extra)
+    return report
+
+
+def _parse_json_object(text: str) -> Optional[Dict]:
+    """First JSON object in a model response (fenced or bare), or None if there is none."""
+    fenced = re.search(r"```(?:json)?\s*(\{.*?\})\s*```", text, re.DOTALL)
+    candidates = [fenced.group(1)] if fenced else []
+    json_match = re.search(r'\{.*\}', text, re.DOTALL)
+    if json_match:
+        candidates.append(json_match.group(0))
+    for candidate in candidates:
+        try:
+            parsed = json.loads(candidate)
+            if isinstance(parsed, dict):
+                return parsed
+        except ValueError:
+            continue
+    return None
+
+
+def _parse_pass_items(text: str, key: str) -> List:
     """
-    Scan spec text for missing Mock Link and missing Popup Priority.
-    Returns a list of alerts: { "type": "missing_mock_link" | "missing_popup_priority", "section": str, "description": str }
+    Items for one report section from a focused pass, tolerating the usual response shapes:
+    {"key": [...]}, a bare JSON array, or a broken array whose complete objects are salvaged.
     """
-    alerts = []
-    if not spec_content or not spec_content.strip():
-        return alerts
-
-    # Split into sections by ## headers
-    sections = re.split(r'\n(?=##\s+)', spec_content)
-    
-    for block in sections:
-        lines = block.split('\n')
-        if not lines:
+    parsed = _parse_json_object(text)
+    if parsed is not None and isinstance(parsed.get(key), list):
+        return parsed[key]
+    array_match = re.search(r'\[.*\]', text, re.DOTALL)
+    if array_match:
+        try:
+            items = json.loads(array_match.group(0))
+            if isinstance(items, list):
+                return items
+        except ValueError:
+            pass
+    salvaged = []
+    for candidate in re.findall(r'\{[^{}]*\}', text):
+        try:
+            salvaged.append(json.loads(candidate))
+        except ValueError:
             continue
-        first_line = lines[0].strip()
-        # Section title: ## Something UI or ## Something Popup
-        section_title = first_line.replace('#', '').strip() if first_line.startswith('#') else ''
-        block_text = block.lower()
-        has_mockup_label = 'mockup:' in block_text or 'mock up:' in block_text
-        has_popup_in_title = 'popup' in section_title.lower() or 'modal' in section_title.lower()
-        has_popup_in_content = 'popup' in block_text or 'modal' in block_text
-        
-        # Check Mock Link: UI-like section (has Header/CTA or "UI" in title) should have a valid mockup
-        is_ui_section = ' ui' in section_title.lower() or 'ui ' in section_title.lower() or ('header:' in block_text and ('cta:' in block_text or 'sub text:' in block_text))
-        if is_ui_section or has_mockup_label:
-            # Valid mock link: FIGMA_IMAGE:..., http, or markdown image/link [...](...)
-            mockup_match = re.search(r'mockup\s*:\s*(.+?)(?=\n|$)', block_text, re.IGNORECASE | re.DOTALL)
-            mockup_value = (mockup_match.group(1).strip() if mockup_match else '').strip()
-            has_valid_link = (
-                'figma_image:' in mockup_value or
-                'http' in mockup_value or
-                '[' in mockup_value
-            ) or bool(re.search(r'figma_image\s*:\s*\d', mockup_value, re.IGNORECASE))
-            if has_mockup_label and (not mockup_value or not has_valid_link):
-                alerts.append({
-                    "type": "missing_mock_link",
-                    "section": section_title or "(unnamed section)",
-                    "description": "Mockup is empty or does not contain a valid link (e.g. FIGMA_IMAGE:ID or image URL)."
-                })
-        
-        # Check Popup Priority: sections that are popups should have "Popup Priority:"
-        if has_popup_in_title or (has_popup_in_content and is_ui_section):
-            has_popup_priority = bool(re.search(r'popup\s*priority\s*:', block_text))
-            if not has_popup_priority:
-                alerts.append({
-                    "type": "missing_popup_priority",
-                    "section": section_title or "(unnamed section)",
-                    "description": "Popup/Modal section does not specify Popup Priority (e.g. High/Medium/Low)."
-                })
-    
-    return alerts
+    if salvaged:
+        return salvaged
+    raise ValueError(f"no {key} found in response: {text[:200]}")
 
 
 class SpecVerifier:
     def __init__(self):
         self.api_key = os.environ.get("GEMINI_API_KEY")
-        if self.api_key:
+        self._model = None
+
+    @property
+    def model(self):
+        """Gemini model (None without GEMINI_API_KEY), created on first use: importing and
+        configuring google.generativeai takes about a second, which should not delay startup."""
+        if self._model is None and self.api_key:
+            import google.generativeai as genai
             genai.configure(api_key=self.api_key)
-            self.model = genai.GenerativeModel('gemini-2.5-flash')
-        else:
-            self.model = None
+            self._model = genai.GenerativeModel(VERIFY_MODEL)
+        return self._model
+
+    @model.setter
+    def model(self, model):
+        self._model = model
     
-    def verify_spec(self, spec_content: str, spec_filename: str, all_specs_context: str) -> Dict:
+    def verify_spec(self, spec_content: str, spec_filename: str, all_specs_context: str = "",
+                    existing_docs: Optional[List[Dict]] = None, per_dimension: Optional[bool] = None,
+                    baseline: Optional[Dict] = None) -> Dict:
         """
         Verifies a spec against existing specs and checks for:
         - Conflicts
@@ -76,12 +135,332 @@ class SpecVerifier:
         - Potential threats
         - Format/structure issues
         - Clarifying questions
+        With existing_docs (parsed documents) the spec is compared against each related
+        spec separately (VERIFY_MODE="mapreduce"); otherwise all_specs_context is used as one prompt.
+        per_dimension runs one focused pass per report section (default: VERIFY_PASSES).
+        baseline (see VerificationBaselines) is an earlier verified version of this spec: in
+        map-reduce mode only its changed sections are rechecked when the edit is small enough.
         """
         if not self.model:
             return {
                 "error": "GEMINI_API_KEY is not set. Please set it in the environment."
             }
-        
+
+        if per_dimension is None:
+            per_dimension = VERIFY_PASSES == "per_dimension"
+        if existing_docs is not None:
+            if VERIFY_MODE != "single":
+                if baseline is not None:
+                    report = self._verify_changed_sections(spec_content, spec_filename, existing_docs,
+                                                           per_dimension, baseline)
+                    if report is not None:
+                        return report
+                return self._verify_mapreduce(spec_content, spec_filename, existing_docs, per_dimension)
+            all_specs_context = self.build_corpus_context(existing_docs)
+        if per_dimension:
+            return self._verify_single_per_dimension(spec_content, spec_filename, all_specs_context)
+        return self._verify_single(spec_content, spec_filename, all_specs_context)
+
+    @staticmethod
+    def result_version(per_dimension: Optional[bool] = None) -> str:
+        """Everything besides the inputs that determines a report (see VERIFIER_VERSION)."""
+        if per_dimension is None:
+            per_dimension = VERIFY_PASSES == "per_dimension"
+        passes = "per_dimension" if per_dimension else "combined"
+        return f"{VERIFIER_VERSION}:{VERIFY_MODEL}:{VERIFY_MODE}:{passes}:{VERIFY_MAX_RELATED_SPECS}"
+
+    @staticmethod
+    def build_corpus_context(docs: List[Dict]) -> str:
+        """All specs in one string, each truncated (single-prompt mode)."""
+        return "\n\n".join(
+            f"--- SPEC: {doc['filename']} ---\n{doc['content'][:SINGLE_MODE_SPEC_CHARS]}" for doc in docs
+        )
+
+    def _generate_json(self, prompt: str) -> Tuple[Optional[Dict], str]:
+        """Run one model call and parse its JSON object; returns (parsed or None, raw text)."""
+        response = self.model.generate_content(prompt, generation_config={"response_mime_type": "application/json"})
+        text = response.text.strip()
+        return _parse_json_object(text), text
+
+    # --- Per-dimension passes ---
+
+    def _run_dimension_pass(self, key: str, spec_content: str, spec_filename: str) -> Dict:
+        """One focused pass over the spec alone; returns a partial report with just that section."""
+        instructions, item_shape = DIMENSION_PASSES[key]
+        extra = ', "summary": "Overall assessment and key findings"' if key == "questions" else ""
+        prompt = f"""
+# ROLE
+You are an expert spec reviewer and quality assurance specialist for game design specifications.
+
+# SPEC TO VERIFY
+Filename: {spec_filename}
+
+Content:
+{spec_content[:SPEC_MAX_CHARS]}
+
+# TASK
+{instructions}
+Be specific and actionable; reference the spec's sections.
+
+# OUTPUT FORMAT
+JSON only: {{"{key}": [{item_shape}]{extra}}}
+"""
+        response = self.model.generate_content(prompt, generation_config={"response_mime_type": "application/json"})
+        text = response.text.strip()
+        partial = {key: _parse_pass_items(text, key)}
+        if key == "questions":
+            parsed = _parse_json_object(text) or {}
+            partial["summary"] = parsed.get("summary", "")
+        return partial
+
+    def _conflicts_pass(self, spec_content: str, spec_filename: str, all_specs_context: str) -> Dict:
+        """Conflicts against the concatenated corpus (single mode with per-dimension passes)."""
+        prompt = f"""
+# ROLE
+You are an expert spec reviewer. Find conflicts between a game design spec and the existing specs.
+
+# SPEC TO VERIFY
+Filename: {spec_filename}
+{spec_content[:SPEC_MAX_CHARS]}
+
+# CONTEXT: ALL EXISTING SPECS
+{all_specs_context[:SINGLE_MODE_CONTEXT_CHARS]}
+
+# TASK
+List contradictions or conflicts with existing specs: feature conflicts, design inconsistencies,
+technical contradictions, timeline/resource conflicts.
+
+# OUTPUT FORMAT
+JSON only: {{"conflicts": [{{"type": "Feature Conflict", "description": "Detailed description", "severity": "High/Medium/Low", "related_specs": ["spec1.pdf"]}}]}}
+"""
+        response = self.model.generate_content(prompt, generation_config={"response_mime_type": "application/json"})
+        return {"conflicts": _parse_pass_items(response.text.strip(), "conflicts")}
+
+    def _spec_review_tasks(self, spec_content: str, spec_filename: str, per_dimension: bool) -> Dict:
+        """Name -> callable returning a partial report, for the checks that need only the spec."""
+        if not per_dimension:
+            return {"spec review": lambda: self._review_spec_only(spec_content, spec_filename)}
+        return {
+            f"{key} pass": (lambda key=key: self._run_dimension_pass(key, spec_content, spec_filename))
+            for key in DIMENSION_PASSES
+        }
+
+    def _verify_single_per_dimension(self, spec_content: str, spec_filename: str, all_specs_context: str) -> Dict:
+        alerts = lint_spec(spec_content)
+        tasks = self._spec_review_tasks(spec_content, spec_filename, per_dimension=True)
+        tasks["conflicts pass"] = lambda: self._conflicts_pass(spec_content, spec_filename, all_specs_context)
+        partials, errors = self._run_tasks(tasks)
+        report = self._merge_reports(partials)
+        report["alerts"] = alerts
+        self._attach_errors(report, partials, errors)
+        return report
+
+    @staticmethod
+    def _run_tasks(tasks: Dict) -> Tuple[List[Dict], List[str]]:
+        """Run verification calls concurrently; a failed call is reported, the rest still count."""
+        partials, errors = [], []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(VERIFY_MAX_CONCURRENCY, len(tasks)))) as pool:
+            futures = {name: pool.submit(task) for name, task in tasks.items()}
+            for name, future in futures.items():
+                try:
+                    partials.append(future.result())
+                except Exception as e:
+                    errors.append(f"{name} failed: {e}")
+        return partials, errors
+
+    @staticmethod
+    def _attach_errors(report: Dict, partials: List[Dict], errors: List[str]):
+        if errors:
+            print(f"[VERIFY] {len(errors)} verification calls failed")
+            report["errors"] = errors
+            if not partials:
+                report["error"] = f"Verification failed: {errors[0]}"
+
+    # --- Map-reduce verification ---
+
+    @staticmethod
+    def select_related_specs(spec_content: str, existing_docs: List[Dict], spec_filename: str = "",
+                             max_specs: int = VERIFY_MAX_RELATED_SPECS) -> List[Tuple[float, Dict]]:
+        """
+        Existing specs most related to the one being verified, best first.
+        Every section of the new spec queries a section index of the corpus, so overlap
+        deep inside either document counts, not just the opening pages.
+        """
+        index = VectorIndex()
+        for doc in existing_docs:
+            if doc['filename'] == spec_filename:
+                continue
+            for chunk in chunk_document(doc['filename'], doc['content']):
+                index.add(f"{chunk['section']}\n{chunk['text']}", chunk)
+
+        scores: Dict[str, float] = defaultdict(float)
+        for section in chunk_document(spec_filename or "spec", spec_content):
+            for score, chunk in index.search(f"{section['section']}\n{section['text']}", k=5):
+                scores[chunk['source']] += score
+
+        docs_by_name = {doc['filename']: doc for doc in existing_docs}
+        ranked = sorted(((score, name) for name, score in scores.items() if score >= VERIFY_MIN_RELEVANCE), reverse=True)
+        return [(round(score, 3), docs_by_name[name]) for score, name in ranked[:max_specs]]
+
+    def _review_spec_only(self, spec_content: str, spec_filename: str) -> Dict:
+        """Gaps, threats, format issues and questions: these need only the spec itself."""
+        prompt = f"""
+# ROLE
+You are an expert spec reviewer and quality assurance specialist for game design specifications.
+
+# SPEC TO VERIFY
+Filename: {spec_filename}
+
+Content:
+{spec_content[:SPEC_MAX_CHARS]}
+
+# TASK
+Review this spec on its own (conflicts with other specs are checked separately):
+1. GAPS: missing required sections, incomplete feature descriptions, missing edge cases, unclear requirements, missing technical specifications
+2. POTENTIAL THREATS: technical, user experience and business risks, implementation challenges, scalability concerns
+3. FORMAT & STRUCTURE: missing required sections (Problem statements, Vision, Goals, etc.), incorrect formatting, inconsistent structure, missing UI/Flow documentation
+4. CLARIFYING QUESTIONS: ambiguous requirements, missing details, format/structure questions
+
+# OUTPUT FORMAT
+JSON only:
+{{
+    "gaps": [{{"section": "Section name", "description": "What's missing", "impact": "High/Medium/Low"}}],
+    "threats": [{{"type": "Technical Risk", "description": "...", "severity": "High/Medium/Low", "recommendation": "How to mitigate"}}],
+    "format_issues": [{{"issue": "Missing section", "description": "...", "recommendation": "How to fix"}}],
+    "questions": ["Question 1?"],
+    "summary": "Overall assessment and key findings"
+}}
+"""
+        parsed, raw = self._generate_json(prompt)
+        if parsed is None:
+            raise ValueError(f"unparseable review response: {raw[:200]}")
+        return parsed
+
+    def _compare_pair(self, spec_content: str, spec_filename: str, doc: Dict) -> Dict:
+        """Conflicts (and conflict-driven questions) between the spec and one existing spec."""
+        prompt = f"""
+# ROLE
+You are an expert spec reviewer. Compare a NEW game design spec against ONE EXISTING spec and find conflicts between them.
+
+# NEW SPEC
+Filename: {spec_filename}
+{spec_content[:SPEC_MAX_CHARS]}
+
+# EXISTING SPEC
+Filename: {doc['filename']}
+{doc['content'][:RELATED_SPEC_MAX_CHARS]}
+
+# TASK
+List every contradiction or conflict between the two specs: feature conflicts, design inconsistencies
+(rules, values, priorities, surfacing, rewards), technical contradictions, timeline/resource conflicts.
+Only report real conflicts backed by both texts; quote the conflicting values. Add questions that must be
+answered to resolve them.
+
+# OUTPUT FORMAT
+JSON only:
+{{
+    "conflicts": [{{"type": "Feature Conflict", "description": "Detailed description", "severity": "High/Medium/Low"}}],
+    "questions": ["Question 1?"]
+}}
+"""
+        parsed, raw = self._generate_json(prompt)
+        if parsed is None:
+            raise ValueError(f"unparseable comparison response: {raw[:200]}")
+        for conflict in parsed.get("conflicts", []):
+            if isinstance(conflict, dict):
+                related = conflict.get("related_specs") or []
+                if doc['filename'] not in related:
+                    conflict["related_specs"] = [doc['filename']] + list(related)
+        return parsed
+
+    def confirm_conflicts(self, doc: Dict, other: Dict) -> Dict:
+        """Conflicts between two existing specs (candidate pairs of the bulk corpus audit)."""
+        return self._compare_pair(doc['content'], doc['filename'], other)
+
+    def _verify_mapreduce(self, spec_content: str, spec_filename: str, existing_docs: List[Dict],
+                          per_dimension: bool = False) -> Dict:
+        """Spec-only review plus one comparison per related spec, run concurrently, merged into one report."""
+        alerts = lint_spec(spec_content)
+        related = self.select_related_specs(spec_content, existing_docs, spec_filename)
+        print(f"[VERIFY] Comparing {spec_filename} against {len(related)} related specs: "
+              f"{', '.join(doc['filename'] for _, doc in related) or 'none'}")
+
+        tasks = self._spec_review_tasks(spec_content, spec_filename, per_dimension)
+        for _, doc in related:
+            tasks[f"comparison with {doc['filename']}"] = (
+                lambda doc=doc: self._compare_pair(spec_content, spec_filename, doc)
+            )
+        partials, errors = self._run_tasks(tasks)
+
+        report = self._merge_reports(partials)
+        report["alerts"] = alerts
+        report["related_specs"] = [{"filename": doc['filename'], "score": score} for score, doc in related]
+        self._attach_errors(report, partials, errors)
+        return report
+
+    def _verify_changed_sections(self, spec_content: str, spec_filename: str, existing_docs: List[Dict],
+                                 per_dimension: bool, baseline: Dict) -> Optional[Dict]:
+        """
+        Recheck only the sections added or edited since the baseline and carry the other findings over.
+        Returns None when too much changed, so the caller runs a full verification instead.
+        """
+        sections = section_fingerprints(spec_content)
+        diff = diff_sections(baseline["sections"], sections)
+        if diff["changed_fraction"] > VERIFY_DIFF_MAX_CHANGED:
+            print(f"[VERIFY] {diff['changed_fraction']:.0%} of {spec_filename} changed, verifying in full")
+            return None
+
+        changed = diff["changed"]
+        print(f"[VERIFY] Re-verifying {len(changed)} of {len(sections)} sections of {spec_filename} "
+              f"(baseline: {baseline['filename']})")
+        carried = carry_over(baseline, diff["unchanged_hashes"])
+        related = []
+        partials, errors = [], []
+        if changed:
+            delta = delta_content(sections, changed)
+            changed_text = "\n\n".join(section['text'] for section in changed)
+            related = self.select_related_specs(changed_text, existing_docs, spec_filename)
+            tasks = self._spec_review_tasks(delta, spec_filename, per_dimension)
+            for _, doc in related:
+                tasks[f"comparison with {doc['filename']}"] = (
+                    lambda doc=doc: self._compare_pair(delta, spec_filename, doc)
+                )
+            partials, errors = self._run_tasks(tasks)
+
+        # Carried findings first, so the whole-spec summary of the baseline is kept
+        report = self._merge_reports([carried] + partials)
+        report["alerts"] = lint_spec(spec_content)
+        related_specs = {item['filename']: item for item in baseline["report"].get("related_specs", [])}
+        for score, doc in related:
+            related_specs.setdefault(doc['filename'], {"filename": doc['filename'], "score": score})
+        report["related_specs"] = list(related_specs.values())
+        report["diff"] = {
+            "baseline": baseline["filename"],
+            "changed_sections": [section['section'] for section in changed],
+            "removed_sections": [section['section'] for section in diff["removed"]],
+            "carried_over": sum(len(carried[key]) for key in REPORT_LIST_KEYS),
+        }
+        self._attach_errors(report, partials, errors)
+        return report
+
+    @staticmethod
+    def _merge_reports(partials: List[Dict]) -> Dict:
+        """Combine partial reports into the standard schema, dropping duplicate findings."""
+        report = _empty_report(summary=next((p["summary"] for p in partials if p.get("summary")), ""))
+        seen = set()
+        for part in partials:
+            for key in REPORT_LIST_KEYS:
+                for item in part.get(key) or []:
+                    fingerprint = (key, json.dumps(item, sort_keys=True).lower() if isinstance(item, dict) else str(item).strip().lower())
+                    if fingerprint in seen:
+                        continue
+                    seen.add(fingerprint)
+                    report[key].append(item)
+        return report
+
+    # --- Single-prompt verification ---
+
+    def _verify_single(self, spec_content: str, spec_filename: str, all_specs_context: str) -> Dict:
         prompt = f"""
 # ROLE
 You are an expert spec reviewer and quality assurance specialist. Your role is to analyze game design specifications for conflicts, gaps, threats, and structural issues.
@@ -90,10 +469,10 @@ You are an expert spec reviewer and quality assurance specialist. Your role is t
 Filename: {spec_filename}
 
 Content:
-{spec_content[:50000]}  # Limit to avoid token limits
+{spec_content[:SPEC_MAX_CHARS]}  # Limit to avoid token limits
 
 # CONTEXT: ALL EXISTING SPECS
-{all_specs_context[:200000]}  # Limit context to stay within token limits
+{all_specs_context[:SINGLE_MODE_CONTEXT_CHARS]}  # Limit context to stay within token limits
 
 # TASK
 Analyze the provided spec and provide a comprehensive verification report covering:
@@ -175,14 +554,11 @@ Be thorough, specific, and actionable. Reference specific sections and existing
         
         try:
             # Alerts for missing Mock Link and Popup Priority (from content scan)
-            alerts = _check_mock_links_and_popup_priority(spec_content)
+            alerts = lint_spec(spec_content)
 
             response = self.model.generate_content(prompt)
             result_text = response.text.strip()
             
-            # Try to extract JSON from the response
-            import json
-            
             # Find JSON in the response
             json_match = re.search(r'\{.*\}', result_text, re.DOTALL)
             if json_match:
@@ -209,6 +585,6 @@ Be thorough, specific, and actionable. Reference specific sections and existing
                 "threats": [],
                 "format_issues": [],
                 "questions": [],
-                "alerts": _check_mock_links_and_popup_priority(spec_content) if spec_content else []
+                "alerts": lint_spec(spec_content) if spec_content else []
             }
 
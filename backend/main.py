@@ -1,12 +1,17 @@
 import os
+import json
+import asyncio
+import anyio
 from typing import List, Optional
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from dotenv import load_dotenv
-from app.services.generator import GeneratorService
+from app.services.generator import (
+    GeneratorService, BATCH_MAX_CONCURRENCY, BATCH_CONCURRENCY_LIMIT, BATCH_MAX_PROMPTS, MESSAGE_BATCH_MAX_PROMPTS
+)
 from app.services.parser import DocumentParser
 from app.services.analyzer import EdgeCaseAnalyzer
 
@@ -42,6 +47,14 @@ class GenerateRequest(BaseModel):
     prompt: str
     figma_token: Optional[str] = None
     figma_url: Optional[str] = None
+    context_handle: Optional[str] = None  # from /api/analyze; lets generate skip re-analysis
+
+class BatchGenerateRequest(BaseModel):
+    prompts: List[str]
+    figma_token: Optional[str] = None
+    figma_url: Optional[str] = None
+    max_concurrency: int = BATCH_MAX_CONCURRENCY  # clamped to 1..BATCH_CONCURRENCY_LIMIT
+    backend: str = "concurrent"  # "concurrent" or "batches" (Anthropic Message Batches, runs as a background job)
 
 class EnhanceMeetingDataRequest(BaseModel):
     meeting_data: str
@@ -67,14 +80,25 @@ def enhance_meeting_data(request: EnhanceMeetingDataRequest):
 from app.services.pptx_generator import PPTXGenerator
 from app.services.qa_service import QAService
 from app.services.chat_service import SpecChatService
+from app.services.spec_fields import FIELD_LABELS
+from app.services.context_handles import ContextHandleCache
 from app.services.verifier import SpecVerifier
+from app.services.verification_cache import VerificationCache, file_hash
+from app.services.verification_diff import VerificationBaselines, section_fingerprints
+from app.services.corpus_audit import AUDIT_TOP_PAIRS, CorpusAuditService
+from app.services.batch_jobs import BatchJobService
 from app.config import get_anthropic_api_key, set_anthropic_api_key
 import uuid
 
 pptx_generator = PPTXGenerator()
+context_handles = ContextHandleCache()
 qa_service = QAService()
 chat_service = SpecChatService()
 verifier_service = SpecVerifier()
+verification_cache = VerificationCache()
+verification_baselines = VerificationBaselines()
+corpus_audit = CorpusAuditService(verifier_service)
+batch_jobs = BatchJobService()
 
 class QARequest(BaseModel):
     question: str
@@ -82,6 +106,8 @@ class QARequest(BaseModel):
 
 class ChatRequest(BaseModel):
     question: str
+    mode: Optional[str] = None  # "retrieval", "full", "mapreduce", or None for automatic
+    session_id: Optional[str] = None  # per-browser conversation; None uses the shared default session
 
 
 class ApiKeyRequest(BaseModel):
@@ -120,23 +146,26 @@ def check_files():
     }
 
 @app.post("/api/analyze")
-def analyze_prompt(request: GenerateRequest):
+async def analyze_prompt(request: GenerateRequest):
+    """
+    The clarifying-question call (remote) and the corpus analysis + conflict check (local)
+    do not depend on each other, so both start at once: latency is max(LLM, analysis).
+    """
     try:
-        # Analyze prompt and check for conflicts
-        from app.services.context_analyzer import ContextAnalyzer
-        
-        analyzer = ContextAnalyzer()
-        analysis = analyzer.analyze_all_specs(GDDS_DIR, SLIDES_DIR)
-        
-        # Check for conflicts
-        conflicts = analyzer.find_potential_conflicts(request.prompt, analysis)
-        
-        # Get clarifying questions
-        questions = qa_service.analyze_prompt(request.prompt)
+        # Analyze prompt, check for conflicts and select relevant context (kept for /api/generate),
+        # while getting clarifying questions (a local completeness check may skip the LLM call)
+        bundle, clarification = await asyncio.gather(
+            asyncio.to_thread(generator_service.prepare_context_bundle, request.prompt, GDDS_DIR, SLIDES_DIR),
+            asyncio.to_thread(qa_service.clarify, request.prompt),
+        )
+        analysis = bundle["analysis"]
         
         return {
-            "questions": questions,
-            "conflicts": conflicts,
+            "questions": clarification["questions"],
+            "qa_path": clarification["path"],
+            "sufficiency": clarification["sufficiency"],
+            "conflicts": bundle["conflicts"],
+            "context_handle": context_handles.put(bundle),
             "context_stats": {
                 "total_specs": analysis['stats']['total_specs'],
                 "features_found": len(analysis['features'])
@@ -159,67 +188,97 @@ def save_qa(request: QARequest):
 
 @app.post("/api/chat")
 def chat_specs(request: ChatRequest):
-    answer = chat_service.ask_question(request.question)
-    return {"answer": answer}
+    return chat_service.answer_question(request.question, request.mode, request.session_id)
+
+@app.post("/api/chat/stream")
+async def chat_specs_stream(request: ChatRequest, http_request: Request):
+    """
+    Streams the chat answer as Server-Sent Events:
+    data: {"type": "delta", "text": "..."} per chunk, then data: {"type": "done", "cached": bool, "structured": bool}.
+    Closing the connection (or aborting the fetch) stops the upstream generation.
+    """
+    # Table lookups, the answer cache and their history writes are SQLite and TF-IDF work: keep them off the loop
+    structured = await asyncio.to_thread(chat_service.structured_answer, request.question, request.mode, request.session_id)
+    cached = None
+    if structured is None:
+        cached = await asyncio.to_thread(chat_service.cached_answer, request.question, request.mode, request.session_id)
+    if structured is not None or cached is not None:
+        async def local_stream():
+            yield f"data: {json.dumps({'type': 'delta', 'text': structured or cached})}\n\n"
+            done = {'type': 'done', 'cached': cached is not None, 'structured': structured is not None}
+            yield f"data: {json.dumps(done)}\n\n"
+        return StreamingResponse(local_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+    answer_stream = chat_service.stream_answer(request.question, request.mode, request.session_id)
+
+    async def event_stream():
+        try:
+            async for text in answer_stream:
+                if await http_request.is_disconnected():
+                    break
+                yield f"data: {json.dumps({'type': 'delta', 'text': text})}\n\n"
+            yield f"data: {json.dumps({'type': 'done', 'cached': False, 'structured': False})}\n\n"
+        finally:
+            # Shielded so the upstream stream is closed and history saved even when cancelled
+            with anyio.CancelScope(shield=True):
+                await answer_stream.aclose()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/spec-fields")
+def spec_fields(field: Optional[str] = None, source: Optional[str] = None, q: Optional[str] = None):
+    """
+    Structured fields extracted from the specs (unlock/surfacing conditions, popup priority,
+    CTAs, CTA functionality, tracking events), filtered by field, spec name and text.
+    """
+    store = chat_service.spec_fields
+    if field and field not in FIELD_LABELS:
+        raise HTTPException(status_code=400, detail=f"Unknown field '{field}'. Use one of: {', '.join(FIELD_LABELS)}")
+    records = store.query(field=field, source=source, contains=q)
+    return {"fields": FIELD_LABELS, "counts": store.counts(), "count": len(records), "records": records}
 
 @app.post("/api/clear-chat")
-def clear_chat():
-    chat_service.clear_history()
+def clear_chat(session_id: Optional[str] = None):
+    chat_service.clear_history(session_id)
     return {"status": "cleared"}
 
 from fastapi import UploadFile, File, Form
 
 @app.post("/api/upload-context")
 async def upload_context(file: UploadFile = File(...), description: str = Form(...)):
+    content = await file.read()
+    # File writes run in a worker thread so the event loop keeps serving other requests
+    await asyncio.to_thread(_save_context_upload, file.filename, content, description)
+    return {"status": "success", "filename": file.filename}
+
+
+def _save_context_upload(filename: str, content: bytes, description: str):
     # Save file
-    file_path = os.path.join(CONTEXT_UPLOADS_DIR, file.filename)
+    file_path = os.path.join(CONTEXT_UPLOADS_DIR, filename)
     with open(file_path, "wb") as f:
-        content = await file.read()
         f.write(content)
     
     # Save description (simple sidecar text file)
     desc_path = file_path + ".desc.txt"
     with open(desc_path, "w") as f:
         f.write(description)
-        
-    return {"status": "success", "filename": file.filename}
 
 @app.post("/api/verify-spec")
-async def verify_spec(file: UploadFile = File(...)):
+async def verify_spec(file: UploadFile = File(...), passes: Optional[str] = Form(None)):
     """
     Verifies a spec (PDF or PPT) against existing specs.
     Checks for conflicts, gaps, threats, and format issues.
+    passes: "per_dimension" runs one focused check per report section, "combined" one review call.
     """
     try:
-        # Save uploaded file temporarily
-        import tempfile
-        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.filename)[1]) as tmp_file:
-            content = await file.read()
-            tmp_file.write(content)
-            tmp_path = tmp_file.name
-        
-        # Parse the spec file
-        spec_content = DocumentParser.parse_file(tmp_path)
-        
-        # Load all existing specs for context
-        all_gdds = DocumentParser.load_documents_from_dir(GDDS_DIR)
-        all_slides = DocumentParser.load_documents_from_dir(SLIDES_DIR)
-        
-        # Build context string from all specs
-        context_parts = []
-        for doc in all_gdds + all_slides:
-            context_parts.append(f"--- SPEC: {doc['filename']} ---\n{doc['content'][:5000]}")  # Limit each spec
-        
-        all_specs_context = "\n\n".join(context_parts)
-        
-        # Verify the spec
-        result = verifier_service.verify_spec(spec_content, file.filename, all_specs_context)
-        
-        # Clean up temp file
-        os.unlink(tmp_path)
-        
-        return result
-        
+        content = await file.read()
+        per_dimension = {"per_dimension": True, "combined": False}.get(passes)
+        # Parsing, corpus loading and the model calls all block: run them in a worker thread
+        return await asyncio.to_thread(_verify_upload, content, file.filename, per_dimension)
     except Exception as e:
         return {
             "error": f"Verification failed: {str(e)}",
@@ -231,6 +290,65 @@ async def verify_spec(file: UploadFile = File(...)):
             "alerts": []
         }
 
+def _verify_upload(content: bytes, filename: str, per_dimension: Optional[bool]) -> dict:
+    """Blocking part of /api/verify-spec (cache lookup, parsing, verification)."""
+    # Unchanged upload against unchanged specs: reuse the previous report
+    content_hash = file_hash(content)
+    corpus_version = DocumentParser.directory_fingerprint([GDDS_DIR, SLIDES_DIR])
+    verifier_version = verifier_service.result_version(per_dimension)
+    cached = verification_cache.get(content_hash, corpus_version, verifier_version)
+    if cached is not None:
+        print(f"[VERIFY] Cache hit for {filename}")
+        return {**cached, "cached": True}
+
+    # Save uploaded file temporarily
+    import tempfile
+    with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(filename)[1]) as tmp_file:
+        tmp_file.write(content)
+        tmp_path = tmp_file.name
+    
+    # Parse the spec file
+    spec_content = DocumentParser.parse_file(tmp_path)
+    
+    # Load all existing specs for context
+    all_gdds = DocumentParser.load_documents_from_dir(GDDS_DIR)
+    all_slides = DocumentParser.load_documents_from_dir(SLIDES_DIR)
+    
+    # An earlier verified version of this spec lets only the changed sections be rechecked
+    sections = section_fingerprints(spec_content)
+    baseline = verification_baselines.find(filename, sections, corpus_version, verifier_version)
+
+    # Verify the spec (compared against each related spec in full, see VERIFY_MODE)
+    result = verifier_service.verify_spec(spec_content, filename, existing_docs=all_gdds + all_slides,
+                                          per_dimension=per_dimension, baseline=baseline)
+    
+    # Clean up temp file
+    os.unlink(tmp_path)
+
+    verification_cache.put(content_hash, corpus_version, verifier_version, filename, result)
+    verification_baselines.save(filename, sections, corpus_version, verifier_version, result)
+    return {**result, "cached": False}
+
+class CorpusAuditRequest(BaseModel):
+    top_k: int = AUDIT_TOP_PAIRS  # candidate pairs sent to the model for confirmation
+
+@app.post("/api/corpus-audit")
+def start_corpus_audit(request: CorpusAuditRequest = CorpusAuditRequest()):
+    """
+    Start a bulk audit of every spec against every other (runs in the background).
+    Poll /api/corpus-audit/{job_id}; an audit already running is returned instead of a new one.
+    """
+    if request.top_k < 1:
+        raise HTTPException(status_code=400, detail="top_k must be at least 1.")
+    return corpus_audit.start([GDDS_DIR, SLIDES_DIR], top_k=request.top_k)
+
+@app.get("/api/corpus-audit/{job_id}")
+def corpus_audit_status(job_id: str):
+    job = corpus_audit.status(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown audit job.")
+    return job
+
 @app.post("/api/refresh-context")
 def refresh_context():
     """Force refresh the context analysis cache."""
@@ -258,40 +376,15 @@ def generate_gdd(request: GenerateRequest):
             GDDS_DIR,
             SLIDES_DIR,
             EDGE_CASES_DIR,
-            CONTEXT_UPLOADS_DIR
+            CONTEXT_UPLOADS_DIR,
+            context_bundle=context_handles.get(request.context_handle)
         )
         
         # Check if generation failed due to API key
         if gdd_markdown.startswith("Error:"):
             raise HTTPException(status_code=400, detail=gdd_markdown)
         
-        # Clean HTML tags from markdown for display (but keep original for PPTX)
-        import re
-        # Remove all HTML tags including <b>, </b>, etc. - no bolding needed
-        gdd_markdown_clean = re.sub(r'<[^>]+>', '', gdd_markdown)
-        
-        # 2. Convert to PPTX (use original markdown with HTML tags for PPTX generation)
-        filename = f"gdd_{uuid.uuid4()}.pptx"
-        output_path = os.path.join("static/generated", filename)
-        full_output_path = os.path.join(os.path.dirname(__file__), output_path)
-        
-        # Ensure directory exists
-        os.makedirs(os.path.dirname(full_output_path), exist_ok=True)
-        
-        # Find template
-        template_path = None
-        if os.path.exists(SLIDES_DIR):
-            for f in os.listdir(SLIDES_DIR):
-                if f.endswith(".pptx") and not f.startswith("~"):
-                    template_path = os.path.join(SLIDES_DIR, f)
-                    break
-            
-        pptx_generator.create_presentation(gdd_markdown, full_output_path, template_path)
-        
-        return {
-            "gdd": gdd_markdown_clean,  # Return cleaned markdown for display
-            "pptx_url": f"/static/generated/{filename}"
-        }
+        return _build_gdd_response(gdd_markdown)
     except HTTPException:
         raise
     except Exception as e:
@@ -301,3 +394,100 @@ def generate_gdd(request: GenerateRequest):
         if "quota" in error_msg.lower() or "429" in error_msg or "Quota exceeded" in error_msg:
             raise HTTPException(status_code=429, detail=f"API quota exceeded. {error_msg[:300]}")
         raise HTTPException(status_code=500, detail=f"Generation failed: {error_msg[:300]}")
+
+
+@app.post("/api/generate-batch")
+def generate_gdd_batch(request: BatchGenerateRequest):
+    """
+    Generates several specs from one shared context-assembly pass.
+    backend="concurrent" returns per-item results in request order; failed items carry an error
+    instead of a PPTX. backend="batches" returns a job at once: poll /api/generate-batch/{job_id}
+    until it is done, its result then has the same shape.
+    """
+    if not request.prompts:
+        raise HTTPException(status_code=400, detail="No prompts provided.")
+    if request.backend not in ("concurrent", "batches"):
+        raise HTTPException(status_code=400, detail="backend must be 'concurrent' or 'batches'.")
+    max_prompts = MESSAGE_BATCH_MAX_PROMPTS if request.backend == "batches" else BATCH_MAX_PROMPTS
+    if len(request.prompts) > max_prompts:
+        raise HTTPException(status_code=400, detail=f"At most {max_prompts} prompts per request with the {request.backend} backend.")
+    max_concurrency = min(max(1, request.max_concurrency), BATCH_CONCURRENCY_LIMIT)
+
+    if request.backend == "batches":
+        job = batch_jobs.start(lambda progress: _run_generate_batch(request, max_concurrency, progress),
+                               total=len(request.prompts))
+        if job is None:
+            raise HTTPException(status_code=429, detail="Too many batch jobs running. Try again when one has finished.")
+        return job
+    return _run_generate_batch(request, max_concurrency)
+
+@app.get("/api/generate-batch/{job_id}")
+def generate_batch_status(job_id: str):
+    job = batch_jobs.status(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown batch job.")
+    return job
+
+def _run_generate_batch(request: BatchGenerateRequest, max_concurrency: int, progress=lambda **kw: None) -> dict:
+    """Generate the batch and convert each spec to a PPTX."""
+    outputs = generator_service.generate_batch(
+        request.prompts,
+        request.figma_token,
+        request.figma_url,
+        GDDS_DIR,
+        SLIDES_DIR,
+        EDGE_CASES_DIR,
+        CONTEXT_UPLOADS_DIR,
+        max_concurrency=max_concurrency,
+        backend=request.backend,
+        progress=progress
+    )
+
+    progress(stage="converting")
+    results = []
+    for prompt, gdd_markdown in zip(request.prompts, outputs):
+        if gdd_markdown.startswith("Error:"):
+            results.append({"prompt": prompt, "error": gdd_markdown})
+        else:
+            try:
+                results.append({"prompt": prompt, **_build_gdd_response(gdd_markdown)})
+            except Exception as e:
+                results.append({"prompt": prompt, "error": f"PPTX conversion failed: {str(e)[:300]}"})
+        progress(done=len(results))
+
+    return {
+        "results": results,
+        "succeeded": sum(1 for r in results if "error" not in r),
+        "failed": sum(1 for r in results if "error" in r)
+    }
+
+
+def _build_gdd_response(gdd_markdown: str) -> dict:
+    """Convert generated markdown to a PPTX file and return the display payload."""
+    import re
+    # Clean HTML tags from markdown for display (but keep original for PPTX)
+    # Remove all HTML tags including <b>, </b>, etc. - no bolding needed
+    gdd_markdown_clean = re.sub(r'<[^>]+>', '', gdd_markdown)
+
+    # Convert to PPTX (use original markdown with HTML tags for PPTX generation)
+    filename = f"gdd_{uuid.uuid4()}.pptx"
+    output_path = os.path.join("static/generated", filename)
+    full_output_path = os.path.join(os.path.dirname(__file__), output_path)
+
+    # Ensure directory exists
+    os.makedirs(os.path.dirname(full_output_path), exist_ok=True)
+
+    # Find template
+    template_path = None
+    if os.path.exists(SLIDES_DIR):
+        for f in os.listdir(SLIDES_DIR):
+            if f.endswith(".pptx") and not f.startswith("~"):
+                template_path = os.path.join(SLIDES_DIR, f)
+                break
+
+    pptx_generator.create_presentation(gdd_markdown, full_output_path, template_path)
+
+    return {
+        "gdd": gdd_markdown_clean,  # Return cleaned markdown for display
+        "pptx_url": f"/static/generated/{filename}"
+    }
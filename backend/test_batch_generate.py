@@ -0,0 +1,214 @@
+"""
+Batch spec generation against a local fake Anthropic server.
+Covers the bounded-concurrency path, the Message Batches path and /api/generate-batch.
+"""
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from app.config import set_anthropic_api_key
+from app.services.context_analyzer import ContextAnalyzer
+from app.services.generator import GeneratorService
+import app.services.generator as generator_module
+
+
+class FakeAnthropicHandler(BaseHTTPRequestHandler):
+    """Implements just enough of /v1/messages and /v1/messages/batches."""
+    state = {"in_flight": 0, "max_in_flight": 0, "calls": 0, "batches": {}}
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, payload, status=200, content_type="application/json"):
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    @staticmethod
+    def _message(prompt_text):
+        # Echo the user request section so each item is distinguishable
+        request_line = prompt_text.split("# USER REQUEST\n", 1)[1].split("\n", 1)[0]
+        return {
+            "id": "msg_fake",
+            "type": "message",
+            "role": "assistant",
+            "model": "fake",
+            "content": [{"type": "text", "text": f"## {request_line}\n\n## Overview\n- Generated for: {request_line}"}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": {"input_tokens": 1, "output_tokens": 1},
+        }
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if self.path.startswith("/v1/messages/batches"):
+            batch_id = f"msgbatch_{len(self.state['batches'])}"
+            self.state["batches"][batch_id] = [
+                {"custom_id": r["custom_id"], "result": {"type": "succeeded",
+                 "message": self._message(r["params"]["messages"][0]["content"])}}
+                for r in body["requests"]
+            ]
+            return self._send_json(self._batch(batch_id, "in_progress"))
+
+        with self.lock:
+            self.state["calls"] += 1
+            self.state["in_flight"] += 1
+            self.state["max_in_flight"] = max(self.state["max_in_flight"], self.state["in_flight"])
+        time.sleep(0.2)
+        with self.lock:
+            self.state["in_flight"] -= 1
+        self._send_json(self._message(body["messages"][0]["content"]))
+
+    def do_GET(self):
+        batch_id = self.path.split("/v1/messages/batches/", 1)[1].split("/")[0]
+        if self.path.endswith("/results"):
+            lines = "\n".join(json.dumps(r) for r in reversed(self.state["batches"][batch_id]))
+            return self._send_json(lines.encode(), content_type="application/binary")
+        self._send_json(self._batch(batch_id, "ended"))
+
+    def _batch(self, batch_id, status):
+        host, port = self.server.server_address
+        return {
+            "id": batch_id,
+            "type": "message_batch",
+            "processing_status": status,
+            "request_counts": {"processing": 0, "succeeded": 0, "errored": 0, "canceled": 0, "expired": 0},
+            "created_at": "2024-01-01T00:00:00Z",
+            "expires_at": "2024-01-02T00:00:00Z",
+            "ended_at": None,
+            "archived_at": None,
+            "cancel_initiated_at": None,
+            "results_url": f"http://{host}:{port}/v1/messages/batches/{batch_id}/results" if status == "ended" else None,
+        }
+
+
+def _with_fake_server(fn):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeAnthropicHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    old_base_url = os.environ.get("ANTHROPIC_BASE_URL")
+    os.environ["ANTHROPIC_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}"
+    set_anthropic_api_key("sk-test")
+    FakeAnthropicHandler.state.update({"in_flight": 0, "max_in_flight": 0, "calls": 0, "batches": {}})
+    tmp = tempfile.mkdtemp()
+    try:
+        return fn(tmp)
+    finally:
+        set_anthropic_api_key(None)
+        if old_base_url is None:
+            os.environ.pop("ANTHROPIC_BASE_URL", None)
+        else:
+            os.environ["ANTHROPIC_BASE_URL"] = old_base_url
+        server.shutdown()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def _service(tmp):
+    service = GeneratorService()
+    service.context_analyzer = ContextAnalyzer(cache_dir=os.path.join(tmp, "cache"))
+    return service
+
+
+def test_batch_generation_bounded_concurrency():
+    def run(tmp):
+        prompts = [f"Feature {i}" for i in range(6)]
+        results = _service(tmp).generate_batch(prompts, None, None, tmp, tmp, tmp, tmp, max_concurrency=2)
+        assert [r.splitlines()[0] for r in results] == [f"## {p}" for p in prompts]
+        assert FakeAnthropicHandler.state["calls"] == 6
+        assert FakeAnthropicHandler.state["max_in_flight"] == 2
+    _with_fake_server(run)
+
+
+def test_batch_generation_message_batches_backend():
+    def run(tmp):
+        old_interval = generator_module.BATCH_POLL_INTERVAL
+        generator_module.BATCH_POLL_INTERVAL = 0
+        try:
+            prompts = ["Daily quests", "Battle pass", "Friends list"]
+            results = _service(tmp).generate_batch(prompts, None, None, tmp, tmp, tmp, tmp, backend="batches")
+        finally:
+            generator_module.BATCH_POLL_INTERVAL = old_interval
+        # Results arrive out of order from the server and must be matched back by custom_id
+        assert [r.splitlines()[0] for r in results] == [f"## {p}" for p in prompts]
+        assert FakeAnthropicHandler.state["calls"] == 0
+    _with_fake_server(run)
+
+
+def test_generate_batch_endpoint_writes_pptx_per_item():
+    from fastapi.testclient import TestClient
+    import main
+
+    def run(tmp):
+        old_service = main.generator_service
+        main.generator_service = _service(tmp)
+        old_dirs = (main.GDDS_DIR, main.SLIDES_DIR, main.EDGE_CASES_DIR, main.CONTEXT_UPLOADS_DIR)
+        main.GDDS_DIR = main.SLIDES_DIR = main.EDGE_CASES_DIR = main.CONTEXT_UPLOADS_DIR = tmp
+        written = []
+        try:
+            res = TestClient(main.app).post("/api/generate-batch", json={"prompts": ["Spinner", "Seasons"]})
+            data = res.json()
+            written = [r["pptx_url"] for r in data["results"] if "pptx_url" in r]
+            assert res.status_code == 200
+            assert data["succeeded"] == 2 and data["failed"] == 0
+            for url in written:
+                assert os.path.exists(os.path.join(os.path.dirname(main.__file__), url.lstrip("/")))
+        finally:
+            main.generator_service = old_service
+            main.GDDS_DIR, main.SLIDES_DIR, main.EDGE_CASES_DIR, main.CONTEXT_UPLOADS_DIR = old_dirs
+            for url in written:
+                os.remove(os.path.join(os.path.dirname(main.__file__), url.lstrip("/")))
+    _with_fake_server(run)
+
+
+def test_generate_batch_endpoint_runs_message_batches_as_job():
+    from fastapi.testclient import TestClient
+    import main
+
+    def run(tmp):
+        old_service, old_interval = main.generator_service, generator_module.BATCH_POLL_INTERVAL
+        main.generator_service = _service(tmp)
+        generator_module.BATCH_POLL_INTERVAL = 0
+        old_dirs = (main.GDDS_DIR, main.SLIDES_DIR, main.EDGE_CASES_DIR, main.CONTEXT_UPLOADS_DIR)
+        main.GDDS_DIR = main.SLIDES_DIR = main.EDGE_CASES_DIR = main.CONTEXT_UPLOADS_DIR = tmp
+        written = []
+        try:
+            client = TestClient(main.app)
+            too_many = client.post("/api/generate-batch", json={"prompts": ["x"] * (main.BATCH_MAX_PROMPTS + 1)})
+            assert too_many.status_code == 400
+
+            # Returns a job immediately instead of holding the request while the batch processes
+            res = client.post("/api/generate-batch", json={"prompts": ["Spinner", "Seasons"], "backend": "batches"})
+            assert res.status_code == 200 and res.json()["status"] == "running"
+            job_id = res.json()["job_id"]
+            deadline = time.time() + 30
+            while True:
+                job = client.get(f"/api/generate-batch/{job_id}").json()
+                if job["status"] != "running" or time.time() > deadline:
+                    break
+                time.sleep(0.05)
+            assert job["status"] == "done", job
+            written = [r["pptx_url"] for r in job["result"]["results"] if "pptx_url" in r]
+            assert job["result"]["succeeded"] == 2 and job["done"] == 2
+            assert client.get("/api/generate-batch/unknown").status_code == 404
+        finally:
+            main.generator_service = old_service
+            generator_module.BATCH_POLL_INTERVAL = old_interval
+            main.GDDS_DIR, main.SLIDES_DIR, main.EDGE_CASES_DIR, main.CONTEXT_UPLOADS_DIR = old_dirs
+            for url in written:
+                os.remove(os.path.join(os.path.dirname(main.__file__), url.lstrip("/")))
+    _with_fake_server(run)
+
+
+if __name__ == "__main__":
+    test_batch_generation_bounded_concurrency()
+    test_batch_generation_message_batches_backend()
+    test_generate_batch_endpoint_writes_pptx_per_item()
+    test_generate_batch_endpoint_runs_message_batches_as_job()
+    print("All batch generation tests passed.")
@@ -0,0 +1,98 @@
+"""
+Regression check: a running verification or chat lookup must not block the event loop.
+The verifier and the chat table lookup are replaced by slow fakes (no model calls);
+/api/api-key-status is polled while the request is in flight and every poll has to come back quickly.
+"""
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+
+import httpx
+
+import main
+from app.services.history_store import HistoryStore
+from app.services.verification_cache import VerificationCache
+from app.services.verification_diff import VerificationBaselines
+
+VERIFY_SECONDS = 1.5
+MAX_STATUS_SECONDS = 0.3
+
+
+def _slow_verify(spec_content, spec_filename, existing_docs=None, per_dimension=None, baseline=None):
+    time.sleep(VERIFY_SECONDS)
+    return {"summary": "ok", "conflicts": [], "gaps": [], "threats": [], "format_issues": [], "questions": [], "alerts": []}
+
+
+async def _poll_while(send):
+    """Run send(client) and poll the status endpoint until it finishes; (response, poll latencies)."""
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        pending = asyncio.create_task(send(client))
+        await asyncio.sleep(0.1)
+
+        latencies = []
+        while not pending.done():
+            start = time.perf_counter()
+            response = await client.get("/api/api-key-status")
+            latencies.append(time.perf_counter() - start)
+            assert response.status_code == 200
+            await asyncio.sleep(0.1)
+        return await pending, latencies
+
+
+async def _verify_while_polling():
+    response, latencies = await _poll_while(lambda client: client.post(
+        "/api/verify-spec", files={"file": ("new_feature.md", b"## New Feature UI\nHeader: Hi\n")}
+    ))
+    return response.json(), latencies
+
+
+def test_status_stays_fast_during_verification():
+    tmp = tempfile.mkdtemp()
+    saved = (main.GDDS_DIR, main.SLIDES_DIR, main.verification_cache, main.verification_baselines,
+             main.verifier_service.verify_spec)
+    try:
+        # Empty corpus and a throwaway cache; the real data dir is never touched
+        main.GDDS_DIR = os.path.join(tmp, "gdds")
+        main.SLIDES_DIR = os.path.join(tmp, "slides")
+        store = HistoryStore(os.path.join(tmp, "history.db"), legacy_dir=None)
+        main.verification_cache = VerificationCache(store)
+        main.verification_baselines = VerificationBaselines(store)
+        main.verifier_service.verify_spec = _slow_verify
+
+        result, latencies = asyncio.run(_verify_while_polling())
+        assert result["summary"] == "ok", result
+        # Several polls completed while the verification was still running
+        assert len(latencies) >= 5, latencies
+        assert max(latencies) < MAX_STATUS_SECONDS, latencies
+    finally:
+        (main.GDDS_DIR, main.SLIDES_DIR, main.verification_cache, main.verification_baselines,
+         main.verifier_service.verify_spec) = saved
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def test_status_stays_fast_during_chat_lookup():
+    def slow_structured_answer(question, mode=None, session_id=None):
+        time.sleep(VERIFY_SECONDS)
+        return "### CTAs\n- Play"
+
+    saved = main.chat_service.structured_answer
+    try:
+        main.chat_service.structured_answer = slow_structured_answer
+        response, latencies = asyncio.run(_poll_while(lambda client: client.post(
+            "/api/chat/stream", json={"question": "What are the CTAs in Friends V2.1?"}
+        )))
+        assert response.status_code == 200
+        assert "### CTAs" in response.text and '"structured": true' in response.text, response.text
+        assert len(latencies) >= 5, latencies
+        assert max(latencies) < MAX_STATUS_SECONDS, latencies
+    finally:
+        main.chat_service.structured_answer = saved
+
+
+if __name__ == "__main__":
+    test_status_stays_fast_during_verification()
+    test_status_stays_fast_during_chat_lookup()
+    print("All event loop tests passed.")
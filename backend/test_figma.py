@@ -0,0 +1,220 @@
+"""
+FigmaService against a local fake Figma API (pointed at via the base_url override).
+Covers connection reuse, Retry-After and outage handling without batch splitting,
+splitting on bad node ids, incremental (ijson) and fallback parsing of nested
+responses, and get_flows end to end.
+"""
+import json
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import app.services.figma as figma_module
+from app.services.figma import FigmaService, collect_frames
+
+FILE_KEY = "KEY123"
+DOCUMENT = {
+    "id": "0:0", "type": "DOCUMENT", "children": [
+        {"id": "1:1", "name": "Lobby", "type": "CANVAS", "children": [
+            {"id": "2:1", "name": "Home", "type": "FRAME"},
+            {"id": "2:2", "name": "Shop", "type": "FRAME", "transitionNodeID": "2:1"},
+        ]},
+    ],
+}
+FRAME_TEXT = {"2:1": ["Play now"], "2:2": ["Buy coins", "Close"]}
+
+
+class FakeFigmaHandler(BaseHTTPRequestHandler):
+    """Implements just enough of /files, /files/{key}/nodes and /images."""
+    protocol_version = "HTTP/1.1"
+    state = {}
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, payload, status=200, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        query = urllib.parse.parse_qs(url.query)
+        ids = query.get("ids", [""])[0].split(",")
+        with self.lock:
+            self.state["requests"].append({"path": url.path, "ids": ids, "port": self.client_address[1],
+                                           "at": time.monotonic()})
+            rate_limited = url.path.startswith("/v1/images/") and self.state["rate_limit"] > 0
+            if rate_limited:
+                self.state["rate_limit"] -= 1
+
+        if rate_limited:
+            return self._send_json({"status": 429, "err": "Rate limit exceeded"}, 429,
+                                   {"Retry-After": str(self.state["retry_after"])})
+        if url.path.startswith("/v1/images/"):
+            if self.state["outage"]:
+                return self._send_json({"status": 503, "err": "Service unavailable"}, 503)
+            if any(node_id in self.state["bad_ids"] for node_id in ids):
+                return self._send_json({"status": 400, "err": "Invalid node id"}, 400)
+            return self._send_json({"images": {node_id: f"https://img.example/{node_id}.png" for node_id in ids}})
+        if url.path.endswith("/nodes"):
+            nodes = {}
+            for node_id in ids:
+                children = [{"type": "TEXT", "characters": text} for text in FRAME_TEXT.get(node_id, [])]
+                # Frame text buried under nested groups, as in real component-heavy files
+                for depth in range(self.state["nesting"]):
+                    children = [{"type": "GROUP", "name": f"group {depth}", "children": children},
+                                {"type": "TEXT", "characters": f"{node_id} level {depth}"}]
+                nodes[node_id] = {"document": {"id": node_id, "name": node_id, "type": "FRAME", "children": children}}
+            return self._send_json({"nodes": nodes})
+        self._send_json({"version": "7", "document": DOCUMENT})
+
+
+def _with_fake_server(fn, rate_limit=0, retry_after=1, bad_ids=(), nesting=0, outage=False):
+    FakeFigmaHandler.state = {"requests": [], "rate_limit": rate_limit, "retry_after": retry_after,
+                              "bad_ids": set(bad_ids), "nesting": nesting, "outage": outage}
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeFigmaHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    try:
+        return fn(FigmaService("test-token", cache_dir=None, base_url=f"http://{host}:{port}/v1"))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def _image_requests():
+    return [r for r in FakeFigmaHandler.state["requests"] if r["path"].startswith("/v1/images/")]
+
+
+def test_requests_reuse_pooled_connections():
+    def run(service):
+        for _ in range(5):
+            assert service.get_file_version(FILE_KEY) == "7"
+    _with_fake_server(run)
+    ports = {r["port"] for r in FakeFigmaHandler.state["requests"]}
+    assert len(FakeFigmaHandler.state["requests"]) == 5
+    assert len(ports) == 1, f"opened {len(ports)} connections for 5 sequential requests"
+
+
+def test_rate_limit_waits_for_retry_after_without_splitting():
+    node_ids = [f"3:{i}" for i in range(8)]
+    images = _with_fake_server(lambda service: service.get_images(FILE_KEY, node_ids), rate_limit=1, retry_after=1)
+    requests_seen = _image_requests()
+    assert set(images) == set(node_ids)
+    # One rate-limited call and one retry of the same batch, no half-size batches
+    assert len(requests_seen) == 2, [len(r["ids"]) for r in requests_seen]
+    assert all(len(r["ids"]) == len(node_ids) for r in requests_seen)
+    assert requests_seen[1]["at"] - requests_seen[0]["at"] >= 0.95
+
+
+def test_long_retry_after_gives_up_without_splitting():
+    node_ids = [f"3:{i}" for i in range(8)]
+    start = time.monotonic()
+    images = _with_fake_server(lambda service: service.get_images(FILE_KEY, node_ids), rate_limit=1, retry_after=3600)
+    assert images == {}
+    assert len(_image_requests()) == 1
+    assert time.monotonic() - start < 5
+
+
+def test_bad_node_id_splits_batch_and_keeps_the_rest():
+    node_ids = [f"3:{i}" for i in range(10)]
+    images = _with_fake_server(lambda service: service.get_images(FILE_KEY, node_ids), bad_ids={"3:4"})
+    assert set(images) == set(node_ids) - {"3:4"}
+    assert any(r["ids"] == ["3:4"] for r in _image_requests())
+
+
+def test_outage_retries_without_splitting():
+    node_ids = [f"3:{i}" for i in range(8)]
+    saved = figma_module.FIGMA_BACKOFF_BASE
+    figma_module.FIGMA_BACKOFF_BASE = 0.01
+    try:
+        images = _with_fake_server(lambda service: service.get_images(FILE_KEY, node_ids), outage=True)
+    finally:
+        figma_module.FIGMA_BACKOFF_BASE = saved
+    assert images == {}
+    # The same batch retried by _request, never halved into more requests to the failing host
+    requests_seen = _image_requests()
+    assert len(requests_seen) == figma_module.FIGMA_MAX_RETRIES + 1
+    assert all(len(r["ids"]) == len(node_ids) for r in requests_seen)
+
+
+def _nested_frames(service):
+    url = f"{service.BASE_URL}/files/{FILE_KEY}/nodes"
+    return collect_frames(service._stream_events(url, params={"ids": "2:1,2:2"}))["frames"]
+
+
+def test_stream_events_with_ijson_on_nested_response():
+    import ijson  # listed in requirements.txt; the incremental path must be the one that runs
+    parsed = []
+    basic_parse = ijson.basic_parse
+    ijson.basic_parse = lambda source: parsed.append(source) or basic_parse(source)
+    try:
+        frames = _with_fake_server(_nested_frames, nesting=300)
+    finally:
+        ijson.basic_parse = basic_parse
+    assert len(parsed) == 1
+    assert [frame["id"] for frame in frames] == ["2:1", "2:2"]
+    texts = frames[1]["text_content"]
+    assert texts[:2] == ["Buy coins", "Close"] and len(texts) == 302
+    assert texts[-1] == "2:2 level 299"
+
+
+def test_stream_events_fallback_without_ijson_matches():
+    streamed = _with_fake_server(_nested_frames, nesting=300)
+    saved = sys.modules.get("ijson")
+    sys.modules["ijson"] = None  # import ijson now raises ImportError
+    try:
+        fallback = _with_fake_server(_nested_frames, nesting=300)
+    finally:
+        if saved is None:
+            sys.modules.pop("ijson", None)
+        else:
+            sys.modules["ijson"] = saved
+    assert fallback == streamed
+
+
+def test_get_flows_against_fake_server():
+    tmp = tempfile.mkdtemp()
+    try:
+        def run(service):
+            service.cache_dir = tmp
+            first = service.get_flows(FILE_KEY)
+            calls = len(FakeFigmaHandler.state["requests"])
+            second = service.get_flows(FILE_KEY)
+            return first, second, calls
+        first, second, calls = _with_fake_server(run)
+    finally:
+        shutil.rmtree(tmp)
+
+    frames = first["json_data"]["pages"][0]["frames"]
+    assert [frame["id"] for frame in frames] == ["2:1", "2:2"]
+    assert frames[1]["text_content"] == ["Buy coins", "Close"]
+    assert frames[1]["transitions"] == ["2:1"]
+    assert set(first["images"]) == {"2:1", "2:2"}
+    assert second["json_data"] == first["json_data"]
+    # The cached run needs only the version check and the image URLs
+    paths = [r["path"] for r in FakeFigmaHandler.state["requests"][calls:]]
+    assert paths == [f"/v1/files/{FILE_KEY}", f"/v1/images/{FILE_KEY}"], paths
+
+
+if __name__ == "__main__":
+    test_requests_reuse_pooled_connections()
+    test_rate_limit_waits_for_retry_after_without_splitting()
+    test_long_retry_after_gives_up_without_splitting()
+    test_bad_node_id_splits_batch_and_keeps_the_rest()
+    test_outage_retries_without_splitting()
+    test_stream_events_with_ijson_on_nested_response()
+    test_stream_events_fallback_without_ijson_matches()
+    test_get_flows_against_fake_server()
+    print("All Figma service tests passed.")
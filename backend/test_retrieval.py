@@ -0,0 +1,27 @@
+"""
+Section chunking keeps every character of a spec, including single lines longer than a
+chunk (PDF pages extracted without line breaks), which used to be cut at max_chars.
+"""
+import re
+
+from app.services.retrieval import chunk_document
+
+
+def _chars(text):
+    return re.sub(r"\s", "", text)
+
+
+def test_long_lines_are_split_not_truncated():
+    long_line = " ".join(f"word{i}" for i in range(800))
+    content = "## Overview\nShort intro.\n" + long_line + "\nClosing line.\n\n## Rewards\n" + long_line[:2000]
+    assert len(content) > 5000
+
+    chunks = chunk_document("spec.pdf", content, max_chars=1500)
+    assert all(len(chunk["text"]) <= 1500 for chunk in chunks)
+    assert _chars("".join(chunk["text"] for chunk in chunks)) == _chars(content)
+    assert [chunk["section"] for chunk in chunks if "Closing line." in chunk["text"]] == ["Overview"]
+
+
+if __name__ == "__main__":
+    test_long_lines_are_split_not_truncated()
+    print("All retrieval tests passed.")
@@ -0,0 +1,66 @@
+"""
+Structured field tables on a spec shaped like Friends V2.1 (no LLM call).
+A popup name under a bare "Pop up priority" heading is not a priority, and a lookup is only
+answered from the tables when they cover every line of the spec that mentions the field.
+"""
+import shutil
+import tempfile
+
+from app.services.spec_fields import SpecFieldStore, extract_fields
+
+FRIENDS = """Bulk add flow
+4. CTA : Add back
+Pop up priority
+Bulk add popup
+Mock Link Mock Link [CTA disabled]
+
+Play now popup
+5. CTA : Challenge
+Pop up priority
+P1
+
+Remove friends functionality
+1. This will have remove friend CTA
+
+Tracking requirement
+Tracking Link line numbers 782 to 794
+"""
+LOGIN = """Login screen
+1. Primary CTA : Continue with Google
+Tracking requirement
+Trackings are added in the sheet from row 833-835
+"""
+
+
+def _store(tmp):
+    store = SpecFieldStore(cache_dir=tmp)
+    store.build([{"filename": "Friends V2.1.pdf", "content": FRIENDS},
+                 {"filename": "Login Screen Revamp.pdf", "content": LOGIN}])
+    return store
+
+
+def test_bare_heading_value_must_have_the_field_shape():
+    priorities = [r for r in extract_fields("Friends V2.1.pdf", FRIENDS) if r["field"] == "popup_priority"]
+    assert [(r["line"], r["value"]) for r in priorities] == [(9, "P1")]
+
+
+def test_partial_tables_fall_back_to_the_llm():
+    tmp = tempfile.mkdtemp()
+    try:
+        store = _store(tmp)
+        # "remove friend CTA" is not in the tables, so the two extracted CTAs are not the answer
+        assert store.uncovered["Friends V2.1.pdf"]["cta"] == [13]
+        assert store.answer("What are the CTAs in Friends V2.1?") is None
+        assert store.answer("List all CTAs") is None
+
+        answer = store.answer("What are the CTAs in Login Screen Revamp?")
+        assert "Continue with Google" in answer and "Add back" not in answer
+        assert "782 to 794" in store.answer("Show the tracking events in Friends V2.1")
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    test_bare_heading_value_must_have_the_field_shape()
+    test_partial_tables_fall_back_to_the_llm()
+    print("All spec field tests passed.")
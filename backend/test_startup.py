@@ -0,0 +1,81 @@
+"""
+Startup budget: importing the app must stay cheap so cold starts answer quickly.
+Heavy SDKs and parsers (anthropic, google.generativeai, pandas, numpy, python-pptx, ...)
+are imported inside the functions that use them (anthropic alone adds about a second to
+startup); these checks fail if one of them creeps back into module load.
+"""
+import os
+import re
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+# Measured around 0.5s for the import and 0.6s to the first response; budgets leave room for slow machines
+IMPORT_BUDGET_MS = 1500
+LAUNCH_BUDGET_SECONDS = 2.5
+LAZY_MODULES = ("anthropic", "google.generativeai", "pandas", "numpy", "pptx", "pypdf", "docx")
+
+_IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s+)(\S+)$")
+
+
+def _importtime():
+    """{module: cumulative microseconds} from `python -X importtime -c "import main"`."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=BACKEND_DIR, capture_output=True, text=True, timeout=60,
+    )
+    assert proc.returncode == 0, proc.stderr[-2000:]
+    timings = {}
+    for line in proc.stderr.splitlines():
+        match = _IMPORTTIME_RE.match(line)
+        if match:
+            timings[match.group(4)] = int(match.group(2))
+    return timings
+
+
+def test_heavy_modules_are_not_imported_at_startup():
+    timings = _importtime()
+    loaded = [name for name in timings if name.split(".")[0] in LAZY_MODULES or name in LAZY_MODULES]
+    assert not loaded, f"imported at startup: {sorted(set(name.split('.')[0] for name in loaded))}"
+
+
+def test_import_time_budget():
+    cumulative_ms = _importtime()["main"] / 1000
+    assert cumulative_ms < IMPORT_BUDGET_MS, f"import main took {cumulative_ms:.0f}ms"
+
+
+def test_api_key_status_answers_soon_after_launch():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port)],
+        cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while True:
+            elapsed = time.perf_counter() - start
+            assert elapsed < LAUNCH_BUDGET_SECONDS, f"no answer {elapsed:.2f}s after launch"
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/api/api-key-status", timeout=1) as response:
+                    assert response.status == 200
+                break
+            except OSError:
+                time.sleep(0.02)
+        print(f"/api/api-key-status answered {elapsed:.2f}s after launch")
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+
+if __name__ == "__main__":
+    test_heavy_modules_are_not_imported_at_startup()
+    test_import_time_budget()
+    test_api_key_status_answers_soon_after_launch()
+    print("All startup tests passed.")
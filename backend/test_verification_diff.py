@@ -0,0 +1,118 @@
+"""
+Diff-aware re-verification with a fake model (no Gemini call).
+A spec is verified in full, saved as a baseline, edited in one section and verified again:
+only the edited section may reach the model, findings on the other sections are carried over,
+and the edited section is reported as changed, not removed.
+"""
+import json
+import os
+import re
+import shutil
+import tempfile
+
+from app.services.history_store import HistoryStore
+from app.services.verification_diff import VerificationBaselines, diff_sections, section_fingerprints
+from app.services.verifier import SpecVerifier
+
+SPEC = """## Overview
+Bonus puzzles unlock after the daily brain hunt. Players progress through five orb tiers and each solved
+puzzle fills one orb. The orb tracker sits on the game modes card and resets at day change.
+
+## Rewards
+Tier three grants double coins and tier five grants a gem chest. Rewards are claimed from the summary popup
+and are doubled for players with an active season pass.
+
+## Edge Cases
+If the player disconnects mid puzzle the attempt is kept. Puzzles expire at day change and an expired
+puzzle shows the home screen with a toast explaining the reset.
+
+## Tracking requirement
+Events for card viewed, tier started, tier completed and rewards claimed, with the tier number and the
+time spent on each puzzle.
+"""
+EDITED_REWARDS = """## Rewards
+Tier three grants triple coins and tier five grants a legendary chest. Rewards are claimed from the summary
+popup; season pass holders get an extra spin."""
+
+
+class FakeModel:
+    """Reports one gap per "## " section in the prompt, quoting its first body line."""
+
+    def __init__(self):
+        self.prompts = []
+
+    def generate_content(self, prompt, generation_config=None):
+        self.prompts.append(prompt)
+        gaps = [{"section": title, "description": f"{title} needs detail on: {body.strip()[:60]}", "impact": "Low"}
+                for title, body in re.findall(r"^## (.+)\n(.+)$", prompt, re.MULTILINE)]
+        text = json.dumps({"gaps": gaps, "threats": [], "format_issues": [], "questions": [], "summary": "Reviewed."})
+        return type("Response", (), {"text": text})()
+
+
+def _verify_edit(edited_spec):
+    tmp = tempfile.mkdtemp()
+    try:
+        baselines = VerificationBaselines(HistoryStore(os.path.join(tmp, "history.db"), legacy_dir=None))
+        verifier = SpecVerifier()
+        verifier.model = FakeModel()
+
+        first = verifier.verify_spec(SPEC, "bonus.md", existing_docs=[], per_dimension=False)
+        baselines.save("bonus.md", section_fingerprints(SPEC), "corpus", "verifier", first)
+        verifier.model.prompts.clear()
+
+        sections = section_fingerprints(edited_spec)
+        baseline = baselines.find("bonus.md", sections, "corpus", "verifier")
+        assert baseline is not None
+        second = verifier.verify_spec(edited_spec, "bonus.md", existing_docs=[], per_dimension=False, baseline=baseline)
+        return first, second, verifier.model.prompts
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def test_one_section_edit_reverifies_only_that_section():
+    edited = SPEC.replace(SPEC.split("## Rewards")[1].split("## Edge Cases")[0], EDITED_REWARDS[len("## Rewards"):] + "\n\n")
+    first, second, prompts = _verify_edit(edited)
+
+    # Only the edited section's text is sent; the others appear by title in the outline only
+    assert len(prompts) == 1
+    assert "triple coins" in prompts[0]
+    for unchanged_text in ("orb tracker", "disconnects mid puzzle", "time spent on each puzzle"):
+        assert unchanged_text not in prompts[0], unchanged_text
+
+    gaps = {gap["section"]: gap["description"] for gap in second["gaps"]}
+    # Findings on unchanged sections carried over as they were, the edited section re-reviewed
+    for title in ("Overview", "Edge Cases", "Tracking requirement"):
+        assert gaps[title] == next(g["description"] for g in first["gaps"] if g["section"] == title)
+    assert "triple coins" in gaps["Rewards"]
+    assert len(second["gaps"]) == 4
+
+    assert second["diff"]["changed_sections"] == ["Rewards"]
+    assert second["diff"]["removed_sections"] == []
+    assert second["diff"]["carried_over"] == 3
+
+
+def test_removed_section_is_reported_removed():
+    edited = SPEC.split("## Edge Cases")[0] + "## Tracking requirement" + SPEC.split("## Tracking requirement")[1]
+    _, second, prompts = _verify_edit(edited)
+    assert prompts == []
+    assert second["diff"]["changed_sections"] == []
+    assert second["diff"]["removed_sections"] == ["Edge Cases"]
+    assert "Edge Cases" not in {gap["section"] for gap in second["gaps"]}
+
+
+def test_growing_a_short_page_does_not_shift_the_others():
+    # Headerless PDF text: blank lines separate pages, some of them short
+    pages = ["Cover page", "Problem: players churn after day one.", "Flow: home screen, then the lobby.",
+             "Tracking: card viewed, tier completed.", "Changelog: v1 draft."]
+    edited = list(pages)
+    edited[1] = "Problem: players churn after day one. " + "Session length drops right after the daily puzzle. " * 6
+    diff = diff_sections(section_fingerprints("\n\n".join(pages)), section_fingerprints("\n\n".join(edited)))
+    assert [section["text"] for section in diff["changed"]] == [edited[1].strip()]
+    assert diff["removed"] == []
+
+
+if __name__ == "__main__":
+    test_one_section_edit_reverifies_only_that_section()
+    test_removed_section_is_reported_removed()
+    test_growing_a_short_page_does_not_shift_the_others()
+    print("All verification diff tests passed.")